@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Headless batch extraction over a directory or glob of documents.
+
+Writes one JSON object per line to the output file as each document finishes.
+Re-running with the same output file resumes: documents that already have a
+result line are skipped, failed ones are retried. A line cut off by a crash is
+dropped first. A retried document keeps its old error line, so readers should
+take the last record per file.
+
+Example:
+	python batch_extract.py ../data/sroie/SROIE2019/test/img -o outputs/sroie_test.jsonl --workers 4
+	python batch_extract.py receipts/ -o outputs/receipts.jsonl --batch-docs 8   # 8 receipts per LLM request
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import fields
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from src.agent.runner import ProcessOptions, process_document, process_documents, warm_up
+from src.extraction.context import DEFAULT_CONTEXT_TOKENS
+from src.extraction.extractor import set_max_concurrency
+from src.cache.store import ResultCache, cache_from_env
+from src.ingest.backends import backend_names
+from src.ingest.options import PreprocessOptions
+
+SUPPORTED_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg")
+
+_worker_cache: Optional[ResultCache] = None
+
+
+def find_documents(inputs: List[str]) -> List[str]:
+	paths: List[str] = []
+	for item in inputs:
+		if os.path.isdir(item):
+			candidates = [os.path.join(item, name) for name in os.listdir(item)]
+		else:
+			candidates = glob.glob(item, recursive=True)
+		paths.extend(p for p in candidates if os.path.isfile(p) and p.lower().endswith(SUPPORTED_EXTENSIONS))
+	return sorted(set(paths))
+
+
+def load_checkpoint(output_path: str) -> Set[str]:
+	"""Files that already have a successful result line in the output."""
+	done: Set[str] = set()
+	if not os.path.exists(output_path):
+		return done
+	with open(output_path, "r", encoding="utf-8") as fh:
+		for line in fh:
+			try:
+				record = json.loads(line)
+			except ValueError:
+				# A crash can leave a truncated last line; that document is simply redone
+				continue
+			if "result" in record:
+				done.add(record["file"])
+	return done
+
+
+def _drop_partial_line(output_path: str) -> None:
+	"""Truncate the output back to its last complete line (a crash can leave half a record)."""
+	if not os.path.exists(output_path):
+		return
+	with open(output_path, "rb+") as fh:
+		end = fh.seek(0, os.SEEK_END)
+		pos = end
+		while pos > 0:
+			start = max(0, pos - 4096)
+			fh.seek(start)
+			chunk = fh.read(pos - start)
+			newline = chunk.rfind(b"\n")
+			if newline >= 0:
+				pos = start + newline + 1
+				break
+			pos = start
+		if pos < end:
+			fh.truncate(pos)
+
+
+def _init_worker(cache_path: Optional[str], cache_max_mb: int, llm_concurrency: Optional[int], warm: Tuple[str, ...] = ()) -> None:
+	global _worker_cache
+	load_dotenv()
+	if llm_concurrency:
+		# The extractor (imported with the runner) already sized its semaphore from the environment
+		set_max_concurrency(llm_concurrency)
+	_worker_cache = ResultCache(cache_path, max_bytes=cache_max_mb * 1024 * 1024) if cache_path else cache_from_env()
+	if warm:
+		# Pay the OCR/PDF/LLM import (and model load) cost while the pool starts, not on each worker's first document
+		warm_up(warm)
+
+
+def _process_path(path: str, options: Dict[str, Any], requested_fields: Optional[List[str]]) -> Dict[str, Any]:
+	try:
+		with open(path, "rb") as fh:
+			content = fh.read()
+		result = process_document(
+			file_bytes=content,
+			filename=os.path.basename(path),
+			requested_fields=requested_fields,
+			cache=_worker_cache,
+			**options,
+		)
+		return {"file": path, "result": result}
+	except Exception as exc:
+		return {"file": path, "error": f"{type(exc).__name__}: {exc}"}
+
+
+def _process_group(paths: List[str], options: Dict[str, Any], requested_fields: Optional[List[str]], batch_tokens: int) -> List[Dict[str, Any]]:
+	"""Process several documents with shared, multi-document LLM requests."""
+	if len(paths) == 1:
+		return [_process_path(paths[0], options, requested_fields)]
+	documents = []
+	readable: List[str] = []
+	records: List[Dict[str, Any]] = []
+	for path in paths:
+		try:
+			with open(path, "rb") as fh:
+				documents.append((fh.read(), os.path.basename(path)))
+			readable.append(path)
+		except OSError as exc:
+			records.append({"file": path, "error": f"{type(exc).__name__}: {exc}"})
+	try:
+		results = process_documents(documents, requested_fields, ProcessOptions(**options), cache=_worker_cache, max_batch_tokens=batch_tokens, max_batch_docs=len(documents))
+	except Exception as exc:
+		return records + [{"file": path, "error": f"{type(exc).__name__}: {exc}"} for path in readable]
+	for path, result in zip(readable, results):
+		records.append({"file": path, "error": result["error"]} if "error" in result else {"file": path, "result": result})
+	return records
+
+
+def run_batch(paths: List[str], options: ProcessOptions, requested_fields: Optional[List[str]], workers: int, cache_path: Optional[str], cache_max_mb: int, llm_concurrency: Optional[int], batch_docs: int = 1, batch_tokens: int = 6000, warm: Tuple[str, ...] = ()) -> Iterator[Dict[str, Any]]:
+	"""Process documents in worker processes, yielding records as they complete.
+
+	With batch_docs > 1 each worker takes groups of documents and packs them into
+	shared LLM requests (see process_documents).
+	"""
+	# Shallow copy: nested option dataclasses (e.g. PreprocessOptions) are passed through as-is
+	opts = {f.name: getattr(options, f.name) for f in fields(options)}
+	size = max(1, batch_docs)
+	groups = [paths[i:i + size] for i in range(0, len(paths), size)]
+	pending = set()
+	remaining = iter(groups)
+	with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cache_path, cache_max_mb, llm_concurrency, warm)) as pool:
+		# Keep a bounded window of submitted documents so huge batches don't queue everything up front
+		for group in remaining:
+			pending.add(pool.submit(_process_group, group, opts, requested_fields, batch_tokens))
+			if len(pending) >= workers * 2:
+				break
+		while pending:
+			finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+			for future in finished:
+				next_group = next(remaining, None)
+				if next_group is not None:
+					pending.add(pool.submit(_process_group, next_group, opts, requested_fields, batch_tokens))
+				yield from future.result()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+	parser = argparse.ArgumentParser(description="Batch document extraction to JSONL")
+	parser.add_argument("inputs", nargs="+", help="Directories or glob patterns of PDFs/images")
+	parser.add_argument("-o", "--output", required=True, help="Output JSONL file (also the resume checkpoint)")
+	parser.add_argument("--fields", default="", help="Comma-separated fields to extract")
+	parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Documents processed in parallel")
+	parser.add_argument("--ocr-workers", type=int, default=1, help="OCR worker processes per multi-page PDF")
+	parser.add_argument("--llm-concurrency", type=int, default=None, help="Max in-flight LLM requests per worker")
+	parser.add_argument("--batch-docs", type=int, default=1, help="Pack up to N short documents into each LLM request")
+	parser.add_argument("--batch-tokens", type=int, default=6000, help="Prompt token budget per multi-document request")
+	parser.add_argument("--votes", type=int, default=3)
+	parser.add_argument("--temperature", type=float, default=0.2)
+	parser.add_argument("--model", default=os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+	parser.add_argument("--context-tokens", type=int, default=DEFAULT_CONTEXT_TOKENS, help="Prompt token budget for OCR text; 0 sends the full text")
+	parser.add_argument("--dpi", type=int, default=200)
+	parser.add_argument("--max-pages", type=int, default=None, help="Only ingest the first N pages of each document")
+	parser.add_argument("--preprocess", action="store_true", help="Adaptive DPI, rescale, deskew, binarize and crop before OCR")
+	parser.add_argument("--prefill-rules", action="store_true", help="Fill fields with the rule-based extractor; the LLM only gets the rest")
+	parser.add_argument("--tiered", action="store_true", help="Rules first, one LLM call for low-confidence fields, extra votes only on disagreement")
+	parser.add_argument("--extractor", default="llm", choices=["llm", "layoutlm"], help="layoutlm runs the bundled SROIE LayoutLM checkpoint locally (needs torch + transformers)")
+	parser.add_argument("--split-sections", action="store_true", help="Also extract each run of same-type pages of a mixed PDF under \"sections\"")
+	parser.add_argument("--early-exit", action="store_true", help="Stop voting once the majority is settled")
+	parser.add_argument("--ocr-backend", default="auto", choices=["auto"] + backend_names(), help="OCR engine; auto picks the cheapest that can read each document")
+	parser.add_argument("--no-text-layer", action="store_true", help="Always OCR PDF pages")
+	parser.add_argument("--cache", default=None, help="SQLite result cache path (defaults to RESULT_CACHE_PATH)")
+	parser.add_argument("--cache-max-mb", type=int, default=512)
+	parser.add_argument("--warm", action="store_true", help="Preload the OCR, PDF and LLM backends in each worker at start-up")
+	parser.add_argument("--no-resume", action="store_true", help="Overwrite the output instead of resuming")
+	args = parser.parse_args(argv)
+
+	load_dotenv()
+	paths = find_documents(args.inputs)
+	if args.no_resume and os.path.exists(args.output):
+		os.remove(args.output)
+	done = load_checkpoint(args.output)
+	todo = [p for p in paths if p not in done]
+	print(f"{len(paths)} documents found, {len(done)} already done, {len(todo)} to process", file=sys.stderr)
+
+	options = ProcessOptions(
+		num_votes=args.votes,
+		temperature=args.temperature,
+		model=args.model,
+		ocr_workers=args.ocr_workers,
+		use_text_layer=not args.no_text_layer,
+		dpi=args.dpi,
+		early_exit=args.early_exit,
+		max_pages=args.max_pages,
+		preprocess=PreprocessOptions() if args.preprocess else None,
+		ocr_backend=args.ocr_backend,
+		context_tokens=args.context_tokens or None,
+		prefill_rules=args.prefill_rules,
+		tiered=args.tiered,
+		extractor=args.extractor,
+		split_sections=args.split_sections,
+	)
+	requested_fields = [f.strip() for f in args.fields.split(",") if f.strip()] or None
+	warm = (("image", "pdf", "llm") + (("layoutlm",) if args.extractor == "layoutlm" else ())) if args.warm else ()
+
+	if os.path.dirname(args.output):
+		os.makedirs(os.path.dirname(args.output), exist_ok=True)
+	_drop_partial_line(args.output)
+	failures = 0
+	with open(args.output, "a", encoding="utf-8") as out:
+		for count, record in enumerate(run_batch(todo, options, requested_fields, max(1, args.workers), args.cache, args.cache_max_mb, args.llm_concurrency, args.batch_docs, args.batch_tokens, warm), start=1):
+			out.write(json.dumps(record, ensure_ascii=False) + "\n")
+			out.flush()
+			if "error" in record:
+				failures += 1
+				print(f"[{count}/{len(todo)}] {record['file']}: {record['error']}", file=sys.stderr)
+			elif count % 50 == 0 or count == len(todo):
+				print(f"[{count}/{len(todo)}] done", file=sys.stderr)
+	return 1 if failures else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+Throughput / accuracy benchmark over the bundled SROIE dataset.
+
+Runs each pipeline stage (render, OCR, classify, extract, score, validate) on the
+SROIE images, reports per-stage latency percentiles, docs/sec, peak RSS and
+field-level accuracy against `entities/`, and compares against a saved baseline.
+
+Examples:
+	python benchmark.py --split test --limit 50 --save-baseline outputs/bench_baseline.json
+	python benchmark.py --split test --limit 50 --baseline outputs/bench_baseline.json
+	python benchmark.py --ocr-backend precomputed   # skip OCR, read SROIE box/ files
+	python benchmark.py --context-tokens 300 --compare-context   # prompt slimming vs. full text
+	python benchmark.py --llm-base-url http://127.0.0.1:8000/v1   # local OpenAI-compatible server
+	python benchmark.py --extractor layoutlm --limit 100   # local LayoutLM instead of the LLM/demo extractor
+	python benchmark.py --cold-start   # import + first-document time in fresh processes, per input type
+	python benchmark.py --classify --split train   # doc type classifier throughput on the SROIE box text
+	python benchmark.py --validate --repeats 20   # per-document validation time, rule engine vs. the old path
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from src.agent.runner import process_document
+from src.extraction.context import DEFAULT_CONTEXT_TOKENS
+from src.ingest.backends import PrecomputedBackend, backend_names, register_backend
+from src.ingest.options import PreprocessOptions
+from src.utils.tracing import Tracer
+from src.validation.validators import parse_amount
+
+try:
+	import resource
+except ImportError:  # Windows
+	resource = None
+
+SROIE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "sroie", "SROIE2019")
+# Trace span names reported as stages
+STAGES = ["ingest", "render", "text_layer", "ocr", "render_ocr_parallel", "classify", "context", "rules", "extract", "llm_vote", "layoutlm", "score", "validate"]
+# SROIE entity -> pipeline field name
+ENTITY_FIELDS = {"company": "VendorName", "date": "Date", "address": "Address", "total": "TotalAmount"}
+
+
+def percentile(values: List[float], pct: float) -> float:
+	if not values:
+		return 0.0
+	ordered = sorted(values)
+	# Nearest-rank percentile
+	rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+	return ordered[rank]
+
+
+def peak_rss_mb() -> Optional[float]:
+	if resource is None:
+		return None
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# ru_maxrss is KB on Linux, bytes on macOS
+	return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+
+
+def load_samples(split: str, limit: Optional[int]) -> List[Dict[str, Any]]:
+	img_dir = os.path.join(SROIE_ROOT, split, "img")
+	ent_dir = os.path.join(SROIE_ROOT, split, "entities")
+	samples = []
+	for name in sorted(os.listdir(img_dir)):
+		stem = os.path.splitext(name)[0]
+		entities: Dict[str, str] = {}
+		ent_path = os.path.join(ent_dir, stem + ".txt")
+		if os.path.exists(ent_path):
+			try:
+				with open(ent_path, "r", encoding="utf-8") as fh:
+					entities = json.load(fh)
+			except ValueError:
+				entities = {}
+		samples.append({"id": stem, "path": os.path.join(img_dir, name), "entities": entities})
+		if limit and len(samples) >= limit:
+			break
+	return samples
+
+
+def _norm(text: str) -> str:
+	return " ".join(str(text or "").lower().split())
+
+
+def field_matches(field: str, predicted: str, expected: str) -> bool:
+	if field == "TotalAmount":
+		return parse_amount(predicted) > 0.0 and abs(parse_amount(predicted) - parse_amount(expected)) < 0.01
+	return _norm(predicted) == _norm(expected)
+
+
+def run_benchmark(samples: List[Dict[str, Any]], num_votes: int, temperature: float, model: str, preprocess: Optional[PreprocessOptions] = None, ocr_backend: str = "auto", context_tokens: Optional[int] = DEFAULT_CONTEXT_TOKENS, prefill_rules: bool = False, tiered: bool = False, extractor: str = "llm") -> Dict[str, Any]:
+	latencies: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+	correct = {field: 0 for field in ENTITY_FIELDS.values()}
+	labelled = {field: 0 for field in ENTITY_FIELDS.values()}
+	requested_fields = list(ENTITY_FIELDS.values())
+	errors = 0
+	# OCR text tokens vs. tokens actually sent to the extractor (per vote)
+	tokens = {"input": 0, "context": 0}
+	llm_calls = 0
+
+	started = time.perf_counter()
+	for sample in samples:
+		try:
+			with open(sample["path"], "rb") as fh:
+				content = fh.read()
+			tracer = Tracer()
+			result = process_document(
+				file_bytes=content,
+				filename=os.path.basename(sample["path"]),
+				requested_fields=requested_fields,
+				num_votes=num_votes,
+				temperature=temperature,
+				model=model,
+				preprocess=preprocess,
+				ocr_backend=ocr_backend,
+				context_tokens=context_tokens,
+				prefill_rules=prefill_rules,
+				tiered=tiered,
+				extractor=extractor,
+				tracer=tracer,
+			)
+		except Exception as exc:
+			errors += 1
+			print(f"{sample['id']}: {type(exc).__name__}: {exc}", file=sys.stderr)
+			continue
+
+		# Per-document stage latency is the sum of that stage's spans (e.g. several pages)
+		per_stage: Dict[str, float] = {}
+		for span in result["timings"]["spans"]:
+			if span["name"] in STAGES:
+				per_stage[span["name"]] = per_stage.get(span["name"], 0.0) + span["duration_ms"]
+			if span["name"] == "llm_vote":
+				llm_calls += 1
+			if span["name"] == "context":
+				tokens["input"] += span["input_tokens"]
+				tokens["context"] += span["context_tokens"]
+		for stage, ms in per_stage.items():
+			latencies[stage].append(ms)
+
+		final = {f["name"]: f["value"] for f in result["fields"]}
+		for entity, field in ENTITY_FIELDS.items():
+			if entity in sample["entities"]:
+				labelled[field] += 1
+				if field_matches(field, final.get(field, ""), sample["entities"][entity]):
+					correct[field] += 1
+	elapsed = time.perf_counter() - started
+
+	processed = len(samples) - errors
+	return {
+		"docs": processed,
+		"errors": errors,
+		"docs_per_sec": processed / elapsed if elapsed > 0 else 0.0,
+		"peak_rss_mb": peak_rss_mb(),
+		"latency_ms": {
+			stage: {"p50": percentile(vals, 50), "p90": percentile(vals, 90), "p99": percentile(vals, 99), "total": sum(vals)}
+			for stage, vals in latencies.items() if vals
+		},
+		"accuracy": {field: (correct[field] / labelled[field] if labelled[field] else 0.0) for field in correct},
+		"llm_calls_per_doc": llm_calls / processed if processed else 0.0,
+		"prompt_tokens": {**tokens, "reduction": 1.0 - tokens["context"] / tokens["input"] if tokens["input"] else 0.0},
+	}
+
+
+# Runs in a fresh interpreter: time to import the runner, then to finish the first document
+_COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from src.agent.runner import process_document
+imported = time.perf_counter()
+path, backend = sys.argv[1], sys.argv[2]
+if path:
+	with open(path, "rb") as fh:
+		content = fh.read()
+	process_document(content, path, None, num_votes=1, temperature=0.0, model="demo", ocr_backend=backend)
+done = time.perf_counter()
+heavy = [m for m in ("fitz", "pytesseract", "PIL.Image", "numpy", "openai", "httpx", "tenacity", "pydantic", "rapidfuzz") if m in sys.modules]
+print(json.dumps({"import_ms": (imported - start) * 1000.0, "first_doc_ms": (done - imported) * 1000.0, "modules": heavy}))
+"""
+# Input types measured by --cold-start, cheapest first
+COLD_START_KINDS = ["import", "precomputed", "pdf_text", "image"]
+
+
+def _cold_start_inputs(workdir: str) -> Dict[str, Any]:
+	"""Synthetic (path, backend) per input type; types whose sample cannot be built here are left out."""
+	inputs: Dict[str, Any] = {"import": ("", "auto")}
+	image = None
+	try:
+		from PIL import Image, ImageDraw
+
+		image = os.path.join(workdir, "receipt.png")
+		canvas = Image.new("RGB", (600, 200), "white")
+		ImageDraw.Draw(canvas).text((20, 20), "ACME TRADING\nINVOICE NO: INV-001\nTOTAL 9.00", fill="black")
+		canvas.save(image)
+	except ImportError:
+		pass
+	if image:
+		inputs["image"] = (image, "tesseract")
+		stem = os.path.splitext(os.path.basename(image))[0]
+		with open(os.path.join(workdir, stem + ".txt"), "w", encoding="utf-8") as fh:
+			fh.write("20,20,200,20,200,40,20,40,ACME TRADING\n20,60,200,60,200,80,20,80,TOTAL 9.00\n")
+		inputs["precomputed"] = (image, "precomputed")
+	try:
+		import fitz  # PyMuPDF
+
+		pdf = os.path.join(workdir, "invoice.pdf")
+		with fitz.open() as doc:
+			doc.new_page().insert_text((72, 72), "ACME TRADING\nInvoice No: INV-001\nTOTAL 9.00")
+			doc.save(pdf)
+		inputs["pdf_text"] = (pdf, "text_layer")
+	except ImportError:
+		pass
+	return inputs
+
+
+def run_cold_start(repeats: int) -> Dict[str, Any]:
+	"""Median import and first-document time of process_document in fresh processes (demo extractor)."""
+	here = os.path.dirname(os.path.abspath(__file__))
+	report: Dict[str, Any] = {}
+	with tempfile.TemporaryDirectory() as workdir:
+		inputs = _cold_start_inputs(workdir)
+		env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+		env["PRECOMPUTED_OCR_DIRS"] = workdir
+		for kind in COLD_START_KINDS:
+			if kind not in inputs:
+				continue
+			path, backend = inputs[kind]
+			runs = []
+			for _ in range(max(1, repeats)):
+				proc = subprocess.run([sys.executable, "-c", _COLD_START_SCRIPT, path, backend], cwd=here, env=env, capture_output=True, text=True)
+				if proc.returncode != 0:
+					print(f"cold start {kind}: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}", file=sys.stderr)
+					break
+				runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+			if runs:
+				report[kind] = {
+					"import_ms": percentile([r["import_ms"] for r in runs], 50),
+					"first_doc_ms": percentile([r["first_doc_ms"] for r in runs], 50),
+					"modules": runs[-1]["modules"],
+				}
+	return report
+
+
+def print_cold_start(report: Dict[str, Any]) -> None:
+	print(f"{'input':<12}{'import ms':>10}{'1st doc ms':>12}  heavy modules loaded")
+	for kind, row in report.items():
+		print(f"{kind:<12}{row['import_ms']:>10.1f}{row['first_doc_ms']:>12.1f}  {', '.join(row['modules']) or '-'}")
+
+
+def load_box_texts(split: str, limit: Optional[int]) -> Dict[str, str]:
+	"""OCR text of the split's box/ files by document id."""
+	from src.ingest.backends import parse_box_line
+
+	box_dir = os.path.join(SROIE_ROOT, split, "box")
+	texts: Dict[str, str] = {}
+	for name in sorted(os.listdir(box_dir)) if os.path.isdir(box_dir) else []:
+		with open(os.path.join(box_dir, name), "r", encoding="utf-8", errors="replace") as fh:
+			lines = [parsed[1] for parsed in map(parse_box_line, fh) if parsed]
+		if lines:
+			texts[os.path.splitext(name)[0]] = "\n".join(lines)
+		if limit and len(texts) >= limit:
+			break
+	return texts
+
+
+def run_classifier_benchmark(split: str, limit: Optional[int], repeats: int) -> Dict[str, Any]:
+	"""Classifier throughput over the split's box/ text; every SROIE document is a receipt (invoice)."""
+	from src.routing.classifier import get_classifier
+
+	texts = list(load_box_texts(split, limit).values())
+	classifier = get_classifier()
+	counts: Dict[str, int] = {}
+	for text in texts:
+		doc_type = classifier.classify(text)
+		counts[doc_type] = counts.get(doc_type, 0) + 1
+	started = time.perf_counter()
+	for _ in range(max(1, repeats)):
+		for text in texts:
+			classifier.classify(text)
+	elapsed = time.perf_counter() - started
+	total = len(texts) * max(1, repeats)
+	return {
+		"docs": len(texts),
+		"docs_per_sec": total / elapsed if elapsed > 0 else 0.0,
+		"mb_per_sec": sum(len(t) for t in texts) * max(1, repeats) / (1024.0 * 1024.0) / elapsed if elapsed > 0 else 0.0,
+		"doc_types": counts,
+		"accuracy": counts.get("invoice", 0) / len(texts) if texts else 0.0,
+	}
+
+
+def _legacy_validate(text: str, fields: Dict[str, str]) -> None:
+	"""The validation path before the rule engine (strptime per format, findall + re-parse), as the speed reference."""
+	import re
+	from datetime import datetime
+
+	amount_re = re.compile(r"[\$₹]?\s?([0-9]{1,3}(?:,[0-9]{3})*|[0-9]+)(?:\.[0-9]{1,2})?")
+	date_res = [re.compile(r"\b(\d{4})[-/](\d{1,2})[-/](\d{1,2})\b"), re.compile(r"\b(\d{1,2})[-/](\d{1,2})[-/](\d{2,4})\b")]
+
+	def parse_amount(value: str) -> float:
+		match = amount_re.search(value or "")
+		if not match:
+			return 0.0
+		try:
+			return float(match.group(0).replace("₹", "").replace("$", "").replace(",", "").strip())
+		except Exception:
+			return 0.0
+
+	def is_valid_date(value: str) -> bool:
+		for fmt in ["%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y", "%d/%m/%Y", "%m-%d-%Y", "%m/%d/%Y", "%d-%m-%y", "%m-%d-%y", "%d/%m/%y", "%m/%d/%y"]:
+			try:
+				datetime.strptime(value.strip(), fmt)
+				return True
+			except Exception:
+				continue
+		for rx in date_res:
+			m = rx.search(value)
+			if m:
+				for fmt in ["%Y-%m-%d", "%d-%m-%Y", "%m-%d-%Y", "%d-%m-%y", "%m-%d-%y"]:
+					try:
+						datetime.strptime("-".join(m.groups()), fmt)
+						return True
+					except Exception:
+						continue
+		return False
+
+	for name, value in fields.items():
+		fname = name.lower()
+		if any(k in fname for k in ["date", "issued", "invoice date"]):
+			is_valid_date(value)
+		elif any(k in fname for k in ["amount", "total", "subtotal", "tax", "balance"]):
+			parse_amount(value)
+	total = parse_amount(str(fields.get("TotalAmount")))
+	subtotal = parse_amount(str(fields.get("Subtotal")))
+	tax = parse_amount(str(fields.get("Tax")))
+	if total and subtotal > 0.0:
+		abs((subtotal + tax) - total)
+	elif total:
+		amounts = sorted((a for a in (parse_amount(m) for m in re.findall(amount_re, text)) if 0.0 < a <= total), reverse=True)
+		abs(sum(amounts[:3]) - total)
+
+
+def run_validation_benchmark(split: str, limit: Optional[int], repeats: int) -> Dict[str, Any]:
+	"""Per-document field + document validation time over the split's box/ text and entities, against the pre-engine path."""
+	from src.validation.validators import field_level_validations, parse_date, validate_document
+
+	docs = []
+	for doc_id, text in load_box_texts(split, limit).items():
+		entities: Dict[str, str] = {}
+		ent_path = os.path.join(SROIE_ROOT, split, "entities", doc_id + ".txt")
+		if os.path.exists(ent_path):
+			try:
+				with open(ent_path, "r", encoding="utf-8") as fh:
+					entities = json.load(fh)
+			except ValueError:
+				entities = {}
+		docs.append((text, {ENTITY_FIELDS[k]: str(v) for k, v in entities.items() if k in ENTITY_FIELDS}))
+
+	def engine(text: str, fields: Dict[str, str]) -> None:
+		for name, value in fields.items():
+			field_level_validations(name, value)
+		validate_document("invoice", text, fields)
+
+	timings: Dict[str, float] = {}
+	for label, validate in (("legacy", _legacy_validate), ("engine", engine)):
+		started = time.perf_counter()
+		for _ in range(max(1, repeats)):
+			# Dates repeat across passes; the engine's per-value cache should not hide the parse cost
+			parse_date.cache_clear()
+			for text, fields in docs:
+				validate(text, fields)
+		timings[label] = (time.perf_counter() - started) * 1e6 / max(1, len(docs) * max(1, repeats))
+	return {
+		"docs": len(docs),
+		"legacy_us_per_doc": timings["legacy"],
+		"engine_us_per_doc": timings["engine"],
+		"speedup": timings["legacy"] / timings["engine"] if timings["engine"] > 0 else 0.0,
+		"valid_dates": sum(1 for _, fields in docs if fields.get("Date") and field_level_validations("Date", fields["Date"])),
+	}
+
+
+def print_preprocess_delta(plain: Dict[str, Any], processed: Dict[str, Any]) -> None:
+	"""Summarize OCR time saved and accuracy change from image preprocessing."""
+	def ocr_total(report: Dict[str, Any]) -> float:
+		return sum(report["latency_ms"].get(stage, {}).get("total", 0.0) for stage in ("render", "ocr", "render_ocr_parallel"))
+
+	before, after = ocr_total(plain), ocr_total(processed)
+	saved = before - after
+	print(f"render+OCR time: {before:.0f} ms -> {after:.0f} ms ({saved:+.0f} ms saved, {100.0 * saved / before if before else 0.0:.1f}%)")
+	for field, acc in plain["accuracy"].items():
+		print(f"accuracy {field:<12} {acc:.3f} -> {processed['accuracy'][field]:.3f} ({processed['accuracy'][field] - acc:+.3f})")
+
+
+def print_context_delta(full: Dict[str, Any], slim: Dict[str, Any]) -> None:
+	"""Summarize prompt tokens saved and accuracy change from context selection."""
+	tokens = slim["prompt_tokens"]
+	print(f"prompt tokens: {tokens['input']} -> {tokens['context']} ({100.0 * tokens['reduction']:.1f}% fewer per vote)")
+	for field, acc in full["accuracy"].items():
+		print(f"accuracy {field:<12} {acc:.3f} -> {slim['accuracy'][field]:.3f} ({slim['accuracy'][field] - acc:+.3f})")
+
+
+def compare_to_baseline(report: Dict[str, Any], baseline: Dict[str, Any], speed_tolerance: float, accuracy_tolerance: float) -> List[str]:
+	"""Return a list of regressions; empty when the run is within tolerance."""
+	problems = []
+	if report["docs_per_sec"] < baseline["docs_per_sec"] * (1.0 - speed_tolerance):
+		problems.append(f"throughput {report['docs_per_sec']:.2f} docs/s < baseline {baseline['docs_per_sec']:.2f} docs/s")
+	for field, base_acc in baseline.get("accuracy", {}).items():
+		acc = report["accuracy"].get(field, 0.0)
+		if acc < base_acc - accuracy_tolerance:
+			problems.append(f"{field} accuracy {acc:.3f} < baseline {base_acc:.3f}")
+	return problems
+
+
+def print_report(report: Dict[str, Any]) -> None:
+	rss = f"{report['peak_rss_mb']:.0f} MB" if report["peak_rss_mb"] is not None else "n/a"
+	print(f"docs: {report['docs']} (errors: {report['errors']})  throughput: {report['docs_per_sec']:.2f} docs/s  peak RSS: {rss}")
+	print(f"{'stage':<10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+	for stage, pct in report["latency_ms"].items():
+		print(f"{stage:<10}{pct['p50']:>10.1f}{pct['p90']:>10.1f}{pct['p99']:>10.1f}")
+	for field, acc in report["accuracy"].items():
+		print(f"accuracy {field:<12} {acc:.3f}")
+	if report.get("llm_calls_per_doc"):
+		print(f"LLM calls per document: {report['llm_calls_per_doc']:.2f}")
+	tokens = report.get("prompt_tokens")
+	if tokens and tokens["input"]:
+		print(f"prompt tokens {tokens['context']} of {tokens['input']} ({100.0 * tokens['reduction']:.1f}% reduction)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+	parser = argparse.ArgumentParser(description="SROIE throughput/accuracy benchmark")
+	parser.add_argument("--split", default="test", choices=["train", "test"])
+	parser.add_argument("--limit", type=int, default=None)
+	parser.add_argument("--votes", type=int, default=1)
+	parser.add_argument("--temperature", type=float, default=0.0)
+	parser.add_argument("--model", default=os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+	parser.add_argument("--llm-base-url", default=None, help="OpenAI-compatible local server; demo extractor is used otherwise")
+	parser.add_argument("--preprocess", action="store_true", help="Run with image preprocessing (adaptive DPI, rescale, deskew, binarize, crop)")
+	parser.add_argument("--compare-preprocess", action="store_true", help="Run with and without preprocessing and report the difference")
+	parser.add_argument("--ocr-backend", default="tesseract", choices=["auto"] + backend_names(), help="precomputed reads the split's box/ files instead of running OCR")
+	parser.add_argument("--context-tokens", type=int, default=DEFAULT_CONTEXT_TOKENS, help="Prompt token budget for OCR text; 0 sends the full text")
+	parser.add_argument("--compare-context", action="store_true", help="Also run with the full OCR text and report tokens saved and accuracy change")
+	parser.add_argument("--prefill-rules", action="store_true", help="Fill fields with the rule-based extractor before the LLM")
+	parser.add_argument("--tiered", action="store_true", help="Rules first, LLM only for low-confidence fields, extra votes only on disagreement")
+	parser.add_argument("--extractor", default="llm", choices=["llm", "layoutlm"], help="layoutlm: bundled LayoutLM checkpoint on CPU (LAYOUTLM_QUANTIZE / LAYOUTLM_THREADS apply)")
+	parser.add_argument("--baseline", default=None, help="Compare against this baseline JSON and fail on regressions")
+	parser.add_argument("--save-baseline", default=None, help="Write this run's report as a baseline")
+	parser.add_argument("--speed-tolerance", type=float, default=0.2, help="Allowed fractional drop in docs/sec")
+	parser.add_argument("--accuracy-tolerance", type=float, default=0.01, help="Allowed absolute drop in field accuracy")
+	parser.add_argument("--json", default=None, help="Write the full report to this path")
+	parser.add_argument("--cold-start", action="store_true", help="Only measure import + first-document time in fresh processes, per input type")
+	parser.add_argument("--repeats", type=int, default=5, help="Fresh processes per input type for --cold-start, passes over the corpus for --classify / --validate")
+	parser.add_argument("--classify", action="store_true", help="Only measure doc type classification over the split's box/ text")
+	parser.add_argument("--validate", action="store_true", help="Only measure per-document validation over the split's box/ text and entities")
+	args = parser.parse_args(argv)
+
+	if args.classify:
+		report = run_classifier_benchmark(args.split, args.limit, args.repeats)
+		print(f"docs: {report['docs']}  throughput: {report['docs_per_sec']:.0f} docs/s ({report['mb_per_sec']:.1f} MB/s)  accuracy (invoice): {report['accuracy']:.3f}")
+		print("doc types: " + ", ".join(f"{k}={v}" for k, v in sorted(report["doc_types"].items())))
+		return 0
+
+	if args.validate:
+		report = run_validation_benchmark(args.split, args.limit, args.repeats)
+		print(f"docs: {report['docs']}  validation: {report['legacy_us_per_doc']:.1f} us/doc -> {report['engine_us_per_doc']:.1f} us/doc ({report['speedup']:.1f}x)  valid dates: {report['valid_dates']}")
+		return 0
+
+	if args.cold_start:
+		report = run_cold_start(args.repeats)
+		print_cold_start(report)
+		if args.json:
+			if os.path.dirname(args.json):
+				os.makedirs(os.path.dirname(args.json), exist_ok=True)
+			with open(args.json, "w", encoding="utf-8") as fh:
+				json.dump(report, fh, indent=2)
+		return 0
+
+	if args.llm_base_url:
+		os.environ["OPENAI_BASE_URL"] = args.llm_base_url
+		os.environ.setdefault("OPENAI_API_KEY", "local")
+	else:
+		# Demo extractor: keeps the benchmark offline and deterministic
+		os.environ.pop("OPENAI_API_KEY", None)
+
+	# The split's own box files, so --ocr-backend precomputed benchmarks everything after OCR
+	register_backend("precomputed", lambda: PrecomputedBackend([os.path.join(SROIE_ROOT, args.split, "box")]))
+	samples = load_samples(args.split, args.limit)
+	preprocess = PreprocessOptions() if args.preprocess or args.compare_preprocess else None
+	context_tokens = args.context_tokens or None
+	report = run_benchmark(samples, num_votes=args.votes, temperature=args.temperature, model=args.model, preprocess=preprocess, ocr_backend=args.ocr_backend, context_tokens=context_tokens, prefill_rules=args.prefill_rules, tiered=args.tiered, extractor=args.extractor)
+	print_report(report)
+	if args.compare_preprocess:
+		print("\nWithout preprocessing:")
+		plain = run_benchmark(samples, num_votes=args.votes, temperature=args.temperature, model=args.model, ocr_backend=args.ocr_backend, context_tokens=context_tokens, prefill_rules=args.prefill_rules, tiered=args.tiered, extractor=args.extractor)
+		print_report(plain)
+		print()
+		print_preprocess_delta(plain, report)
+	if args.compare_context and context_tokens:
+		print("\nWith the full OCR text:")
+		full = run_benchmark(samples, num_votes=args.votes, temperature=args.temperature, model=args.model, preprocess=preprocess, ocr_backend=args.ocr_backend, context_tokens=None, prefill_rules=args.prefill_rules, tiered=args.tiered, extractor=args.extractor)
+		print_report(full)
+		print()
+		print_context_delta(full, report)
+
+	for path in (args.json, args.save_baseline):
+		if path:
+			if os.path.dirname(path):
+				os.makedirs(os.path.dirname(path), exist_ok=True)
+			with open(path, "w", encoding="utf-8") as fh:
+				json.dump(report, fh, indent=2)
+
+	if args.baseline:
+		with open(args.baseline, "r", encoding="utf-8") as fh:
+			baseline = json.load(fh)
+		problems = compare_to_baseline(report, baseline, args.speed_tolerance, args.accuracy_tolerance)
+		for problem in problems:
+			print(f"REGRESSION: {problem}", file=sys.stderr)
+		if problems:
+			return 1
+		print("No regressions against baseline")
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
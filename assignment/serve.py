@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Asynchronous extraction service: submit documents over HTTP, poll or stream results.
+
+Example:
+	python serve.py --port 8080 --cpu-workers 4 --llm-workers 8
+	curl -X POST --data-binary @receipt.jpg "http://127.0.0.1:8080/jobs?filename=receipt.jpg&fields=TotalAmount,Date"
+	curl http://127.0.0.1:8080/jobs/<id>/events
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from src.agent.runner import EXTRACTORS, ProcessOptions
+from src.cache.store import cache_from_env
+from src.extraction.context import DEFAULT_CONTEXT_TOKENS
+from src.ingest.backends import backend_names
+from src.ingest.options import PreprocessOptions
+from src.service.jobs import JobService
+from src.service.server import ExtractionServer, QueryLimits
+
+
+async def run(args: argparse.Namespace) -> None:
+	options = ProcessOptions(
+		num_votes=args.votes,
+		temperature=args.temperature,
+		model=args.model,
+		dpi=args.dpi,
+		max_pages=args.max_pages,
+		preprocess=PreprocessOptions() if args.preprocess else None,
+		ocr_backend=args.ocr_backend,
+		context_tokens=args.context_tokens or None,
+		prefill_rules=args.prefill_rules,
+		tiered=args.tiered,
+		extractor=args.extractor,
+		split_sections=args.split_sections,
+	)
+	service = JobService(cpu_workers=args.cpu_workers, llm_workers=args.llm_workers, queue_size=args.queue_size, cache=cache_from_env(), warm=args.warm)
+	await service.start()
+	limits = QueryLimits(max_votes=args.max_votes, max_dpi=args.max_dpi)
+	server = await ExtractionServer(service, options, max_upload_bytes=args.max_upload_mb * 1024 * 1024, limits=limits).serve(args.host, args.port)
+	print(f"Serving on http://{args.host}:{args.port} ({args.cpu_workers} CPU workers, {args.llm_workers} LLM workers, queue {args.queue_size})", file=sys.stderr)
+	try:
+		async with server:
+			await server.serve_forever()
+	finally:
+		await service.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+	parser = argparse.ArgumentParser(description="Asynchronous document extraction service")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8080)
+	parser.add_argument("--cpu-workers", type=int, default=os.cpu_count() or 1, help="Processes for render/OCR/classify")
+	parser.add_argument("--llm-workers", type=int, default=4, help="Threads for LLM extraction, scoring and validation")
+	parser.add_argument("--queue-size", type=int, default=64, help="Jobs waiting before submissions get 503")
+	parser.add_argument("--max-upload-mb", type=int, default=50)
+	parser.add_argument("--max-votes", type=int, default=5, help="Upper bound for num_votes set per job in the query")
+	parser.add_argument("--max-dpi", type=int, default=400, help="Upper bound for dpi set per job in the query")
+	parser.add_argument("--warm", action="store_true", help="Preload the OCR, PDF and LLM backends at start-up")
+	parser.add_argument("--votes", type=int, default=3)
+	parser.add_argument("--temperature", type=float, default=0.2)
+	parser.add_argument("--model", default=os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+	parser.add_argument("--context-tokens", type=int, default=DEFAULT_CONTEXT_TOKENS, help="Prompt token budget for OCR text; 0 sends the full text")
+	parser.add_argument("--dpi", type=int, default=200)
+	parser.add_argument("--max-pages", type=int, default=None)
+	parser.add_argument("--preprocess", action="store_true", help="Adaptive DPI, rescale, deskew, binarize and crop before OCR")
+	parser.add_argument("--prefill-rules", action="store_true")
+	parser.add_argument("--tiered", action="store_true")
+	parser.add_argument("--extractor", default="llm", choices=list(EXTRACTORS))
+	parser.add_argument("--split-sections", action="store_true")
+	parser.add_argument("--ocr-backend", default="auto", choices=["auto"] + backend_names())
+	args = parser.parse_args(argv)
+
+	load_dotenv()
+	try:
+		asyncio.run(run(args))
+	except KeyboardInterrupt:
+		pass
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,83 @@
+from typing import Any, Callable, Dict, List, Optional
+from collections import OrderedDict
+import threading
+
+from ..cache.store import ResultCache, make_key
+from ..utils.tracing import Tracer, reset_tracer, use_tracer
+from .runner import ProcessOptions, complete_document, ingest_key, load_document, prepare_document
+
+
+# (stage, data): ("ingest", {"cached"}), ("prepare", {"cached", "doc_type"}), ("vote", {"final", "votes"}), ("done", result)
+RunEvent = Callable[[str, Dict[str, Any]], None]
+
+
+class IncrementalRunner:
+	"""Runs documents stage by stage, keeping ingested documents and prepared states in memory.
+
+	A rerun only repeats the stages whose inputs changed: ingestion depends on the
+	file and the OCR options, preparation (classify, context, rule prefill) on the
+	requested fields, context budget and prefill, and extraction on everything.
+	Entries are keyed by file hash and dropped least recently used first. Safe to
+	share between threads (e.g. every session of the Streamlit app).
+	"""
+
+	def __init__(self, cache: Optional[ResultCache] = None, max_documents: int = 16):
+		self.cache = cache
+		self.max_documents = max_documents
+		self._documents: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+		self._states: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+		self._lock = threading.Lock()
+
+	def _get(self, store: "OrderedDict[str, Dict[str, Any]]", key: str) -> Optional[Dict[str, Any]]:
+		with self._lock:
+			value = store.get(key)
+			if value is not None:
+				store.move_to_end(key)
+			return value
+
+	def _put(self, store: "OrderedDict[str, Dict[str, Any]]", key: str, value: Dict[str, Any], limit: int) -> None:
+		with self._lock:
+			store[key] = value
+			store.move_to_end(key)
+			while len(store) > limit:
+				store.popitem(last=False)
+
+	def run(self, file_bytes: bytes, filename: str, requested_fields: Optional[List[str]], options: ProcessOptions, on_event: Optional[RunEvent] = None, tracer: Optional[Tracer] = None) -> Dict[str, Any]:
+		"""Result of process_document for these options, reusing whatever earlier runs already did."""
+		notify = on_event or (lambda stage, data: None)
+		if tracer is None:
+			result = self._run(file_bytes, filename, requested_fields, options, notify)
+		else:
+			token = use_tracer(tracer)
+			try:
+				with tracer.span("document", filename=filename, bytes=len(file_bytes)):
+					result = self._run(file_bytes, filename, requested_fields, options, notify)
+			finally:
+				reset_tracer(token)
+			result["timings"] = tracer.to_dict()
+			tracer.export()
+		notify("done", result)
+		return result
+
+	def _run(self, file_bytes: bytes, filename: str, requested_fields: Optional[List[str]], options: ProcessOptions, on_event: RunEvent) -> Dict[str, Any]:
+		doc_key = ingest_key(file_bytes, filename, options)
+		ocr = self._get(self._documents, doc_key)
+		on_event("ingest", {"cached": ocr is not None})
+		if ocr is None:
+			ocr = load_document(file_bytes, filename, options, self.cache, key=doc_key)
+			self._put(self._documents, doc_key, ocr, self.max_documents)
+
+		state_key = make_key(doc_key, requested_fields=requested_fields, context_tokens=options.context_tokens, prefill_rules=options.prefill_rules)
+		state = self._get(self._states, state_key)
+		if state is None:
+			state = prepare_document(file_bytes, filename, requested_fields, options, self.cache, ocr=ocr)
+			self._put(self._states, state_key, state, 4 * self.max_documents)
+			on_event("prepare", {"cached": False, "doc_type": state["doc_type"]})
+		else:
+			on_event("prepare", {"cached": True, "doc_type": state["doc_type"]})
+
+		return complete_document(state, requested_fields, options, self.cache, on_vote=lambda partial: on_event("vote", partial))
+
+	def stats(self) -> Dict[str, int]:
+		with self._lock:
+			return {"documents": len(self._documents), "states": len(self._states)}
@@ -1,14 +1,25 @@
-from typing import Dict, Any, List, Optional
-from dataclasses import dataclass
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from dataclasses import dataclass, asdict
+import importlib
+import time
 
-from PIL import Image
+from ..cache.store import ResultCache, cached, file_digest, make_key
+from ..ingest.backends import get_backend, ingest_with_backend
+from ..ingest.columnar import compact_page
+from ..ingest.options import PreprocessOptions
+from ..routing.classifier import classify_pages, classify_text_heuristic
+from ..extraction.context import DEFAULT_CONTEXT_TOKENS, select_context
+from ..extraction.extractor import extract_fields, extract_fields_batch, extract_fields_tiered, llm_available, merge_prefill
+from ..extraction.layoutlm import LAYOUTLM_DOC_TYPES, extract_fields_layoutlm
+from ..extraction.rules import extract_with_rules
+from ..validation.validators import validate_document
+from ..confidence.ocr_index import OCRIndex
+from ..confidence.scoring import score_and_locate, overall_confidence
+from ..utils.tracing import Tracer, get_tracer, use_tracer, reset_tracer
 
-from ..ingest.pdf_utils import pdf_to_images
-from ..ingest.ocr import ocr_pages
-from ..routing.classifier import classify_text_heuristic
-from ..extraction.extractor import extract_fields
-from ..validation.validators import totals_match_rule
-from ..confidence.scoring import score_fields, overall_confidence
+
+# Values of ProcessOptions.extractor
+EXTRACTORS = ("llm", "layoutlm")
 
 
 @dataclass
@@ -16,54 +27,389 @@ class ProcessOptions:
 	num_votes: int = 3
 	temperature: float = 0.2
 	model: str = "gpt-4o-mini"
+	ocr_workers: int = 1
+	use_text_layer: bool = True
+	dpi: int = 200
+	early_exit: bool = False
+	max_pages: Optional[int] = None
+	preprocess: Optional[PreprocessOptions] = None
+	# Registered OCR backend name, or "auto" for the cheapest one that can read the document
+	ocr_backend: str = "auto"
+	# Token budget for the OCR text sent to the extractor; None sends the full text
+	context_tokens: Optional[int] = DEFAULT_CONTEXT_TOKENS
+	# Fill fields with the rule-based extractor first; the LLM is only asked for the rest
+	prefill_rules: bool = False
+	# Rules first, one LLM call for low-confidence fields, extra votes only on disagreement
+	tiered: bool = False
+	# "llm" (OpenAI, or the rule-based demo without a key) or "layoutlm" (local model, receipts/invoices only)
+	extractor: str = "llm"
+	# Also extract each run of same-type pages of a mixed PDF on its own, under "sections"
+	split_sections: bool = False
+
+
+# Modules imported on first use per input kind; warm_up loads them ahead of time
+WARM_MODULES: Dict[str, Tuple[str, ...]] = {
+	"image": ("..ingest.ocr", "..ingest.preprocess", "pytesseract", "PIL.Image"),
+	"pdf": ("..ingest.document", "..ingest.parallel", "..ingest.text_layer"),
+	"llm": ("..extraction.client", "openai", "httpx", "tenacity"),
+	"layoutlm": ("..extraction.layoutlm", "torch", "transformers"),
+}
+
+
+def warm_up(kinds: Tuple[str, ...] = ("image", "pdf", "llm")) -> Dict[str, Optional[float]]:
+	"""Load the heavy backends for these input kinds before the first document arrives.
+
+	Meant for long-lived workers (batch_extract --warm, the Streamlit app). Returns
+	the load time in ms per kind, or None for a kind whose packages are missing.
+	"""
+	timings: Dict[str, Optional[float]] = {}
+	for kind in kinds:
+		start = time.perf_counter()
+		try:
+			modules = [importlib.import_module(name, __package__) for name in WARM_MODULES[kind]]
+		except ImportError:
+			timings[kind] = None
+			continue
+		if kind == "image":
+			modules[0].configure_tesseract()
+		elif kind == "llm" and llm_available():
+			modules[0].get_client()
+		elif kind == "layoutlm":
+			# Loads the model once for this process
+			modules[0].get_engine()
+		timings[kind] = (time.perf_counter() - start) * 1000.0
+	return timings
+
+
+def process_document(file_bytes: bytes, filename: str, requested_fields: Optional[List[str]], num_votes: int, temperature: float, model: str, ocr_workers: int = 1, use_text_layer: bool = True, dpi: int = 200, early_exit: bool = False, max_pages: Optional[int] = None, preprocess: Optional[PreprocessOptions] = None, ocr_backend: str = "auto", context_tokens: Optional[int] = DEFAULT_CONTEXT_TOKENS, prefill_rules: bool = False, tiered: bool = False, extractor: str = "llm", split_sections: bool = False, cache: Optional[ResultCache] = None, tracer: Optional[Tracer] = None) -> Dict[str, Any]:
+	"""Run the full pipeline on one document.
+
+	When a tracer is given, every stage and LLM vote is recorded as a span, the
+	result gains a "timings" block and the spans are exported to the tracer's sinks.
+	"""
+	options = ProcessOptions(
+		num_votes=num_votes, temperature=temperature, model=model, ocr_workers=ocr_workers, use_text_layer=use_text_layer,
+		dpi=dpi, early_exit=early_exit, max_pages=max_pages, preprocess=preprocess, ocr_backend=ocr_backend,
+		context_tokens=context_tokens, prefill_rules=prefill_rules, tiered=tiered, extractor=extractor,
+		split_sections=split_sections,
+	)
+	if tracer is None:
+		return _run_pipeline(file_bytes, filename, requested_fields, options, cache)
+	token = use_tracer(tracer)
+	try:
+		with tracer.span("document", filename=filename, bytes=len(file_bytes)):
+			result = _run_pipeline(file_bytes, filename, requested_fields, options, cache)
+	finally:
+		reset_tracer(token)
+	result["timings"] = tracer.to_dict()
+	tracer.export()
+	return result
+
+
+def _ingest(file_bytes: bytes, filename: str, options: ProcessOptions) -> Dict[str, Any]:
+	backend, ocr = ingest_with_backend(
+		file_bytes, filename, backend=options.ocr_backend, dpi=options.dpi, ocr_workers=options.ocr_workers,
+		use_text_layer=options.use_text_layer, max_pages=options.max_pages, preprocess=options.preprocess,
+	)
+	ocr["backend"] = backend
+	return ocr
+
+
+def ingest_key(file_bytes: bytes, filename: str, options: ProcessOptions) -> str:
+	"""Key of a document's ingest stage: the file content and the options its OCR depends on.
+
+	A named backend can add to it (e.g. precomputed boxes are picked by filename).
+	"""
+	preprocess = options.preprocess
+	source = get_backend(options.ocr_backend).cache_key(filename) if options.ocr_backend != "auto" else None
+	return make_key(
+		file_digest(file_bytes), is_pdf=filename.lower().endswith(".pdf"), dpi=options.dpi, use_text_layer=options.use_text_layer,
+		max_pages=options.max_pages, preprocess=asdict(preprocess) if preprocess else None, ocr_backend=options.ocr_backend,
+		**({"source": source} if source is not None else {}),
+	)
+
+
+def load_document(file_bytes: bytes, filename: str, options: ProcessOptions, cache: Optional[ResultCache] = None, key: Optional[str] = None) -> Dict[str, Any]:
+	"""The ingest stage alone: the ocr_pages structure (columnar pages) for one document, through the cache."""
+	key = key or (ingest_key(file_bytes, filename, options) if cache else "")
+	with get_tracer().span("ingest") as span:
+		# Pages are ingested lazily; born-digital PDF pages are read from the text layer,
+		# scanned pages and images go through OCR unless precomputed boxes exist for the
+		# file. max_pages stops after the first pages.
+		ocr = cached(cache, "ocr", key, lambda: _ingest(file_bytes, filename, options))
+		# Cached and backend pages go columnar too (parallel OCR workers already return them so)
+		ocr["pages"] = [compact_page(page) for page in ocr.get("pages", [])]
+		span.set(backend=ocr.get("backend"), pages=len(ocr.get("pages", [])))
+	return ocr
+
+
+def prepare_document(file_bytes: bytes, filename: str, requested_fields: Optional[List[str]], options: ProcessOptions, cache: Optional[ResultCache] = None, ocr: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+	"""Ingest, classify and select the prompt context for one document (the CPU-bound stages).
+
+	The returned state is plain data, so it can be built in a worker process and
+	handed to complete_document in another; its pages are ColumnarPage views,
+	which pickle as one flat buffer each. An `ocr` from load_document (made with the
+	same ingest options) skips ingestion.
+
+	The state is always the whole document's. With options.split_sections, a PDF
+	whose pages clearly classify as different doc types also gets one state per
+	section, each prepared from its pages with its doc type, under "parts".
+	"""
+	tracer = get_tracer()
+	# Stages are cached separately so a change in extraction settings still reuses the OCR
+	ocr_key = ingest_key(file_bytes, filename, options) if cache else ""
+	if ocr is None:
+		ocr = load_document(file_bytes, filename, options, cache, key=ocr_key)
+	text = ocr.get("full_text", "")
+
+	with tracer.span("classify") as span:
+		doc_type = classify_text_heuristic(text)
+		if doc_type == "unknown":
+			# default to invoice if ambiguous
+			doc_type = "invoice"
+		pages = ocr.get("pages") or []
+		sections = classify_pages(pages) if options.split_sections and len(pages) > 1 else []
+		span.set(doc_type=doc_type, sections=len(sections))
+
+	state = _prepare_text(ocr, ocr_key, doc_type, requested_fields, options)
+	state["sections"], state["parts"] = [], []
+	if len(sections) <= 1:
+		return state
+	parts = []
+	for section in sections:
+		with tracer.span("section", doc_type=section["doc_type"], pages=len(section["pages"])):
+			section_ocr = _section_ocr(ocr, section["pages"])
+			section_key = make_key(ocr_key, pages=section["pages"]) if ocr_key else ""
+			section_type = section["doc_type"] if section["doc_type"] != "unknown" else "invoice"
+			parts.append(_prepare_text(section_ocr, section_key, section_type, requested_fields, options))
+	state["sections"], state["parts"] = sections, parts
+	return state
+
 
+def _section_ocr(ocr: Dict[str, Any], page_numbers: List[int]) -> Dict[str, Any]:
+	wanted = set(page_numbers)
+	pages = [page for page in ocr.get("pages", []) if page["page"] in wanted]
+	return {**ocr, "pages": pages, "full_text": "\n".join(page["text"] for page in pages)}
 
-def process_document(file_bytes: bytes, filename: str, requested_fields: Optional[List[str]], num_votes: int, temperature: float, model: str) -> Dict[str, Any]:
-	is_pdf = filename.lower().endswith(".pdf")
-	images: List[Image.Image]
-	if is_pdf:
-		images = pdf_to_images(file_bytes)
-	else:
-		# Assume image
-		from io import BytesIO
-		img = Image.open(BytesIO(file_bytes)).convert("RGB")
-		images = [img]
 
-	ocr = ocr_pages(images)
+def _prepare_text(ocr: Dict[str, Any], ocr_key: str, doc_type: str, requested_fields: Optional[List[str]], options: ProcessOptions) -> Dict[str, Any]:
+	"""Prompt context and rule prefill for one classified document (or section)."""
+	tracer = get_tracer()
 	text = ocr.get("full_text", "")
+	# Only the lines relevant to the requested fields go to the extractor; its cost
+	# scales with prompt size x num_votes. Scoring and validation still see the full text.
+	prompt_text = text
+	if options.context_tokens is not None:
+		with tracer.span("context", budget=options.context_tokens) as span:
+			context = select_context(doc_type, text, ocr.get("pages"), requested_fields, max_tokens=options.context_tokens)
+			prompt_text = context["text"]
+			span.set(
+				input_tokens=context["input_tokens"], context_tokens=context["context_tokens"],
+				lines_total=context["lines_total"], lines_kept=context["lines_kept"],
+			)
+
+	prefill: Dict[str, str] = {}
+	if options.prefill_rules:
+		with tracer.span("rules") as span:
+			matches = extract_with_rules(doc_type, text, ocr.get("pages"), requested_fields)
+			prefill = {name: match.value for name, match in matches.items()}
+			span.set(fields=len(prefill))
+	return {"ocr": ocr, "text": text, "doc_type": doc_type, "prompt_text": prompt_text, "ocr_key": ocr_key, "prefill": prefill}
+
+
+def _extract_key(state: Dict[str, Any], requested_fields: Optional[List[str]], options: ProcessOptions, cache: Optional[ResultCache], batched: bool = False) -> str:
+	if not cache:
+		return ""
+	return make_key(
+		state["ocr_key"], state["doc_type"],
+		requested_fields=requested_fields, model=options.model, temperature=options.temperature, num_votes=options.num_votes,
+		early_exit=options.early_exit, llm=llm_available(), context_tokens=options.context_tokens, prefill=state["prefill"], tiered=options.tiered, batched=batched,
+		extractor=options.extractor,
+	)
+
+
+def _uses_layoutlm(state: Dict[str, Any], options: ProcessOptions) -> bool:
+	return options.extractor == "layoutlm" and state["doc_type"] in LAYOUTLM_DOC_TYPES
+
+
+def _run_pipeline(file_bytes: bytes, filename: str, requested_fields: Optional[List[str]], options: ProcessOptions, cache: Optional[ResultCache]) -> Dict[str, Any]:
+	state = prepare_document(file_bytes, filename, requested_fields, options, cache)
+	return complete_document(state, requested_fields, options, cache)
+
+
+def complete_document(state: Dict[str, Any], requested_fields: Optional[List[str]], options: ProcessOptions, cache: Optional[ResultCache] = None, on_vote: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+	"""Extract fields from a prepare_document state, then score and validate (the LLM-bound stages).
+
+	on_vote receives the running {"final", "votes"} each time an LLM vote arrives
+	(plain voting only; cache hits, tiered and layoutlm extraction return at once).
+	A document split into sections (options.split_sections) also gets every
+	section's own result under "sections".
+	"""
+	result = _complete_part(state, requested_fields, options, cache, on_vote)
+	if state.get("parts"):
+		results = []
+		for part in state["parts"]:
+			with get_tracer().span("section", doc_type=part["doc_type"]):
+				results.append(_complete_part(part, requested_fields, options, cache))
+		result["sections"] = [_section_result(section, part_result) for section, part_result in zip(state["sections"], results)]
+	return result
+
+
+def _section_result(section: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+	# e.g. {"doc_type": "prescription", "pages": [3], "fields": [...], "overall_confidence": 0.8, "qa": {...}}
+	return {"doc_type": result["doc_type"], "pages": section["pages"], **{key: result[key] for key in ("fields", "overall_confidence", "qa")}}
+
+
+def _complete_part(state: Dict[str, Any], requested_fields: Optional[List[str]], options: ProcessOptions, cache: Optional[ResultCache], on_vote: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+	tracer = get_tracer()
+	doc_type, prompt_text = state["doc_type"], state["prompt_text"]
+	with tracer.span("extract", model=options.model, num_votes=options.num_votes) as span:
+		if _uses_layoutlm(state, options):
+			compute = lambda: merge_prefill(extract_fields_layoutlm([{"id": "0", "pages": state["ocr"].get("pages", [])}], requested_fields)["0"], state["prefill"])
+		elif options.tiered:
+			compute = lambda: extract_fields_tiered(
+				doc_type, state["text"], requested_fields, num_votes=options.num_votes, temperature=options.temperature, model=options.model,
+				pages=state["ocr"].get("pages"), prompt_text=prompt_text,
+			)
+		else:
+			compute = lambda: extract_fields(
+				doc_type, prompt_text, requested_fields, num_votes=options.num_votes, temperature=options.temperature, model=options.model, early_exit=options.early_exit,
+				prefill=state["prefill"], on_vote=on_vote,
+			)
+		extraction = cached(cache, "extract", _extract_key(state, requested_fields, options, cache), compute)
+		span.set(fields=len(extraction["final"]))
+	return _finish(state, extraction)
+
+
+def process_documents(documents: List[Tuple[bytes, str]], requested_fields: Optional[List[str]], options: ProcessOptions, cache: Optional[ResultCache] = None, tracer: Optional[Tracer] = None, max_batch_tokens: int = 6000, max_batch_docs: int = 8) -> List[Dict[str, Any]]:
+	"""Run the pipeline on many (short) documents, packing several into each LLM request.
+
+	Documents are ingested one by one, then extracted in batches planned by prompt
+	token budget (early_exit and tiered do not apply; rule prefill only skips documents
+	whose requested fields are all found). Results are in input order; a document
+	that fails gets {"error": "..."} instead of a result.
+	"""
+	token = use_tracer(tracer) if tracer is not None else None
+	try:
+		with get_tracer().span("batch", documents=len(documents)):
+			results = _run_batch(documents, requested_fields, options, cache, max_batch_tokens, max_batch_docs)
+	finally:
+		if token is not None:
+			reset_tracer(token)
+	if tracer is not None:
+		tracer.export()
+	return results
+
+
+def _run_batch(documents: List[Tuple[bytes, str]], requested_fields: Optional[List[str]], options: ProcessOptions, cache: Optional[ResultCache], max_batch_tokens: int, max_batch_docs: int) -> List[Dict[str, Any]]:
+	tracer = get_tracer()
+	states: List[Optional[Dict[str, Any]]] = []
+	errors: Dict[int, str] = {}
+	for index, (file_bytes, filename) in enumerate(documents):
+		try:
+			states.append(prepare_document(file_bytes, filename, requested_fields, options, cache))
+		except Exception as exc:
+			states.append(None)
+			errors[index] = f"{type(exc).__name__}: {exc}"
+
+	extractions: Dict[int, Dict[str, Any]] = {}
+	keys: Dict[int, str] = {}
+	# Mixed documents need one extraction per section, so they skip the shared requests
+	mixed = {index for index, state in enumerate(states) if state is not None and state.get("parts")}
+	for index, state in enumerate(states):
+		if state is None or index in mixed:
+			continue
+		keys[index] = _extract_key(state, requested_fields, options, cache, batched=True)
+		hit = cache.get("extract", keys[index]) if cache else None
+		if hit is not None:
+			extractions[index] = hit
+		elif requested_fields and all(name in state["prefill"] for name in requested_fields):
+			# Rules already found everything that was asked for
+			extractions[index] = merge_prefill({"final": {}, "votes": {}}, state["prefill"])
+	local = [
+		{"id": str(index), "pages": state["ocr"].get("pages", [])}
+		for index, state in enumerate(states) if state is not None and index not in mixed and index not in extractions and _uses_layoutlm(state, options)
+	]
+	if local:
+		# Pages of all documents share the model's batches
+		with tracer.span("extract", extractor="layoutlm", documents=len(local)):
+			found = extract_fields_layoutlm(local, requested_fields)
+		for doc in local:
+			index = int(doc["id"])
+			extractions[index] = merge_prefill(found[doc["id"]], states[index]["prefill"])
+			if cache:
+				cache.put("extract", keys[index], extractions[index])
+	todo = [
+		{"id": str(index), "doc_type": state["doc_type"], "ocr_text": state["prompt_text"]}
+		for index, state in enumerate(states) if state is not None and index not in mixed and index not in extractions
+	]
+	if todo:
+		with tracer.span("extract", model=options.model, num_votes=options.num_votes, documents=len(todo)):
+			batched = extract_fields_batch(
+				todo, requested_fields, num_votes=options.num_votes, temperature=options.temperature, model=options.model,
+				max_batch_tokens=max_batch_tokens, max_batch_docs=max_batch_docs,
+			)
+		for doc in todo:
+			index = int(doc["id"])
+			extractions[index] = merge_prefill(batched[doc["id"]], states[index]["prefill"])
+			if cache:
+				cache.put("extract", keys[index], extractions[index])
+
+	results: List[Dict[str, Any]] = []
+	for index, state in enumerate(states):
+		if state is None:
+			results.append({"error": errors[index]})
+			continue
+		try:
+			results.append(complete_document(state, requested_fields, options, cache) if index in mixed else _finish(state, extractions[index]))
+		except Exception as exc:
+			results.append({"error": f"{type(exc).__name__}: {exc}"})
+	return results
+
+
+def _source(match: Any) -> Optional[Dict[str, Any]]:
+	if match is None or match.page is None:
+		return None
+	return {"page": match.page, "bbox": match.bbox}
 
-	doc_type = classify_text_heuristic(text)
-	if doc_type == "unknown":
-		# default to invoice if ambiguous
-		doc_type = "invoice"
 
-	extraction = extract_fields(doc_type, text, requested_fields, num_votes=num_votes, temperature=temperature, model=model)
+def _finish(state: Dict[str, Any], extraction: Dict[str, Any]) -> Dict[str, Any]:
+	"""Score, validate and shape the result for one extracted document."""
+	tracer = get_tracer()
+	doc_type, text = state["doc_type"], state["text"]
 	final_fields: Dict[str, str] = extraction["final"]
 	votes_per_field = extraction["votes"]
 
-	# Confidence per field
-	field_scores = score_fields(votes_per_field=votes_per_field, ocr_text=text)
+	# Confidence per field; the OCR index is built once and also tells where each value is
+	with tracer.span("score"):
+		index = OCRIndex(text, state["ocr"].get("pages"))
+		field_scores, locations = score_and_locate(votes_per_field, index)
 
-	# QA rules
-	passed, failed = [], []
-	ok, msg = totals_match_rule(text=text, fields=final_fields) if doc_type == "invoice" else (True, "N/A")
-	if ok:
-		passed.append("totals_match")
-	else:
-		failed.append("totals_match")
+	# QA rules of the doc type (totals, line items, tax rate, currency); amounts in the text are parsed once for all of them
+	with tracer.span("validate") as span:
+		checks = validate_document(doc_type, text, final_fields)
+		passed = [name for name, check in checks.items() if check.passed]
+		failed = [name for name, check in checks.items() if not check.passed]
+		normalized = {key: value for check in checks.values() for key, value in check.values.items()}
+		span.set(rules=len(checks))
 
-	overall = overall_confidence(field_scores, failed_rules=failed)
+		overall = overall_confidence(field_scores, failed_rules=failed)
 
+	tiers = extraction.get("tiers")
 	fields_output = []
 	for name, value in final_fields.items():
-		fields_output.append({
+		item = {
 			"name": name,
 			"value": value,
 			"confidence": field_scores.get(name, 0.0),
-			"source": None,
-		})
+			"source": _source(locations.get(name)),
+		}
+		if tiers is not None:
+			# Which extraction tier produced the value: "rules", "llm" or "votes"
+			item["tier"] = tiers.get(name)
+		fields_output.append(item)
 
-	return {
+	result = {
 		"doc_type": doc_type,
 		"fields": fields_output,
 		"overall_confidence": overall,
@@ -72,4 +418,8 @@ def process_document(file_bytes: bytes, filename: str, requested_fields: Optiona
 			"failed_rules": failed,
 			"notes": f"{sum(1 for c in field_scores.values() if c < 0.6)} low-confidence fields",
 		},
-	} 
\ No newline at end of file
+	}
+	if normalized:
+		# e.g. {"TotalAmount": 10.6, "TaxRate": 6.0, "Currency": "MYR"}
+		result["qa"]["normalized"] = normalized
+	return result
@@ -0,0 +1,114 @@
+from typing import Any, Callable, Dict, Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+def file_digest(data: bytes) -> str:
+	return hashlib.sha256(data).hexdigest()
+
+
+def _json_default(value: Any) -> Any:
+	# Compact containers (columnar OCR pages) are stored through their dict view
+	if hasattr(value, "to_dict"):
+		return value.to_dict()
+	raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def make_key(*parts: Any, **params: Any) -> str:
+	"""Stable content key from positional parts and keyword parameters."""
+	payload = json.dumps([parts, params], sort_keys=True, default=str)
+	return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+	"""On-disk (SQLite) content-addressed cache for pipeline stage outputs.
+
+	Values are JSON-serialized and zlib-compressed. When the total stored size
+	exceeds `max_bytes`, least recently used entries are evicted.
+	"""
+
+	def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+		if os.path.dirname(path):
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+		self.path = path
+		self.max_bytes = max_bytes
+		self.hits: Dict[str, int] = {}
+		self.misses: Dict[str, int] = {}
+		self._lock = threading.Lock()
+		self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+		self._conn.execute(
+			"CREATE TABLE IF NOT EXISTS entries ("
+			"key TEXT PRIMARY KEY, stage TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+		)
+		self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+		self._conn.commit()
+
+	def get(self, stage: str, key: str) -> Optional[Any]:
+		with self._lock:
+			row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (f"{stage}:{key}",)).fetchone()
+			if row is None:
+				self.misses[stage] = self.misses.get(stage, 0) + 1
+				return None
+			self._conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), f"{stage}:{key}"))
+			self._conn.commit()
+			self.hits[stage] = self.hits.get(stage, 0) + 1
+		return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+	def put(self, stage: str, key: str, value: Any) -> None:
+		blob = zlib.compress(json.dumps(value, ensure_ascii=False, default=_json_default).encode("utf-8"))
+		with self._lock:
+			self._conn.execute(
+				"INSERT OR REPLACE INTO entries (key, stage, value, size, accessed) VALUES (?, ?, ?, ?, ?)",
+				(f"{stage}:{key}", stage, blob, len(blob), time.time()),
+			)
+			self._evict()
+			self._conn.commit()
+
+	def _evict(self) -> None:
+		total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+		if total <= self.max_bytes:
+			return
+		for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed ASC").fetchall():
+			self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+			total -= size
+			if total <= self.max_bytes:
+				break
+
+	def stats(self) -> Dict[str, Any]:
+		with self._lock:
+			count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+		return {"hits": dict(self.hits), "misses": dict(self.misses), "entries": count, "bytes": size}
+
+	def clear(self) -> None:
+		with self._lock:
+			self._conn.execute("DELETE FROM entries")
+			self._conn.commit()
+
+	def close(self) -> None:
+		with self._lock:
+			self._conn.close()
+
+
+def cached(cache: Optional[ResultCache], stage: str, key: str, compute: Callable[[], Any]) -> Any:
+	"""Return the cached value for (stage, key), computing and storing it on a miss."""
+	if cache is None:
+		return compute()
+	value = cache.get(stage, key)
+	if value is None:
+		value = compute()
+		cache.put(stage, key, value)
+	return value
+
+
+def cache_from_env() -> Optional[ResultCache]:
+	"""Build a cache from RESULT_CACHE_PATH / RESULT_CACHE_MAX_MB, or None when unset."""
+	path = os.getenv("RESULT_CACHE_PATH")
+	if not path:
+		return None
+	max_mb = int(os.getenv("RESULT_CACHE_MAX_MB") or 512)
+	return ResultCache(path, max_bytes=max_mb * 1024 * 1024)
@@ -0,0 +1,134 @@
+from typing import Any, Dict, List, Optional, Union
+from dataclasses import dataclass
+
+from rapidfuzz import fuzz
+
+from ..ingest.columnar import WordColumns, page_words
+from .spatial import WordGrid, merge_bboxes
+
+
+# Lines sharing the most tokens / n-grams with a value are the only ones fuzzy-matched
+NGRAM = 3
+MAX_CANDIDATE_LINES = 8
+_PUNCT = ".,:;()[]{}\"'"
+
+
+@dataclass
+class IndexMatch:
+	score: float
+	# First and last OCR line (indexes into OCRIndex.lines) of the matching window
+	first_line: int
+	last_line: int
+	page: Optional[int] = None
+	bbox: Optional[List[int]] = None
+	# Indexes into the page's words of the matching span, when word boxes are known
+	words: Optional[List[int]] = None
+
+
+def normalize(text: str) -> str:
+	return " ".join(text.lower().split())
+
+
+def _tokens(text: str) -> set:
+	return {t.strip(_PUNCT) for t in text.split()} - {""}
+
+
+def _ngrams(text: str) -> set:
+	return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class OCRIndex:
+	"""Normalized OCR lines of one document with a token lookup, built once and queried per field.
+
+	Candidate lines are those sharing tokens with the value; when OCR noise leaves
+	no shared token, the value's character n-grams are compared against the lines
+	that remain. With pages the lines are the OCR lines (so matches carry page and
+	bbox, narrowed to the matching words through a per-page WordGrid); otherwise
+	the text's own lines.
+	"""
+
+	def __init__(self, ocr_text: str, pages: Optional[List[Dict[str, Any]]] = None):
+		self.lines: List[str] = []
+		self.refs: List[Dict[str, Any]] = []
+		self._words: Dict[int, Union[List[Dict[str, Any]], WordColumns]] = {}
+		self._grids: Dict[int, WordGrid] = {}
+		for page in pages or []:
+			words = page_words(page)
+			if len(words):
+				self._words[page["page"]] = words
+			for line in page.get("lines", []):
+				self.lines.append(normalize(line["text"]))
+				self.refs.append({"page": page["page"], "bbox": line["bbox"]})
+		if not self.lines:
+			self.lines = [normalize(text) for text in ocr_text.splitlines() if text.strip()]
+			self.refs = [{} for _ in self.lines]
+		self._postings: Dict[str, List[int]] = {}
+		for i, line in enumerate(self.lines):
+			for token in _tokens(line):
+				self._postings.setdefault(token, []).append(i)
+
+	def _candidate_lines(self, needle: str) -> List[int]:
+		hits: Dict[int, int] = {}
+		for token in _tokens(needle):
+			for i in self._postings.get(token, ()):
+				hits[i] = hits.get(i, 0) + 1
+		if not hits:
+			# Every token garbled: rank lines by shared character n-grams instead
+			grams = _ngrams(needle)
+			for i, line in enumerate(self.lines):
+				shared = sum(1 for gram in grams if gram in line)
+				if shared:
+					hits[i] = shared
+		ranked = sorted(hits, key=lambda i: (-hits[i], i))
+		return ranked[:MAX_CANDIDATE_LINES]
+
+	def find(self, value: str, threshold: int = 80) -> Optional[IndexMatch]:
+		"""Best fuzzy (partial ratio) match of value, or None below threshold.
+
+		A window starts at each candidate line and grows over the following lines
+		until it is at least as long as the value, so values wrapped over several
+		lines (addresses) still match.
+		"""
+		needle = normalize(value)
+		if not needle:
+			return None
+		best: Optional[IndexMatch] = None
+		for start in self._candidate_lines(needle):
+			end = start
+			window = self.lines[start]
+			while len(window) < len(needle) and end + 1 < len(self.lines):
+				end += 1
+				window += " " + self.lines[end]
+			if needle in window:
+				score = 100.0
+			else:
+				score = fuzz.partial_ratio(needle, window)
+			if score >= threshold and (best is None or score > best.score):
+				best = IndexMatch(score, start, end)
+				if score == 100.0:
+					break
+		if best is not None:
+			refs = [r for r in self.refs[best.first_line:best.last_line + 1] if r]
+			if refs:
+				best.page = refs[0]["page"]
+				boxes = [r["bbox"] for r in refs if r["page"] == best.page]
+				best.bbox = merge_bboxes(boxes)
+				self._narrow(best, needle, threshold)
+		return best
+
+	def grid(self, page: int) -> Optional[WordGrid]:
+		"""Spatial word index of a page, built on first use."""
+		if page not in self._grids and page in self._words:
+			self._grids[page] = WordGrid(self._words[page])
+		return self._grids.get(page)
+
+	def _narrow(self, match: IndexMatch, needle: str, threshold: int) -> None:
+		# Shrink the line bbox to the run of words that spells the value
+		grid = self.grid(match.page)
+		span = grid.best_span(needle, match.bbox, threshold) if grid else None
+		if span is not None:
+			match.words = span[1]
+			match.bbox = grid.span_bbox(span[1])
+
+	def contains(self, value: str, threshold: int = 80) -> bool:
+		return self.find(value, threshold) is not None
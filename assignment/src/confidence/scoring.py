@@ -1,19 +1,32 @@
-from typing import Dict, List, Any
-from ..utils.json_utils import normalize_value, majority_vote, vote_fraction, fuzzy_contains
+from typing import Dict, List, Any, Optional, Tuple
+from ..utils.json_utils import normalize_value, majority_vote, vote_fraction
 from ..validation.validators import field_level_validations
+from .ocr_index import IndexMatch, OCRIndex
 
 
-def score_fields(votes_per_field: Dict[str, List[str]], ocr_text: str) -> Dict[str, float]:
+def score_and_locate(votes_per_field: Dict[str, List[str]], index: OCRIndex, vote_shares: Optional[Dict[str, float]] = None) -> Tuple[Dict[str, float], Dict[str, IndexMatch]]:
+	"""Confidence per field plus where in the OCR each winning value was found.
+
+	`vote_shares` replaces the vote share of the fields it names (e.g. a rule's own score).
+	"""
 	scores: Dict[str, float] = {}
+	found: Dict[str, IndexMatch] = {}
 	for name, values in votes_per_field.items():
 		candidate = majority_vote([normalize_value(v) for v in values])
-		vote_conf = vote_fraction(values, candidate)
-		ocr_bonus = 1.0 if fuzzy_contains(ocr_text, candidate) else 0.4 if candidate else 0.0
+		vote_conf = vote_shares[name] if vote_shares and name in vote_shares else vote_fraction(values, candidate)
+		match = index.find(candidate) if candidate else None
+		if match is not None:
+			found[name] = match
+		ocr_bonus = 1.0 if match is not None else 0.4 if candidate else 0.0
 		valid = field_level_validations(name, candidate)
 		valid_bonus = 1.0 if valid else 0.0
 		conf = 0.5 * vote_conf + 0.3 * ocr_bonus + 0.2 * valid_bonus
 		scores[name] = max(0.0, min(1.0, conf))
-	return scores
+	return scores, found
+
+
+def score_fields(votes_per_field: Dict[str, List[str]], ocr_text: str, index: Optional[OCRIndex] = None, vote_shares: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+	return score_and_locate(votes_per_field, index or OCRIndex(ocr_text), vote_shares)[0]
 
 
 def overall_confidence(field_scores: Dict[str, float], failed_rules: List[str]) -> float:
@@ -21,4 +34,4 @@ def overall_confidence(field_scores: Dict[str, float], failed_rules: List[str])
 		return 0.0
 	avg = sum(field_scores.values()) / len(field_scores)
 	penalty = 0.05 * len(failed_rules)
-	return max(0.0, min(1.0, avg - penalty)) 
\ No newline at end of file
+	return max(0.0, min(1.0, avg - penalty))
@@ -0,0 +1,77 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from rapidfuzz import fuzz
+
+from ..ingest.columnar import WordColumns, word_boxes, word_texts
+
+
+# Cells are this many median word heights on a side; a line query touches a handful of cells
+CELL_HEIGHTS = 4
+# A span may be this many characters longer than the value it is matched against
+SPAN_SLACK = 4
+
+
+def merge_bboxes(boxes: List[List[int]]) -> List[int]:
+	return [min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)]
+
+
+class WordGrid:
+	"""Uniform grid over the word bboxes of one OCR page.
+
+	Each word is filed under every cell its bbox overlaps, so a region query
+	only looks at the words of the cells the region covers instead of the page.
+	Words are page-dict words or a page's WordColumns.
+	"""
+
+	def __init__(self, words: Union[List[Dict[str, Any]], WordColumns], cell: Optional[int] = None):
+		self.boxes = word_boxes(words)
+		self.texts = word_texts(words)
+		if cell is None:
+			heights = sorted(max(1, b[3] - b[1]) for b in self.boxes) or [8]
+			cell = CELL_HEIGHTS * heights[len(heights) // 2]
+		self.cell = max(1, int(cell))
+		self._cells: Dict[Tuple[int, int], List[int]] = {}
+		for i, bbox in enumerate(self.boxes):
+			for key in self._keys(bbox):
+				self._cells.setdefault(key, []).append(i)
+
+	def _keys(self, bbox: List[int]):
+		x1, y1, x2, y2 = bbox
+		for cx in range(x1 // self.cell, x2 // self.cell + 1):
+			for cy in range(y1 // self.cell, y2 // self.cell + 1):
+				yield cx, cy
+
+	def query(self, bbox: List[int]) -> List[int]:
+		"""Indexes of the words overlapping bbox, in reading order."""
+		x1, y1, x2, y2 = bbox
+		found = set()
+		for key in self._keys(bbox):
+			for i in self._cells.get(key, ()):
+				wx1, wy1, wx2, wy2 = self.boxes[i]
+				if wx1 <= x2 and wx2 >= x1 and wy1 <= y2 and wy2 >= y1:
+					found.add(i)
+		return sorted(found)
+
+	def best_span(self, needle: str, bbox: List[int], threshold: int = 80) -> Optional[Tuple[float, List[int]]]:
+		"""Run of consecutive words inside bbox whose text best matches needle (already normalized).
+
+		Returns (score, word indexes) or None when no run reaches threshold.
+		"""
+		indexes = self.query(bbox)
+		texts = [self.texts[i].lower() for i in indexes]
+		best: Optional[Tuple[float, List[int]]] = None
+		for start in range(len(indexes)):
+			span = ""
+			for end in range(start, len(indexes)):
+				span = f"{span} {texts[end]}" if span else texts[end]
+				if len(span) > len(needle) + SPAN_SLACK:
+					break
+				score = fuzz.ratio(needle, span)
+				if score >= threshold and (best is None or score > best[0]):
+					best = (score, indexes[start:end + 1])
+			if best is not None and best[0] == 100.0:
+				break
+		return best
+
+	def span_bbox(self, indexes: List[int]) -> List[int]:
+		return merge_bboxes([self.boxes[i] for i in indexes])
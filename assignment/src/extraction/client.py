@@ -0,0 +1,118 @@
+from typing import TYPE_CHECKING, Any, Deque, Dict, Optional, Tuple
+from collections import deque
+import atexit
+import os
+import threading
+import time
+
+if TYPE_CHECKING:
+	# Imported when the first client is built; demo mode never loads them
+	import httpx
+	from openai import OpenAI
+
+
+# Connection lifecycle events reported by httpcore through the "trace" request extension
+_CONNECT_EVENTS = ("connection.connect_tcp", "connection.start_tls")
+_WAIT_EVENTS = ("http11.receive_response_headers", "http2.receive_response_headers")
+
+
+class ClientProvider:
+	"""Shares one OpenAI client per (api key, base url) over a pooled keep-alive HTTP transport.
+
+	Every request is traced so the time spent opening connections (TCP + TLS) can be told
+	apart from the time spent waiting for the model's response headers.
+	"""
+
+	def __init__(self, pool_size: Optional[int] = None, keepalive_seconds: Optional[float] = None, timeout: Optional[float] = None, history: int = 256):
+		self.pool_size = pool_size or int(os.getenv("OPENAI_POOL_SIZE") or 10)
+		self.keepalive_seconds = keepalive_seconds if keepalive_seconds is not None else float(os.getenv("OPENAI_KEEPALIVE_SECONDS") or 60)
+		self.timeout = timeout or float(os.getenv("OPENAI_TIMEOUT") or 120)
+		self.timings: Deque[Dict[str, Any]] = deque(maxlen=history)
+		self._clients: Dict[Tuple[Optional[str], Optional[str]], "OpenAI"] = {}
+		self._lock = threading.Lock()
+		self._local = threading.local()
+
+	def get(self) -> "OpenAI":
+		key = (os.getenv("OPENAI_API_KEY"), os.getenv("OPENAI_BASE_URL"))
+		client = self._clients.get(key)
+		if client is not None:
+			return client
+		with self._lock:
+			if key not in self._clients:
+				import httpx
+				from openai import OpenAI
+
+				http_client = httpx.Client(
+					limits=httpx.Limits(
+						max_connections=self.pool_size,
+						max_keepalive_connections=self.pool_size,
+						keepalive_expiry=self.keepalive_seconds,
+					),
+					timeout=self.timeout,
+					event_hooks={"request": [self._on_request], "response": [self._on_response]},
+				)
+				# Retries are left to tenacity in the extractor, which backs off outside the concurrency slots
+				self._clients[key] = OpenAI(api_key=key[0], base_url=key[1], http_client=http_client, max_retries=0)
+			return self._clients[key]
+
+	def _on_request(self, request: "httpx.Request") -> None:
+		timing: Dict[str, Any] = {"start": time.perf_counter(), "connect_ms": 0.0, "wait_ms": 0.0, "new_connection": False}
+		started: Dict[str, float] = {}
+
+		def trace(event: str, info: Dict[str, Any]) -> None:
+			name, _, phase = event.rpartition(".")
+			if phase == "started":
+				started[name] = time.perf_counter()
+			elif phase in ("complete", "failed") and name in started:
+				elapsed = (time.perf_counter() - started.pop(name)) * 1000.0
+				if name in _CONNECT_EVENTS:
+					timing["connect_ms"] += elapsed
+					timing["new_connection"] = True
+				elif name in _WAIT_EVENTS:
+					timing["wait_ms"] += elapsed
+
+		request.extensions["trace"] = trace
+		self._local.pending = timing
+
+	def _on_response(self, response: "httpx.Response") -> None:
+		timing = getattr(self._local, "pending", None)
+		if timing is None:
+			return
+		timing["total_ms"] = (time.perf_counter() - timing.pop("start")) * 1000.0
+		timing["status"] = response.status_code
+		self._local.pending = None
+		self._local.last = timing
+		self.timings.append(timing)
+
+	def last_timing(self) -> Optional[Dict[str, Any]]:
+		"""Timing of the most recent request made from the calling thread."""
+		return getattr(self._local, "last", None)
+
+	def timing_summary(self) -> Dict[str, Any]:
+		timings = list(self.timings)
+		n = len(timings) or 1
+		return {
+			"requests": len(timings),
+			"new_connections": sum(1 for t in timings if t["new_connection"]),
+			"avg_connect_ms": sum(t["connect_ms"] for t in timings) / n,
+			"avg_wait_ms": sum(t["wait_ms"] for t in timings) / n,
+			"avg_total_ms": sum(t["total_ms"] for t in timings) / n,
+		}
+
+	def close(self) -> None:
+		with self._lock:
+			for client in self._clients.values():
+				client.close()
+			self._clients.clear()
+
+
+_provider = ClientProvider()
+atexit.register(_provider.close)
+
+
+def get_provider() -> ClientProvider:
+	return _provider
+
+
+def get_client() -> "OpenAI":
+	return _provider.get()
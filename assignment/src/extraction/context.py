@@ -0,0 +1,149 @@
+from typing import Any, Dict, List, Optional, Tuple
+from functools import lru_cache
+import re
+
+from rapidfuzz import fuzz
+
+
+# Label words that sit on (or next to) the line holding a field's value
+FIELD_KEYWORDS: Dict[str, List[str]] = {
+	"InvoiceNumber": ["invoice", "inv", "receipt", "bill no", "doc no", "no.", "#"],
+	"Date": ["date", "dated", "time"],
+	"TotalAmount": ["total", "amount", "due", "balance", "grand", "rounding", "cash", "change"],
+	"VendorName": ["sdn bhd", "bhd", "ltd", "inc", "llc", "enterprise", "trading", "company", "store", "mart"],
+	"Address": ["address", "jalan", "jln", "road", "street", "taman", "lot", "no.", "floor"],
+	"PatientName": ["patient", "name"],
+	"DoctorName": ["dr", "doctor", "physician"],
+	"Medication": ["tab", "tablet", "mg", "capsule", "syrup"],
+	"Dosage": ["dose", "dosage", "mg", "daily", "times"],
+}
+# Fields a prompt without requested fields is expected to cover
+DOC_TYPE_FIELDS: Dict[str, List[str]] = {
+	"invoice": ["InvoiceNumber", "Date", "TotalAmount", "VendorName", "Address"],
+	"medical_bill": ["PatientName", "Date", "TotalAmount", "VendorName"],
+	"prescription": ["PatientName", "DoctorName", "Medication", "Dosage", "Date"],
+}
+# Value shapes: lines that look like they carry a date or an amount
+_DATE_RE = re.compile(r"\b\d{1,4}[-/.]\d{1,2}[-/.]\d{2,4}\b")
+_AMOUNT_RE = re.compile(r"\d[\d,]*\.\d{2}\b")
+_CAMEL_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+DEFAULT_CONTEXT_TOKENS = 3000
+# Lines at the top of the first page (vendor, address, document number) get a bonus
+HEADER_FRACTION = 0.2
+FUZZY_THRESHOLD = 85
+
+
+def estimate_tokens(text: str) -> int:
+	"""Rough token count (~4 characters per token for English/OCR text)."""
+	return (len(text) + 3) // 4
+
+
+def field_keywords(doc_type: str, requested_fields: Optional[List[str]]) -> List[str]:
+	"""Keywords for the requested fields (or the doc type's usual fields), lower-cased."""
+	names = requested_fields or DOC_TYPE_FIELDS.get(doc_type, DOC_TYPE_FIELDS["invoice"])
+	keywords: List[str] = []
+	for name in names:
+		words = FIELD_KEYWORDS.get(name) or [w.lower() for w in _CAMEL_RE.findall(name) if len(w) > 1]
+		for word in words:
+			if word not in keywords:
+				keywords.append(word)
+	return keywords
+
+
+@lru_cache(maxsize=64)
+def keyword_matcher(keywords: Tuple[str, ...]) -> "re.Pattern[str]":
+	"""One case-insensitive pattern finding every keyword as a whole word ("dr" not in "address").
+
+	Matches are zero-width lookaheads, so overlapping keywords ("sdn bhd", "bhd") are all found.
+	"""
+	phrases = sorted({" ".join(k.split()) for k in keywords if k.strip()}, key=len, reverse=True)
+	alternatives = [r"\s+".join(re.escape(word) for word in phrase.split()) for phrase in phrases]
+	return re.compile(r"(?<![a-z])(?=(" + "|".join(alternatives) + r")(?![a-z]))", re.IGNORECASE)
+
+
+def _line_score(text: str, keywords: List[str], matcher: "re.Pattern[str]") -> float:
+	found = {" ".join(m.group(1).lower().split()) for m in matcher.finditer(text)}
+	low = text.lower()
+	score = 0.0
+	for keyword in keywords:
+		if keyword in found:
+			score += 2.0
+		elif len(keyword) >= 4 and fuzz.partial_ratio(keyword, low) >= FUZZY_THRESHOLD:
+			# OCR noise ("T0TAL", "lnvoice")
+			score += 1.0
+	if _AMOUNT_RE.search(text):
+		score += 1.0
+	if _DATE_RE.search(text):
+		score += 1.0
+	return score
+
+
+def _page_lines(pages: List[Dict[str, Any]], ocr_text: str) -> List[Tuple[str, int, Optional[List[int]], float]]:
+	"""(text, page number, bbox, page height) per line in reading order."""
+	lines = []
+	for page in pages:
+		page_lines = page.get("lines") or []
+		height = max((ln["bbox"][3] for ln in page_lines), default=0)
+		for ln in page_lines:
+			if ln["text"].strip():
+				lines.append((ln["text"], page["page"], ln["bbox"], float(height)))
+	if not lines:
+		# No layout (e.g. cached plain text): rank raw text lines
+		lines = [(text, 1, None, 0.0) for text in ocr_text.splitlines() if text.strip()]
+	return lines
+
+
+def select_context(doc_type: str, ocr_text: str, pages: Optional[List[Dict[str, Any]]], requested_fields: Optional[List[str]], max_tokens: int = DEFAULT_CONTEXT_TOKENS) -> Dict[str, Any]:
+	"""Pick the OCR lines most relevant to the requested fields within a token budget.
+
+	Lines are scored by field keywords (whole words, or fuzzy for OCR noise), date/amount shapes and position
+	(header lines of the first page); a keyword line also lifts its neighbours, since
+	labels often sit above or beside their values. Selected lines keep reading order,
+	with "..." where lines were dropped.
+
+	Returns:
+		{"text", "input_tokens", "context_tokens", "lines_total", "lines_kept"}
+	"""
+	input_tokens = estimate_tokens(ocr_text)
+	lines = _page_lines(pages or [], ocr_text)
+	if input_tokens <= max_tokens:
+		return {"text": ocr_text, "input_tokens": input_tokens, "context_tokens": input_tokens, "lines_total": len(lines), "lines_kept": len(lines)}
+
+	keywords = field_keywords(doc_type, requested_fields)
+	matcher = keyword_matcher(tuple(keywords))
+	base = [_line_score(text, keywords, matcher) for text, _, _, _ in lines]
+	scores = list(base)
+	for i, (text, page_no, bbox, height) in enumerate(lines):
+		if page_no == 1 and bbox is not None and height and bbox[1] <= HEADER_FRACTION * height:
+			scores[i] += 1.5
+		elif page_no == 1 and bbox is None and i < 5:
+			scores[i] += 1.5
+		for j in (i - 1, i + 1):
+			if 0 <= j < len(lines) and lines[j][1] == page_no:
+				scores[i] += 0.5 * base[j]
+
+	# Highest score first; earlier lines win ties
+	order = sorted(range(len(lines)), key=lambda i: (-scores[i], i))
+	kept = set()
+	budget = max_tokens
+	for i in order:
+		cost = estimate_tokens(lines[i][0]) + 1
+		if cost > budget:
+			continue
+		kept.add(i)
+		budget -= cost
+		if budget <= 0:
+			break
+
+	parts: List[str] = []
+	prev = -1
+	for i in sorted(kept):
+		if i != prev + 1:
+			parts.append("...")
+		parts.append(lines[i][0])
+		prev = i
+	if prev != len(lines) - 1:
+		parts.append("...")
+	text = "\n".join(parts)
+	return {"text": text, "input_tokens": input_tokens, "context_tokens": estimate_tokens(text), "lines_total": len(lines), "lines_kept": len(kept)}
@@ -1,11 +1,20 @@
-from typing import List, Dict, Any, Optional
+from typing import TYPE_CHECKING, Callable, List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+import contextvars
 import os
-from tenacity import retry, stop_after_attempt, wait_exponential
-from pydantic import BaseModel, Field
+import threading
 
-from openai import OpenAI
+if TYPE_CHECKING:
+	from tenacity import RetryCallState
 
-from ..utils.json_utils import safe_json_loads, normalize_value, majority_vote
+from .client import get_client, get_provider
+from .context import DOC_TYPE_FIELDS, estimate_tokens
+from .rules import extract_with_rules
+from ..utils.json_utils import safe_json_loads, normalize_value, majority_vote, majority_settled
+from ..utils.tracing import get_tracer, current_span
+from ..confidence.ocr_index import OCRIndex
+from ..confidence.scoring import score_fields
 
 SYSTEM_PROMPT = (
 	"You are an expert document information extraction system. "
@@ -13,9 +22,46 @@ SYSTEM_PROMPT = (
 	"Return ONLY a JSON object with 'fields' as an array of {name, value}."
 )
 
+BATCH_SYSTEM_PROMPT = (
+	"You are an expert document information extraction system. "
+	"Given the OCR text of several documents, each marked with its id and type, extract key fields for every document. "
+	"Return ONLY a JSON object with 'documents' as an array of {id, fields}, where fields is an array of {name, value}."
+)
 
-class ExtractionSchema(BaseModel):
-	fields: List[Dict[str, Any]] = Field(default_factory=list)
+_FIELDS_JSON_SCHEMA = {
+	"type": "array",
+	"items": {
+		"type": "object",
+		"properties": {
+			"name": {"type": "string"},
+			"value": {"type": "string"}
+		},
+		"required": ["name", "value"]
+	}
+}
+EXTRACTION_JSON_SCHEMA = {
+	"type": "object",
+	"properties": {"fields": _FIELDS_JSON_SCHEMA},
+	"required": ["fields"]
+}
+# Results keyed by document id, so several documents share one request
+BATCH_JSON_SCHEMA = {
+	"type": "object",
+	"properties": {
+		"documents": {
+			"type": "array",
+			"items": {
+				"type": "object",
+				"properties": {
+					"id": {"type": "string"},
+					"fields": _FIELDS_JSON_SCHEMA
+				},
+				"required": ["id", "fields"]
+			}
+		}
+	},
+	"required": ["documents"]
+}
 
 
 def build_user_prompt(doc_type: str, ocr_text: str, requested_fields: Optional[List[str]]) -> str:
@@ -35,97 +81,168 @@ def build_user_prompt(doc_type: str, ocr_text: str, requested_fields: Optional[L
 	return "\n".join(base)
 
 
-def demo_extraction(doc_type: str, ocr_text: str, requested_fields: Optional[List[str]]) -> Dict[str, Any]:
-	"""Demo extraction without OpenAI API - uses simple heuristics."""
-	text_lower = ocr_text.lower()
-	fields = []
-	
-	# Common field patterns
-	patterns = {
-		"InvoiceNumber": [r"invoice.*?(\d+)", r"inv.*?(\d+)", r"#(\d+)"],
-		"Date": [r"(\d{4}[-/]\d{1,2}[-/]\d{1,2})", r"(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})"],
-		"TotalAmount": [r"total.*?[\$₹]?\s*([0-9,]+\.?[0-9]*)", r"amount.*?[\$₹]?\s*([0-9,]+\.?[0-9]*)"],
-		"VendorName": [r"vendor.*?([a-zA-Z\s]+)", r"company.*?([a-zA-Z\s]+)"],
-	}
-	
-	import re
-	for field_name, pattern_list in patterns.items():
-		value = ""
-		for pattern in pattern_list:
-			match = re.search(pattern, text_lower)
-			if match:
-				value = match.group(1).strip()
-				break
-		if value:
-			fields.append({"name": field_name, "value": value})
-	
+def build_batch_prompt(docs: List[Dict[str, Any]], requested_fields: Optional[List[str]]) -> str:
+	"""One prompt for several documents, each delimited by its id.
+
+	Args:
+		docs: {"id", "doc_type", "ocr_text"} per document
+	"""
+	base = [
+		"Instructions:",
+		"- Extract key-value fields typical for each document's type, separately for every document.",
+		"- If requested fields are provided, prioritize and include them.",
+		"- Keep values concise.",
+		"- If a field is not found, return an empty string value.",
+		"- Do not invent values or copy values between documents.",
+	]
+	if requested_fields:
+		base.append("Requested fields: " + ", ".join(requested_fields))
+	for doc in docs:
+		base.append(f"=== Document id: {doc['id']} (type: {doc['doc_type']}) ===\n" + doc["ocr_text"][:12000])
+	base.append("Output JSON shape: {\"documents\": [{\"id\": str, \"fields\": [{\"name\": str, \"value\": str}]}]}")
+	return "\n".join(base)
+
+
+def demo_extraction(doc_type: str, ocr_text: str, requested_fields: Optional[List[str]], pages: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+	"""Demo extraction without OpenAI API - uses the rule-based extractor."""
+	matches = extract_with_rules(doc_type, ocr_text, pages)
+	fields = [{"name": name, "value": match.value} for name, match in matches.items()]
+
 	# Add requested fields if not found
 	if requested_fields:
 		for field in requested_fields:
-			if not any(f["name"] == field for f in fields):
+			if field not in matches:
 				fields.append({"name": field, "value": ""})
-	
+
 	return {"fields": fields}
 
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=8))
-def call_openai(prompt: str, model: str, temperature: float) -> Dict[str, Any]:
+def llm_available() -> bool:
 	api_key = os.getenv("OPENAI_API_KEY")
-	if not api_key or api_key == "your-openai-api-key-here":
+	return bool(api_key) and api_key != "your-openai-api-key-here"
+
+
+# Process-wide cap on in-flight LLM requests, shared by all documents and votes
+MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY") or 4)
+_llm_slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+
+
+def set_max_concurrency(limit: int) -> None:
+	"""Change the in-flight LLM request cap for this process (e.g. from a worker initializer).
+
+	Call it before requests start: requests already holding a slot keep the old semaphore.
+	"""
+	global MAX_CONCURRENCY, _llm_slots
+	MAX_CONCURRENCY = max(1, limit)
+	_llm_slots = threading.BoundedSemaphore(MAX_CONCURRENCY)
+
+
+def _retry_after_seconds(exc: Optional[BaseException]) -> Optional[float]:
+	from openai import APIStatusError
+
+	if not isinstance(exc, APIStatusError):
+		return None
+	headers = exc.response.headers
+	try:
+		if headers.get("retry-after-ms"):
+			return float(headers["retry-after-ms"]) / 1000.0
+		if headers.get("retry-after"):
+			return float(headers["retry-after"])
+	except ValueError:
+		return None
+	return None
+
+
+@lru_cache(maxsize=None)
+def _backoff():
+	from tenacity import wait_exponential
+
+	return wait_exponential(multiplier=1, min=1, max=8)
+
+
+def wait_rate_limit(retry_state: "RetryCallState") -> float:
+	"""Honour the server's Retry-After on 429s, otherwise fall back to exponential backoff."""
+	from openai import RateLimitError
+
+	exc = retry_state.outcome.exception() if retry_state.outcome else None
+	retry_after = _retry_after_seconds(exc) if isinstance(exc, RateLimitError) else None
+	if retry_after is not None:
+		return min(retry_after, 60.0)
+	return _backoff()(retry_state)
+
+
+@lru_cache(maxsize=None)
+def _retrying_request():
+	# tenacity and openai are only imported once an LLM call is actually made
+	from tenacity import retry, stop_after_attempt
+
+	return retry(stop=stop_after_attempt(3), wait=wait_rate_limit)(_request_openai)
+
+
+def call_openai(prompt: str, model: str, temperature: float, system_prompt: str = SYSTEM_PROMPT, schema_name: str = "extraction_schema", schema: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+	return _retrying_request()(prompt, model, temperature, system_prompt, schema_name, schema)
+
+
+def _request_openai(prompt: str, model: str, temperature: float, system_prompt: str, schema_name: str, schema: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+	if not llm_available():
 		raise Exception("OpenAI API key not set. Please add your API key to .env file")
 	
-	client = OpenAI(api_key=api_key)
-	resp = client.responses.create(
-		model=model,
-		input=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
-		response_format={
-			"type": "json_schema",
-			"json_schema": {
-				"name": "extraction_schema",
-				"schema": {
-					"type": "object",
-					"properties": {
-						"fields": {
-							"type": "array",
-							"items": {
-								"type": "object",
-								"properties": {
-									"name": {"type": "string"},
-									"value": {"type": "string"}
-								},
-								"required": ["name", "value"]
-							}
-						}
-					},
-					"required": ["fields"]
-				}
-			}
-		},
-		temperature=temperature,
-	)
+	schema = schema or EXTRACTION_JSON_SCHEMA
+	client = get_client()
+	# Slots are held only while the request is in flight, never during backoff sleeps
+	with _llm_slots:
+		resp = client.responses.create(
+			model=model,
+			input=[{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}],
+			text={"format": {"type": "json_schema", "name": schema_name, "schema": schema}},
+			temperature=temperature,
+		)
+	if get_tracer().enabled:
+		span = current_span()
+		usage = getattr(resp, "usage", None)
+		if usage is not None:
+			span.set(input_tokens=getattr(usage, "input_tokens", None), output_tokens=getattr(usage, "output_tokens", None))
+		timing = get_provider().last_timing()
+		if timing is not None:
+			span.set(connect_ms=timing["connect_ms"], wait_ms=timing["wait_ms"], new_connection=timing["new_connection"])
 	content = resp.output[0].content[0].text if resp.output else "{}"
 	return safe_json_loads(content)
 
 
-def extract_fields(doc_type: str, ocr_text: str, requested_fields: Optional[List[str]], num_votes: int, temperature: float, model: str) -> Dict[str, Any]:
-	# Check if OpenAI API key is available
-	api_key = os.getenv("OPENAI_API_KEY")
-	if not api_key or api_key == "your-openai-api-key-here":
-		# Use demo mode
-		data = demo_extraction(doc_type, ocr_text, requested_fields)
-		fields = data.get("fields", [])
-		final = {f.get("name", ""): normalize_value(f.get("value", "")) for f in fields if f.get("name")}
-		votes_per_field = {name: [value] for name, value in final.items()}
-		return {"final": final, "votes": votes_per_field}
-	
-	# Use OpenAI
-	prompt = build_user_prompt(doc_type, ocr_text, requested_fields)
-	votes: List[Dict[str, str]] = []
-	for _ in range(max(1, num_votes)):
+def _vote(prompt: str, model: str, temperature: float, index: int = 0) -> Dict[str, str]:
+	with get_tracer().span("llm_vote", vote=index, prompt_chars=len(prompt)):
 		data = call_openai(prompt=prompt, model=model, temperature=temperature)
-		fields = data.get("fields", [])
-		votes.append({f.get("name", ""): normalize_value(f.get("value", "")) for f in fields if f.get("name")})
+	fields = data.get("fields", [])
+	return {f.get("name", ""): normalize_value(f.get("value", "")) for f in fields if f.get("name")}
+
+
+def collect_votes(prompt: str, model: str, temperature: float, num_votes: int, early_exit: bool = False, on_vote: Optional[Callable[[List[Dict[str, str]]], None]] = None) -> List[Dict[str, str]]:
+	"""Run self-consistency votes concurrently.
+
+	With early_exit, a quorum (num_votes // 2 + 1) is issued first and further votes
+	are only requested while the majority on some field can still change. on_vote
+	is called with the votes received so far each time one arrives.
+	"""
+	n = max(1, num_votes)
+	with ThreadPoolExecutor(max_workers=min(n, MAX_CONCURRENCY)) as pool:
+		first = n // 2 + 1 if early_exit else n
+		# Each vote runs in its own copy of the context so trace spans nest under the caller's
+		futures = {pool.submit(contextvars.copy_context().run, _vote, prompt, model, temperature, i): i for i in range(first)}
+		received: Dict[int, Dict[str, str]] = {}
+		for future in as_completed(futures):
+			received[futures[future]] = future.result()
+			if on_vote is not None:
+				on_vote([received[i] for i in sorted(received)])
+		votes = [received[i] for i in range(first)]
+		while len(votes) < n and not majority_settled(votes, remaining=n - len(votes)):
+			votes.append(pool.submit(contextvars.copy_context().run, _vote, prompt, model, temperature, len(votes)).result())
+			if on_vote is not None:
+				on_vote(list(votes))
+	return votes
+
 
+def aggregate_votes(votes: List[Dict[str, str]]) -> Dict[str, Any]:
+	"""Majority value per field over the votes; returns {"final", "votes"}."""
 	# Build union of field names
 	all_names: List[str] = []
 	for v in votes:
@@ -142,4 +259,183 @@ def extract_fields(doc_type: str, ocr_text: str, requested_fields: Optional[List
 		final[name] = winner
 		votes_per_field[name] = vals
 
-	return {"final": final, "votes": votes_per_field} 
\ No newline at end of file
+	return {"final": final, "votes": votes_per_field}
+
+
+def merge_prefill(extraction: Dict[str, Any], prefill: Dict[str, str]) -> Dict[str, Any]:
+	"""Overlay already-known field values (e.g. from rules) on an extraction result."""
+	for name, value in prefill.items():
+		extraction["final"][name] = value
+		extraction["votes"][name] = [value]
+	return extraction
+
+
+def extract_fields(doc_type: str, ocr_text: str, requested_fields: Optional[List[str]], num_votes: int, temperature: float, model: str, early_exit: bool = False, prefill: Optional[Dict[str, str]] = None, on_vote: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+	"""Extract fields by majority vote over LLM calls (or the demo extractor without a key).
+
+	prefill holds values already found by a cheaper pass; when every requested field
+	is prefilled no LLM call is made, otherwise only the missing ones are requested.
+	on_vote receives the running {"final", "votes"} after every LLM vote.
+	"""
+	prefill = prefill or {}
+	if requested_fields and all(name in prefill for name in requested_fields):
+		return merge_prefill({"final": {}, "votes": {}}, prefill)
+	if requested_fields and prefill:
+		requested_fields = [name for name in requested_fields if name not in prefill]
+
+	# Check if OpenAI API key is available
+	if not llm_available():
+		# Use demo mode
+		data = demo_extraction(doc_type, ocr_text, requested_fields)
+		fields = data.get("fields", [])
+		final = {f.get("name", ""): normalize_value(f.get("value", "")) for f in fields if f.get("name")}
+		votes_per_field = {name: [value] for name, value in final.items()}
+		return merge_prefill({"final": final, "votes": votes_per_field}, prefill)
+	
+	# Use OpenAI
+	prompt = build_user_prompt(doc_type, ocr_text, requested_fields)
+	partial = (lambda votes: on_vote(merge_prefill(aggregate_votes(votes), prefill))) if on_vote is not None else None
+	votes = collect_votes(prompt, model=model, temperature=temperature, num_votes=num_votes, early_exit=early_exit, on_vote=partial)
+	return merge_prefill(aggregate_votes(votes), prefill)
+
+
+# Rule results at or above this confidence are accepted without asking the LLM
+TIER_ACCEPT_CONFIDENCE = 0.85
+
+
+def _canonical(value: str) -> str:
+	return "".join(ch for ch in normalize_value(value).lower() if ch.isalnum() or ch == ".")
+
+
+def extract_fields_tiered(doc_type: str, ocr_text: str, requested_fields: Optional[List[str]], num_votes: int, temperature: float, model: str, pages: Optional[List[Dict[str, Any]]] = None, prompt_text: Optional[str] = None, accept_confidence: float = TIER_ACCEPT_CONFIDENCE) -> Dict[str, Any]:
+	"""Escalate per field: rules, then one LLM call, then extra votes only on disagreement.
+
+	Tier "rules": rule matches scored with score_fields (vote share replaced by the
+	rule's own score) and accepted at `accept_confidence`. Tier "llm": the remaining
+	fields are asked for in one call; the answer is accepted when there was no rule
+	candidate or it agrees with it. Tier "votes": fields where the LLM and the rules
+	disagree get num_votes - 1 more votes and a majority.
+
+	Args:
+		ocr_text: Full OCR text (rules and scoring); prompt_text is sent to the LLM (defaults to ocr_text)
+	Returns:
+		{"final", "votes", "tiers": {field: "rules" | "llm" | "votes"}}
+	"""
+	tracer = get_tracer()
+	expected = list(requested_fields or DOC_TYPE_FIELDS.get(doc_type, DOC_TYPE_FIELDS["invoice"]))
+	with tracer.span("tier_rules") as span:
+		matches = extract_with_rules(doc_type, ocr_text, pages)
+		scores = score_fields(
+			{name: [m.value] for name, m in matches.items()}, ocr_text=ocr_text, index=OCRIndex(ocr_text, pages),
+			vote_shares={name: m.score for name, m in matches.items()},
+		)
+		accepted = {name: m.value for name, m in matches.items() if scores[name] >= accept_confidence}
+		span.set(accepted=len(accepted))
+	final: Dict[str, str] = {}
+	votes_per_field: Dict[str, List[str]] = {}
+	tiers: Dict[str, str] = {}
+	for name in expected:
+		if name in accepted:
+			final[name], votes_per_field[name], tiers[name] = accepted[name], [accepted[name]], "rules"
+
+	pending = [name for name in expected if name not in accepted]
+	if not pending:
+		return {"final": final, "votes": votes_per_field, "tiers": tiers}
+	if not llm_available():
+		# Nothing to escalate to: keep the best rule guess (or empty) for the rest
+		for name in pending:
+			value = matches[name].value if name in matches else ""
+			final[name], votes_per_field[name], tiers[name] = value, [value], "rules"
+		return {"final": final, "votes": votes_per_field, "tiers": tiers}
+
+	text = ocr_text if prompt_text is None else prompt_text
+	prompt = build_user_prompt(doc_type, text, pending)
+	with tracer.span("tier_llm", fields=len(pending)):
+		first = collect_votes(prompt, model=model, temperature=temperature, num_votes=1)[0]
+	disputed: List[str] = []
+	for name in pending:
+		value = normalize_value(first.get(name, ""))
+		if name in matches and _canonical(matches[name].value) != _canonical(value):
+			disputed.append(name)
+			continue
+		final[name], votes_per_field[name], tiers[name] = value, [value], "llm"
+	# Fields the model added beyond the ones asked for
+	for name, value in first.items():
+		if name not in final and name not in disputed:
+			final[name], votes_per_field[name], tiers[name] = value, [value], "llm"
+
+	if disputed:
+		if num_votes > 1:
+			with tracer.span("tier_votes", fields=len(disputed)):
+				extra = collect_votes(build_user_prompt(doc_type, text, disputed), model=model, temperature=temperature, num_votes=num_votes - 1)
+		else:
+			extra = []
+		settled = aggregate_votes([first] + extra)
+		for name in disputed:
+			values = settled["votes"].get(name) or [""]
+			final[name], votes_per_field[name], tiers[name] = majority_vote(values), values, "votes" if extra else "llm"
+	return {"final": final, "votes": votes_per_field, "tiers": tiers}
+
+
+def plan_batches(docs: List[Dict[str, Any]], max_tokens: int, max_docs: int) -> List[List[Dict[str, Any]]]:
+	"""Greedily pack documents, in order, into batches under a prompt token budget.
+
+	A document larger than the budget gets a batch of its own.
+	"""
+	batches: List[List[Dict[str, Any]]] = []
+	current: List[Dict[str, Any]] = []
+	used = 0
+	for doc in docs:
+		# Delimiter line plus the (prompt-capped) OCR text
+		cost = estimate_tokens(doc["ocr_text"][:12000]) + 16
+		if current and (used + cost > max_tokens or len(current) >= max_docs):
+			batches.append(current)
+			current, used = [], 0
+		current.append(doc)
+		used += cost
+	if current:
+		batches.append(current)
+	return batches
+
+
+def _batch_vote(prompt: str, model: str, temperature: float, index: int = 0, size: int = 0) -> Dict[str, Dict[str, str]]:
+	with get_tracer().span("llm_vote", vote=index, prompt_chars=len(prompt), batch_docs=size):
+		data = call_openai(prompt=prompt, model=model, temperature=temperature, system_prompt=BATCH_SYSTEM_PROMPT, schema_name="batch_extraction_schema", schema=BATCH_JSON_SCHEMA)
+	out: Dict[str, Dict[str, str]] = {}
+	for doc in data.get("documents", []):
+		fields = doc.get("fields", [])
+		out[str(doc.get("id", ""))] = {f.get("name", ""): normalize_value(f.get("value", "")) for f in fields if f.get("name")}
+	return out
+
+
+def extract_fields_batch(docs: List[Dict[str, Any]], requested_fields: Optional[List[str]], num_votes: int, temperature: float, model: str, max_batch_tokens: int = 6000, max_batch_docs: int = 8) -> Dict[str, Dict[str, Any]]:
+	"""Extract fields for many short documents with several documents per request.
+
+	Args:
+		docs: {"id", "doc_type", "ocr_text"} per document; ids must be unique
+	Returns:
+		{id: {"final", "votes"}} — the same per-document structure as extract_fields
+	"""
+	if not llm_available():
+		return {doc["id"]: extract_fields(doc["doc_type"], doc["ocr_text"], requested_fields, num_votes, temperature, model) for doc in docs}
+
+	batches = plan_batches(docs, max_batch_tokens, max_batch_docs)
+	n = max(1, num_votes)
+	# Every vote of every batch is in flight at once, bounded by the shared LLM slots
+	with ThreadPoolExecutor(max_workers=min(len(batches) * n, MAX_CONCURRENCY)) as pool:
+		futures = []
+		for batch in batches:
+			prompt = build_batch_prompt(batch, requested_fields)
+			futures.append((batch, [pool.submit(contextvars.copy_context().run, _batch_vote, prompt, model, temperature, i, len(batch)) for i in range(n)]))
+		results: Dict[str, Dict[str, Any]] = {}
+		for batch, vote_futures in futures:
+			votes = [f.result() for f in vote_futures]
+			for doc in batch:
+				doc_votes = [v[doc["id"]] for v in votes if doc["id"] in v]
+				if doc_votes:
+					results[doc["id"]] = aggregate_votes(doc_votes)
+	# Documents the model dropped from every batched answer are retried on their own
+	for doc in docs:
+		if doc["id"] not in results:
+			results[doc["id"]] = extract_fields(doc["doc_type"], doc["ocr_text"], requested_fields, num_votes, temperature, model)
+	return results
@@ -0,0 +1,189 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+import os
+import threading
+
+from ..ingest.columnar import WordColumns, page_words, word_boxes, word_texts
+from ..utils.json_utils import normalize_value
+from ..utils.tracing import get_tracer
+
+
+# The SROIE token-classification checkpoint shipped under data/; torch and transformers
+# are optional and only imported when the engine is first built
+DEFAULT_MODEL_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "..", "data", "sroie", "SROIE2019", "layoutlm-base-uncased")
+# Entity part of the checkpoint's labels (B-COMPANY, I-TOTAL, ...) -> pipeline field
+ENTITY_FIELDS = {"COMPANY": "VendorName", "DATE": "Date", "ADDRESS": "Address", "TOTAL": "TotalAmount"}
+# Doc types the checkpoint was trained on; others go to the regular extractor
+LAYOUTLM_DOC_TYPES = ("invoice",)
+
+
+def _entity(label: str) -> Optional[str]:
+	# "B-TOTAL" / "I-TOTAL" / "S-TOTAL" / "TOTAL" -> "TOTAL"; "O" -> None
+	name = label.split("-", 1)[1] if len(label) > 2 and label[1] == "-" else label
+	return name.upper() if name.upper() in ENTITY_FIELDS else None
+
+
+def normalize_boxes(page: Dict[str, Any]) -> List[List[int]]:
+	"""Word bboxes scaled to LayoutLM's 0-1000 grid.
+
+	Ingest records each page's size ("width" / "height"); pages without one (e.g.
+	cached before sizes were kept) fall back to the extent of their words.
+	"""
+	words = word_boxes(page_words(page))
+	width = page.get("width") or max((b[2] for b in words), default=1)
+	height = page.get("height") or max((b[3] for b in words), default=1)
+	boxes = []
+	for x1, y1, x2, y2 in words:
+		boxes.append([
+			max(0, min(1000, int(1000 * x1 / width))), max(0, min(1000, int(1000 * y1 / height))),
+			max(0, min(1000, int(1000 * x2 / width))), max(0, min(1000, int(1000 * y2 / height))),
+		])
+	return boxes
+
+
+class LayoutLMEngine:
+	"""LayoutLM token classification on CPU over OCR words and boxes.
+
+	Pages of many documents are tokenized together, split into max_length windows
+	(overlapping by `stride` tokens) and run in batches of `batch_size`. With
+	`quantize` the Linear layers use dynamic int8 quantization; `num_threads` caps
+	torch's intra-op threads for this process.
+	"""
+
+	def __init__(self, model_dir: str = DEFAULT_MODEL_DIR, quantize: bool = False, num_threads: Optional[int] = None, batch_size: int = 8, max_length: int = 512, stride: int = 64):
+		import torch
+		from transformers import AutoTokenizer, LayoutLMForTokenClassification
+
+		if num_threads:
+			torch.set_num_threads(num_threads)
+		self.torch = torch
+		self.batch_size = batch_size
+		self.max_length = max_length
+		self.stride = stride
+		self.tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+		model = LayoutLMForTokenClassification.from_pretrained(model_dir)
+		model.eval()
+		if quantize:
+			model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+		self.model = model
+		self.labels = [model.config.id2label[i] for i in range(len(model.config.id2label))]
+		self._entities = [_entity(label) for label in self.labels]
+		if not any(self._entities):
+			raise ValueError(f"{model_dir} has no token-classification labels for {', '.join(ENTITY_FIELDS)}")
+
+	def predict_words(self, pages: List[Dict[str, Any]]) -> List[List[Tuple[Optional[str], float]]]:
+		"""(entity or None, probability) for every word of every page."""
+		torch = self.torch
+		texts = [word_texts(page_words(page)) or [""] for page in pages]
+		encoding = self.tokenizer(
+			texts, is_split_into_words=True, truncation=True, max_length=self.max_length, stride=self.stride,
+			return_overflowing_tokens=True, padding="max_length", return_tensors="pt",
+		)
+		owners = encoding.pop("overflow_to_sample_mapping").tolist()
+		page_boxes = [normalize_boxes(page) for page in pages]
+		bbox = torch.zeros(encoding["input_ids"].shape + (4,), dtype=torch.long)
+		word_ids = [encoding.word_ids(i) for i in range(len(owners))]
+		for i, ids in enumerate(word_ids):
+			for t, word in enumerate(ids):
+				if word is not None and page_boxes[owners[i]]:
+					bbox[i, t] = torch.tensor(page_boxes[owners[i]][word])
+				elif encoding["input_ids"][i, t] == self.tokenizer.sep_token_id:
+					bbox[i, t] = torch.tensor([1000, 1000, 1000, 1000])
+
+		best: List[List[Tuple[Optional[str], float]]] = [[(None, 0.0)] * len(page_words(page)) for page in pages]
+		with torch.inference_mode():
+			for start in range(0, len(owners), self.batch_size):
+				rows = slice(start, start + self.batch_size)
+				logits = self.model(
+					input_ids=encoding["input_ids"][rows], attention_mask=encoding["attention_mask"][rows],
+					token_type_ids=encoding.get("token_type_ids", torch.zeros_like(encoding["input_ids"]))[rows], bbox=bbox[rows],
+				).logits
+				probs, labels = logits.softmax(-1).max(-1)
+				for offset in range(logits.shape[0]):
+					i = start + offset
+					seen = set()
+					for t, word in enumerate(word_ids[i]):
+						# A word is labelled by its first sub-token; overlapping windows keep the surer one
+						if word is None or word in seen:
+							continue
+						seen.add(word)
+						prob = float(probs[offset, t])
+						if prob > best[owners[i]][word][1]:
+							best[owners[i]][word] = (self._entities[int(labels[offset, t])], prob)
+		return best
+
+	def extract(self, docs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Tuple[str, float]]]:
+		"""Best span per field for each document.
+
+		Args:
+			docs: {"id", "pages"} per document; pages are ocr_pages page dicts with words
+		Returns:
+			{id: {field: (value, mean word probability)}}
+		"""
+		flat: List[Tuple[str, Dict[str, Any]]] = [(doc["id"], page) for doc in docs for page in doc["pages"] if len(page_words(page))]
+		results: Dict[str, Dict[str, Tuple[str, float]]] = {doc["id"]: {} for doc in docs}
+		if not flat:
+			return results
+		predictions = self.predict_words([page for _, page in flat])
+		for (doc_id, page), labels in zip(flat, predictions):
+			found = results[doc_id]
+			for entity, words, score in _spans(page_words(page), labels):
+				field = ENTITY_FIELDS[entity]
+				if field not in found or score > found[field][1]:
+					found[field] = (normalize_value(" ".join(words)), score)
+		return results
+
+
+def _spans(words: Union[List[Dict[str, Any]], WordColumns], labels: List[Tuple[Optional[str], float]]) -> List[Tuple[str, List[str], float]]:
+	"""Runs of consecutive words with the same entity, with their mean probability."""
+	spans: List[Tuple[str, List[str], float]] = []
+	current: Optional[str] = None
+	texts: List[str] = []
+	probs: List[float] = []
+	for text, (entity, prob) in list(zip(word_texts(words), labels)) + [("", (None, 0.0))]:
+		if entity != current and current is not None:
+			spans.append((current, texts, sum(probs) / len(probs)))
+		if entity != current:
+			texts, probs = [], []
+		current = entity
+		if entity is not None:
+			texts.append(text)
+			probs.append(prob)
+	return spans
+
+
+_engines: Dict[Tuple[str, bool, Optional[int], int], LayoutLMEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(model_dir: Optional[str] = None, quantize: Optional[bool] = None, num_threads: Optional[int] = None, batch_size: Optional[int] = None) -> LayoutLMEngine:
+	"""Engine shared by the whole process (one model load per worker); unset options come from LAYOUTLM_* env vars."""
+	key = (
+		model_dir or os.getenv("LAYOUTLM_MODEL_DIR") or DEFAULT_MODEL_DIR,
+		quantize if quantize is not None else os.getenv("LAYOUTLM_QUANTIZE", "").lower() in ("1", "true", "yes"),
+		num_threads or int(os.getenv("LAYOUTLM_THREADS") or 0) or None,
+		batch_size or int(os.getenv("LAYOUTLM_BATCH_SIZE") or 8),
+	)
+	with _engines_lock:
+		if key not in _engines:
+			_engines[key] = LayoutLMEngine(key[0], quantize=key[1], num_threads=key[2], batch_size=key[3])
+		return _engines[key]
+
+
+def extract_fields_layoutlm(docs: List[Dict[str, Any]], requested_fields: Optional[List[str]]) -> Dict[str, Dict[str, Any]]:
+	"""LayoutLM extraction for many documents in shared batches.
+
+	Args:
+		docs: {"id", "pages"} per document
+	Returns:
+		{id: {"final", "votes"}} — the structure of extract_fields; requested fields
+		the model did not find are returned empty
+	"""
+	with get_tracer().span("layoutlm", documents=len(docs), pages=sum(len(doc["pages"]) for doc in docs)):
+		found = get_engine().extract(docs)
+	results: Dict[str, Dict[str, Any]] = {}
+	for doc in docs:
+		final = {name: value for name, (value, _) in found[doc["id"]].items() if not requested_fields or name in requested_fields}
+		for name in requested_fields or []:
+			final.setdefault(name, "")
+		results[doc["id"]] = {"final": final, "votes": {name: [value] for name, value in final.items()}}
+	return results
@@ -0,0 +1,233 @@
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+import re
+
+
+@dataclass
+class FieldRule:
+	"""One way of finding a field.
+
+	With a `label`, the value is looked for right after the label on the same line,
+	then in the lines to the right of / below the label (by word bboxes). Without a
+	label, every match of `value` anywhere in the text is a candidate. `value` may
+	use a named group "value"; otherwise the whole match is the value.
+	"""
+	field: str
+	value: str
+	label: Optional[str] = None
+	score: float = 1.0
+	# Which candidate wins when a rule matches several times: "first", "last" or "max" (numeric)
+	prefer: str = "first"
+
+
+@dataclass
+class RuleMatch:
+	field: str
+	value: str
+	score: float
+	page: Optional[int] = None
+	bbox: Optional[List[int]] = None
+
+
+_AMOUNT = r"(?P<value>[\$₹]?\s?(?:RM\s?)?\d[\d,]*\.\d{2})\b"
+_DATE = r"(?P<value>\b(?:\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}|\d{1,2}\s+(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s+\d{2,4})\b)"
+
+COMMON_RULES: List[FieldRule] = [
+	FieldRule("Date", _DATE, label=r"\b(?:invoice\s+|bill\s+|receipt\s+)?date(?:d)?\b|\btarikh\b", score=0.9),
+	FieldRule("Date", _DATE, score=0.6),
+]
+# Doc type -> rules, extended with register_rule
+RULES: Dict[str, List[FieldRule]] = {
+	"invoice": [
+		FieldRule("InvoiceNumber", r"^[\s:#.]*(?P<value>[A-Z0-9][A-Z0-9/-]*\d[A-Z0-9/-]*)", label=r"\b(?:invoice|inv|receipt|bill|doc(?:ument)?|cs|tax\s+invoice)\s*(?:no\b\.?|number|num\b|#)", score=0.9),
+		FieldRule("InvoiceNumber", r"#\s?(?P<value>\d{3,})", score=0.5),
+		FieldRule("TotalAmount", r"^[^\n]*?" + _AMOUNT, label=r"\b(?:grand\s+total|total\s+amount|amount\s+due|balance\s+due|nett?\s+total|total)\b", score=0.9, prefer="max"),
+		FieldRule("VendorName", r"^(?P<value>[^\n]*\b(?:sdn\.?\s?bhd|bhd|ltd|limited|inc|llc|enterprise|trading|restaurant|store|mart)\b\.?)", score=0.8),
+		FieldRule("VendorName", r"^(?:vendor|company|from)\s*[:\-]?\s*(?P<value>[a-z][^\n]{2,})$", score=0.7),
+		FieldRule("Address", r"^(?P<value>[^\n]*\b(?:jalan|jln|taman|lorong|road|street|avenue|blvd)\b[^\n]*)$", score=0.6),
+	],
+	"medical_bill": [
+		FieldRule("TotalAmount", r"^[^\n]*?" + _AMOUNT, label=r"\b(?:total|amount\s+due|balance\s+due|net\s+payable)\b", score=0.9, prefer="max"),
+		FieldRule("PatientName", r"^[\s:]*(?P<value>[a-z][a-z .'-]{2,})", label=r"\bpatient(?:\s+name)?\b", score=0.8),
+	],
+	"prescription": [
+		FieldRule("PatientName", r"^[\s:]*(?P<value>[a-z][a-z .'-]{2,})", label=r"\b(?:patient|name)\b", score=0.7),
+		FieldRule("DoctorName", r"(?P<value>\bdr\.?\s+[a-z][a-z .'-]{2,})", score=0.7),
+	],
+}
+
+_NUMBER_RE = re.compile(r"[\d,]*\.?\d+")
+
+
+def register_rule(doc_type: str, rule: FieldRule) -> None:
+	"""Add a custom field rule for a doc type ("*" for every doc type)."""
+	if doc_type == "*":
+		COMMON_RULES.append(rule)
+	else:
+		RULES.setdefault(doc_type, []).append(rule)
+	_extractors.clear()
+
+
+def _numeric(value: str) -> float:
+	match = _NUMBER_RE.search(value.replace(" ", ""))
+	try:
+		return float(match.group(0).replace(",", "")) if match else 0.0
+	except ValueError:
+		return 0.0
+
+
+class RuleExtractor:
+	"""All label rules of a doc type compiled into a single matcher.
+
+	One case-insensitive scan of the document finds every label at once; a label
+	hit then resolves its value from the rest of its line or from nearby lines.
+	Label-free rules are scanned one by one: their values can span a whole line
+	(vendor names, addresses), and in a shared alternation they would swallow the
+	labels of other rules on that line.
+	"""
+
+	def __init__(self, rules: List[FieldRule]):
+		self.rules = rules
+		alternatives = []
+		self._value_res: List["re.Pattern[str]"] = []
+		for i, rule in enumerate(rules):
+			if rule.label:
+				alternatives.append(f"(?P<r{i}>{rule.label})")
+				self._value_res.append(re.compile(rule.value, re.IGNORECASE))
+			else:
+				self._value_res.append(re.compile(rule.value, re.IGNORECASE | re.MULTILINE))
+		self.matcher = re.compile("|".join(alternatives), re.IGNORECASE | re.MULTILINE) if alternatives else None
+		self._group_rule = {f"r{i}": i for i, rule in enumerate(rules) if rule.label}
+		self._free = [i for i, rule in enumerate(rules) if not rule.label]
+
+	def candidates(self, text: str, pages: Optional[List[Dict[str, Any]]] = None) -> Dict[str, List[Tuple[RuleMatch, int]]]:
+		"""Every candidate per field in text order, with the index of the rule that produced it."""
+		line_starts, line_refs = _line_table(text, pages)
+		hits: List[Tuple[int, int, RuleMatch]] = []
+		if self.matcher is not None:
+			for match in self.matcher.finditer(text):
+				# The rule's outer group closes last, so it is always lastgroup
+				i = self._group_rule[match.lastgroup]
+				hit = self._resolve_label(i, text, match.end(), _line_at(line_starts, match.start()), line_refs)
+				if hit is not None:
+					value, score, page, line = hit
+					hits.append((match.start(), i, RuleMatch(self.rules[i].field, value.strip(), score, page, list(line["bbox"]) if line else None)))
+		for i in self._free:
+			rule, value_re = self.rules[i], self._value_res[i]
+			for match in value_re.finditer(text):
+				line_no = _line_at(line_starts, match.start())
+				page, line = line_refs[line_no] if line_no < len(line_refs) else (None, None)
+				value = match.group("value") if "value" in value_re.groupindex else match.group(0)
+				hits.append((match.start(), i, RuleMatch(rule.field, value.strip(), rule.score, page, list(line["bbox"]) if line else None)))
+		found: Dict[str, List[Tuple[RuleMatch, int]]] = {}
+		for _, i, hit in sorted(hits, key=lambda item: item[:2]):
+			if hit.value:
+				found.setdefault(hit.field, []).append((hit, i))
+		return found
+
+	def _resolve_label(self, i: int, text: str, end: int, line_no: int, line_refs: List[Tuple[Optional[int], Optional[Dict[str, Any]]]]) -> Optional[Tuple[str, float, Optional[int], Optional[Dict[str, Any]]]]:
+		rule = self.rules[i]
+		value_re = self._value_res[i]
+		line_end = text.find("\n", end)
+		rest = text[end:] if line_end < 0 else text[end:line_end]
+		page, line = line_refs[line_no] if line_no < len(line_refs) else (None, None)
+		m = value_re.search(rest)
+		if m:
+			return (m.group("value") if "value" in value_re.groupindex else m.group(0)), rule.score, page, line
+		if line is None:
+			return None
+		# Proximity: values printed right of or below their label
+		for near_page, near in _nearby_lines(line, page, line_refs):
+			m = value_re.search(near["text"])
+			if m:
+				return (m.group("value") if "value" in value_re.groupindex else m.group(0)), rule.score * 0.8, near_page, near
+		return None
+
+	def extract(self, text: str, pages: Optional[List[Dict[str, Any]]] = None) -> Dict[str, RuleMatch]:
+		"""Best candidate per field: highest rule score, then the rule's `prefer` order."""
+		best: Dict[str, RuleMatch] = {}
+		for field, items in self.candidates(text, pages).items():
+			top = max(m.score for m, _ in items)
+			items = [(m, i) for m, i in items if m.score == top]
+			prefer = self.rules[items[0][1]].prefer
+			if prefer == "last":
+				best[field] = items[-1][0]
+			elif prefer == "max":
+				best[field] = max(items, key=lambda item: _numeric(item[0].value))[0]
+			else:
+				best[field] = items[0][0]
+		return best
+
+
+def _line_table(text: str, pages: Optional[List[Dict[str, Any]]]) -> Tuple[List[int], List[Tuple[Optional[int], Optional[Dict[str, Any]]]]]:
+	"""Start offset of every text line, and the OCR line (page, line dict) behind each one.
+
+	Page text is its lines joined by newlines with blank lines between paragraphs, so
+	non-blank text lines map one-to-one onto the pages' "lines" in order.
+	"""
+	starts = [0]
+	pos = text.find("\n")
+	while pos >= 0:
+		starts.append(pos + 1)
+		pos = text.find("\n", pos + 1)
+	ocr_lines = [(page["page"], ln) for page in (pages or []) for ln in page.get("lines", [])]
+	refs: List[Tuple[Optional[int], Optional[Dict[str, Any]]]] = []
+	k = 0
+	for n, start in enumerate(starts):
+		end = starts[n + 1] - 1 if n + 1 < len(starts) else len(text)
+		if text[start:end].strip() and k < len(ocr_lines):
+			refs.append(ocr_lines[k])
+			k += 1
+		else:
+			refs.append((None, None))
+	if k != len(ocr_lines):
+		# Text does not come from these pages (e.g. a context-selected prompt): no positions
+		refs = [(None, None)] * len(starts)
+	return starts, refs
+
+
+def _line_at(starts: List[int], offset: int) -> int:
+	lo, hi = 0, len(starts) - 1
+	while lo < hi:
+		mid = (lo + hi + 1) // 2
+		if starts[mid] <= offset:
+			lo = mid
+		else:
+			hi = mid - 1
+	return lo
+
+
+def _nearby_lines(line: Dict[str, Any], page: Optional[int], line_refs: List[Tuple[Optional[int], Optional[Dict[str, Any]]]]) -> List[Tuple[Optional[int], Dict[str, Any]]]:
+	"""Lines on the label's page to its right (same row) or just below it, nearest first."""
+	x1, y1, x2, y2 = line["bbox"]
+	height = max(1, y2 - y1)
+	scored = []
+	for other_page, other in line_refs:
+		if other is None or other is line or other_page != page:
+			continue
+		ox1, oy1, ox2, oy2 = other["bbox"]
+		centre = (oy1 + oy2) / 2.0
+		if y1 <= centre <= y2 and ox1 >= x2 - height:
+			scored.append((ox1 - x2, other_page, other))
+		elif 0 <= oy1 - y2 <= 2 * height and ox1 < x2 and ox2 > x1:
+			scored.append((height + (oy1 - y2), other_page, other))
+	scored.sort(key=lambda item: item[0])
+	return [(p, ln) for _, p, ln in scored[:3]]
+
+
+_extractors: Dict[str, RuleExtractor] = {}
+
+
+def get_extractor(doc_type: str) -> RuleExtractor:
+	"""Compiled extractor for a doc type (built once, rebuilt after register_rule)."""
+	if doc_type not in _extractors:
+		_extractors[doc_type] = RuleExtractor(RULES.get(doc_type, RULES["invoice"]) + COMMON_RULES)
+	return _extractors[doc_type]
+
+
+def extract_with_rules(doc_type: str, text: str, pages: Optional[List[Dict[str, Any]]] = None, requested_fields: Optional[List[str]] = None) -> Dict[str, RuleMatch]:
+	"""Rule-based field values for a document; only requested fields when given."""
+	matches = get_extractor(doc_type).extract(text, pages)
+	if requested_fields:
+		return {name: matches[name] for name in requested_fields if name in matches}
+	return matches
@@ -14,6 +14,7 @@ class FieldItem(BaseModel):
 	value: Optional[str] = None
 	confidence: float = 0.0
 	source: Optional[Dict[str, Any]] = None
+	tier: Optional[str] = None
 
 
 class ExtractionResult(BaseModel):
@@ -0,0 +1,256 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from abc import ABC, abstractmethod
+import importlib.util
+import os
+import struct
+
+from .options import PreprocessOptions
+
+
+class OCRBackend(ABC):
+	"""A source of page dicts (the ocr_pages structure) for an uploaded document.
+
+	`cost` is the expected relative cost per page; the runner tries the cheapest
+	available backends first. `ingest` returns None when the backend cannot give a
+	good enough result for this document, so the next backend is tried. Backends
+	with `auto_select = False` are only used when named explicitly.
+	"""
+
+	name = ""
+	cost = 0.0
+	auto_select = True
+
+	def available(self) -> bool:
+		return True
+
+	def supports(self, filename: str) -> bool:
+		return True
+
+	def cache_key(self, filename: str) -> Optional[str]:
+		"""What the output depends on besides the file content and ingest options (part of the ingest cache key)."""
+		return None
+
+	@abstractmethod
+	def ingest(self, file_bytes: bytes, filename: str, dpi: int = 200, ocr_workers: int = 1, use_text_layer: bool = True, max_pages: Optional[int] = None, preprocess: Optional[PreprocessOptions] = None) -> Optional[Dict[str, Any]]:
+		"""The ocr_pages structure for the document, or None to leave it to the next backend."""
+
+
+class TesseractBackend(OCRBackend):
+	"""Renders and OCRs pages with Tesseract, reading PDF text layers per page when allowed."""
+
+	name = "tesseract"
+	cost = 100.0
+
+	def available(self) -> bool:
+		return importlib.util.find_spec("pytesseract") is not None
+
+	def ingest(self, file_bytes: bytes, filename: str, dpi: int = 200, ocr_workers: int = 1, use_text_layer: bool = True, max_pages: Optional[int] = None, preprocess: Optional[PreprocessOptions] = None) -> Optional[Dict[str, Any]]:
+		from .document import ingest_document
+
+		return ingest_document(file_bytes, filename, dpi=dpi, ocr_workers=ocr_workers, use_text_layer=use_text_layer, max_pages=max_pages, preprocess=preprocess)
+
+
+class TextLayerBackend(OCRBackend):
+	"""PDFs with an embedded text layer.
+
+	Pages whose text layer is usable are read directly; when only some are, the
+	rest are OCR'd with Tesseract page by page (the pages already read are kept).
+	Without Tesseract such a PDF is left to the next backend.
+	"""
+
+	name = "text_layer"
+	cost = 1.0
+
+	def supports(self, filename: str) -> bool:
+		return filename.lower().endswith(".pdf")
+
+	def ingest(self, file_bytes: bytes, filename: str, dpi: int = 200, ocr_workers: int = 1, use_text_layer: bool = True, max_pages: Optional[int] = None, preprocess: Optional[PreprocessOptions] = None) -> Optional[Dict[str, Any]]:
+		if not use_text_layer:
+			return None
+		import fitz  # PyMuPDF
+
+		from .document import _text_layer_page, iter_pdf_pages
+
+		text_pages: Dict[int, Dict[str, Any]] = {}
+		with fitz.open(stream=file_bytes, filetype="pdf") as doc:
+			count = len(doc) if max_pages is None else min(len(doc), max_pages)
+			for page_index in range(count):
+				page = _text_layer_page(doc, page_index, dpi)
+				if page is not None:
+					text_pages[page_index] = page
+		if len(text_pages) == count:
+			pages = [text_pages[i] for i in range(count)]
+		elif text_pages and TesseractBackend().available():
+			# Mixed PDF: only the pages without a usable text layer are rendered and OCR'd
+			pages = list(iter_pdf_pages(file_bytes, dpi=dpi, ocr_workers=ocr_workers, use_text_layer=False, max_pages=max_pages, preprocess=preprocess, known_pages=text_pages))
+		else:
+			return None
+		return {"pages": pages, "full_text": "\n".join(p["text"] for p in pages)}
+
+
+def parse_box_line(line: str) -> Optional[Tuple[List[int], str]]:
+	"""Parse one SROIE box line: x1,y1,x2,y2,x3,y3,x4,y4,text (the text may contain commas)."""
+	parts = line.rstrip("\r\n").split(",", 8)
+	if len(parts) < 9:
+		return None
+	try:
+		coords = [int(float(c)) for c in parts[:8]]
+	except ValueError:
+		return None
+	xs, ys = coords[0::2], coords[1::2]
+	return [min(xs), min(ys), max(xs), max(ys)], parts[8].strip()
+
+
+def _split_words(bbox: List[int], text: str) -> List[Tuple[str, List[int]]]:
+	"""Share a line box between its words in proportion to their character counts."""
+	tokens = text.split()
+	total = sum(len(t) for t in tokens) + max(0, len(tokens) - 1)
+	width = bbox[2] - bbox[0]
+	words: List[Tuple[str, List[int]]] = []
+	pos = 0
+	for token in tokens:
+		x1 = bbox[0] + int(width * pos / total)
+		pos += len(token)
+		x2 = bbox[0] + int(round(width * pos / total))
+		words.append((token, [x1, bbox[1], max(x1 + 1, x2), bbox[3]]))
+		pos += 1
+	return words
+
+
+def _stem(filename: str) -> str:
+	return os.path.splitext(os.path.basename(filename))[0]
+
+
+# JPEG start-of-frame markers (the frame header holds the image size)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _image_size(data: bytes) -> Optional[Tuple[int, int]]:
+	"""(width, height) from a PNG or JPEG header, without decoding (or importing PIL); None otherwise."""
+	if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+		width, height = struct.unpack(">II", data[16:24])
+		return width, height
+	if data[:2] != b"\xff\xd8":
+		return None
+	pos = 2
+	while pos + 4 <= len(data) and data[pos] == 0xFF:
+		marker = data[pos + 1]
+		if marker == 0xFF:
+			# Fill byte
+			pos += 1
+			continue
+		if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+			pos += 2
+			continue
+		if marker in _JPEG_SOF and pos + 9 <= len(data):
+			height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+			return width, height
+		pos += 2 + struct.unpack(">H", data[pos + 2:pos + 4])[0]
+	return None
+
+
+class PrecomputedBackend(OCRBackend):
+	"""Reads existing line boxes (SROIE `box/<name>.txt`) instead of running OCR.
+
+	Looks for `<stem>.txt` in each directory; boxes are in the original image's pixels.
+	Files are matched by name only, so an unrelated upload that happens to share a
+	stem would get another document's text: "auto" never picks this backend.
+	"""
+
+	name = "precomputed"
+	cost = 0.01
+	auto_select = False
+
+	def __init__(self, directories: Optional[List[str]] = None):
+		if directories is None:
+			directories = [d for d in (os.getenv("PRECOMPUTED_OCR_DIRS") or "").split(os.pathsep) if d]
+		self.directories = directories
+
+	def available(self) -> bool:
+		return bool(self.directories)
+
+	def cache_key(self, filename: str) -> Optional[str]:
+		# The box file is picked by name, so identical uploads under other names differ
+		return _stem(filename)
+
+	def find(self, filename: str) -> Optional[str]:
+		stem = _stem(filename)
+		for directory in self.directories:
+			path = os.path.join(directory, stem + ".txt")
+			if os.path.isfile(path):
+				return path
+		return None
+
+	def ingest(self, file_bytes: bytes, filename: str, dpi: int = 200, ocr_workers: int = 1, use_text_layer: bool = True, max_pages: Optional[int] = None, preprocess: Optional[PreprocessOptions] = None) -> Optional[Dict[str, Any]]:
+		from .ocr import assemble_page
+
+		path = self.find(filename)
+		if path is None:
+			return None
+		entries = []
+		with open(path, "r", encoding="utf-8", errors="replace") as fh:
+			for line_no, line in enumerate(fh):
+				parsed = parse_box_line(line)
+				if parsed is None or not parsed[1]:
+					continue
+				for text, bbox in _split_words(*parsed):
+					# One paragraph per file so lines are joined without blank lines
+					entries.append((text, bbox, 100.0, (1, 1, line_no)))
+		if not entries:
+			# e.g. an un-fetched git-lfs pointer file
+			return None
+		page = assemble_page(0, entries, _image_size(file_bytes))
+		page["source"] = "precomputed"
+		return {"pages": [page], "full_text": page["text"]}
+
+
+# Factories are only called on first use, so optional engines cost nothing until picked
+_FACTORIES: Dict[str, Callable[[], OCRBackend]] = {
+	"precomputed": PrecomputedBackend,
+	"text_layer": TextLayerBackend,
+	"tesseract": TesseractBackend,
+}
+_instances: Dict[str, OCRBackend] = {}
+
+
+def register_backend(name: str, factory: Callable[[], OCRBackend]) -> None:
+	"""Add or replace a backend; a replaced backend is re-created on next use."""
+	_FACTORIES[name] = factory
+	_instances.pop(name, None)
+
+
+def backend_names() -> List[str]:
+	return list(_FACTORIES)
+
+
+def get_backend(name: str) -> OCRBackend:
+	if name not in _FACTORIES:
+		raise ValueError(f"Unknown OCR backend: {name!r} (known: {', '.join(_FACTORIES)})")
+	if name not in _instances:
+		_instances[name] = _FACTORIES[name]()
+	return _instances[name]
+
+
+def ingest_with_backend(file_bytes: bytes, filename: str, backend: str = "auto", **kwargs: Any) -> Tuple[str, Dict[str, Any]]:
+	"""Ingest with the named backend, or with the cheapest one that can read the document.
+
+	Args:
+		backend: A registered backend name, or "auto"
+		kwargs: Passed to OCRBackend.ingest (dpi, ocr_workers, use_text_layer, max_pages, preprocess)
+	Returns:
+		(backend name, ocr_pages structure)
+	"""
+	if backend != "auto":
+		chosen = get_backend(backend)
+		result = chosen.ingest(file_bytes, filename, **kwargs)
+		if result is None:
+			raise ValueError(f"OCR backend {backend!r} cannot read {filename}")
+		return chosen.name, result
+	candidates = sorted((get_backend(name) for name in _FACTORIES), key=lambda b: b.cost)
+	for candidate in candidates:
+		if not candidate.auto_select or not candidate.available() or not candidate.supports(filename):
+			continue
+		result = candidate.ingest(file_bytes, filename, **kwargs)
+		if result is not None:
+			return candidate.name, result
+	raise RuntimeError(f"No OCR backend available for {filename}")
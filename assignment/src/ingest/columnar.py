@@ -0,0 +1,184 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Union
+from collections.abc import MutableMapping
+
+if TYPE_CHECKING:
+	import numpy as np
+
+# NumPy is imported when the first container is built, so importing this module
+# (e.g. from the runner or the scorers) stays cheap
+
+
+# to_buffer layout: int32 header (words, text bytes), then float64 conf (aligned
+# right after the header), int32 bbox (n x 4), int32 line, int32 text offsets (n + 1),
+# then the UTF-8 text
+_HEADER = 2
+
+
+class WordColumns:
+	"""The words of one OCR page as parallel arrays instead of one dict per word.
+
+	`bbox` is an int32 (n, 4) array, `conf` float64 (OCR confidences come back
+	exactly), `line` int32, and the word texts share one UTF-8 buffer indexed by
+	`offsets` (word i is buffer[offsets[i]:offsets[i + 1]]). Slicing a range of
+	words returns a view over the same arrays and buffer. A pickle is one compact
+	flat buffer (to_buffer copies the arrays into it once); from_buffer reads the
+	arrays straight out of the unpickled bytes.
+	"""
+
+	__slots__ = ("bbox", "conf", "line", "offsets", "buffer")
+
+	def __init__(self, bbox: "np.ndarray", conf: "np.ndarray", line: "np.ndarray", offsets: "np.ndarray", buffer: Union[bytes, memoryview]):
+		self.bbox = bbox
+		self.conf = conf
+		self.line = line
+		self.offsets = offsets
+		self.buffer = memoryview(buffer)
+
+	@classmethod
+	def from_words(cls, words: List[Dict[str, Any]]) -> "WordColumns":
+		import numpy as np
+
+		encoded = [w["text"].encode("utf-8") for w in words]
+		offsets = np.zeros(len(words) + 1, dtype=np.int32)
+		np.cumsum([len(e) for e in encoded], out=offsets[1:])
+		return cls(
+			np.array([w["bbox"] for w in words], dtype=np.int32).reshape(-1, 4),
+			np.array([w.get("conf", -1.0) for w in words], dtype=np.float64),
+			np.array([w.get("line", 0) for w in words], dtype=np.int32),
+			offsets,
+			b"".join(encoded),
+		)
+
+	@classmethod
+	def from_buffer(cls, buffer: Union[bytes, bytearray, memoryview]) -> "WordColumns":
+		"""Arrays viewing a to_buffer() buffer (shared memory, a pipe read, ...) without copying it."""
+		import numpy as np
+
+		view = memoryview(buffer)
+		n, size = (int(v) for v in np.frombuffer(view, dtype=np.int32, count=_HEADER))
+		pos = _HEADER * 4
+		conf = np.frombuffer(view, dtype=np.float64, count=n, offset=pos)
+		pos += n * 8
+		bbox = np.frombuffer(view, dtype=np.int32, count=n * 4, offset=pos).reshape(n, 4)
+		pos += n * 16
+		line = np.frombuffer(view, dtype=np.int32, count=n, offset=pos)
+		pos += n * 4
+		offsets = np.frombuffer(view, dtype=np.int32, count=n + 1, offset=pos)
+		pos += (n + 1) * 4
+		return cls(bbox, conf, line, offsets, view[pos:pos + size])
+
+	def to_buffer(self) -> bytes:
+		import numpy as np
+
+		start, end = int(self.offsets[0]), int(self.offsets[-1])
+		header = np.array([len(self), end - start], dtype=np.int32)
+		parts = [header, self.conf, self.bbox, self.line, self.offsets - start]
+		return b"".join(np.ascontiguousarray(p).tobytes() for p in parts) + bytes(self.buffer[start:end])
+
+	def __reduce__(self):
+		return WordColumns.from_buffer, (self.to_buffer(),)
+
+	def __len__(self) -> int:
+		return len(self.conf)
+
+	def __getitem__(self, key: Union[int, slice]) -> Union[Dict[str, Any], "WordColumns"]:
+		if isinstance(key, slice):
+			start, stop, step = key.indices(len(self))
+			if step != 1:
+				raise ValueError("WordColumns slices must be contiguous")
+			stop = max(start, stop)
+			return WordColumns(self.bbox[start:stop], self.conf[start:stop], self.line[start:stop], self.offsets[start:stop + 1], self.buffer)
+		if key < 0:
+			key += len(self)
+		if not 0 <= key < len(self):
+			raise IndexError(key)
+		return {"text": self.text(key), "bbox": self.bbox[key].tolist(), "conf": float(self.conf[key]), "line": int(self.line[key])}
+
+	def __iter__(self) -> Iterator[Dict[str, Any]]:
+		return iter(self.to_words())
+
+	def text(self, i: int) -> str:
+		return str(self.buffer[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+	def texts(self) -> List[str]:
+		start = int(self.offsets[0])
+		data = bytes(self.buffer[start:int(self.offsets[-1])])
+		bounds = (self.offsets - start).tolist()
+		return [data[a:b].decode("utf-8") for a, b in zip(bounds, bounds[1:])]
+
+	def boxes(self) -> List[List[int]]:
+		return self.bbox.tolist()
+
+	def to_words(self) -> List[Dict[str, Any]]:
+		"""The words in the page-dict schema: [{"text", "bbox", "conf", "line"}]."""
+		return [
+			{"text": text, "bbox": bbox, "conf": conf, "line": line}
+			for text, bbox, conf, line in zip(self.texts(), self.bbox.tolist(), self.conf.tolist(), self.line.tolist())
+		]
+
+
+class ColumnarPage(MutableMapping):
+	"""Page dict look-alike whose words live in a WordColumns.
+
+	Every other key ("page", "text", "lines", "source", ...) is stored as is.
+	page["words"] builds the per-word dicts on each access, so hot paths read
+	`columns` (or go through page_words) instead; to_dict() gives today's schema.
+	"""
+
+	def __init__(self, columns: WordColumns, fields: Dict[str, Any]):
+		self.columns = columns
+		self._fields = {key: value for key, value in fields.items() if key != "words"}
+
+	@classmethod
+	def from_dict(cls, page: Dict[str, Any]) -> "ColumnarPage":
+		return cls(WordColumns.from_words(page.get("words", [])), page)
+
+	def __getitem__(self, key: str) -> Any:
+		if key == "words":
+			return self.columns.to_words()
+		return self._fields[key]
+
+	def __setitem__(self, key: str, value: Any) -> None:
+		if key == "words":
+			self.columns = WordColumns.from_words(value)
+		else:
+			self._fields[key] = value
+
+	def __delitem__(self, key: str) -> None:
+		if key == "words":
+			raise KeyError("a ColumnarPage always has words")
+		del self._fields[key]
+
+	def __iter__(self) -> Iterator[str]:
+		# Same key order as assemble_page: page, text, words, lines, then extras
+		keys = list(self._fields)
+		yield from keys[:2]
+		yield "words"
+		yield from keys[2:]
+
+	def __len__(self) -> int:
+		return len(self._fields) + 1
+
+	def __reduce__(self):
+		return ColumnarPage, (self.columns, self._fields)
+
+	def to_dict(self) -> Dict[str, Any]:
+		return {key: self[key] for key in self}
+
+
+def compact_page(page: Union[Dict[str, Any], ColumnarPage]) -> ColumnarPage:
+	return page if isinstance(page, ColumnarPage) else ColumnarPage.from_dict(page)
+
+
+def page_words(page: Union[Dict[str, Any], ColumnarPage]) -> Union[WordColumns, List[Dict[str, Any]]]:
+	"""The words of a page without building per-word dicts when they are columnar."""
+	return page.columns if isinstance(page, ColumnarPage) else page.get("words", [])
+
+
+def word_texts(words: Union[WordColumns, List[Dict[str, Any]]]) -> List[str]:
+	return words.texts() if isinstance(words, WordColumns) else [w["text"] for w in words]
+
+
+def word_boxes(words: Union[WordColumns, List[Dict[str, Any]]]) -> List[List[int]]:
+	return words.boxes() if isinstance(words, WordColumns) else [w["bbox"] for w in words]
+
@@ -0,0 +1,128 @@
+from typing import Dict, Iterator, List, Any, Optional
+from io import BytesIO
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from .ocr import assemble_page, ocr_image
+from .pdf_utils import render_page_for_ocr
+from .parallel import iter_ocr_pdf_pages
+from .preprocess import PreprocessOptions
+from .text_layer import page_text_layer, text_layer_usable
+from ..utils.tracing import get_tracer
+
+
+def _text_layer_page(doc: "fitz.Document", page_index: int, dpi: int) -> Optional[Dict[str, Any]]:
+	page = doc.load_page(page_index)
+	entries = page_text_layer(page, dpi)
+	if not text_layer_usable(page, entries, dpi):
+		return None
+	zoom = dpi / 72.0
+	result = assemble_page(page_index, entries, (int(page.rect.width * zoom), int(page.rect.height * zoom)))
+	result["source"] = "text_layer"
+	return result
+
+
+def iter_pdf_pages(pdf_bytes: bytes, dpi: int = 200, ocr_workers: int = 1, use_text_layer: bool = True, max_pages: Optional[int] = None, preprocess: Optional[PreprocessOptions] = None, known_pages: Optional[Dict[int, Dict[str, Any]]] = None) -> Iterator[Dict[str, Any]]:
+	"""Yield OCR page dicts one page at a time, in page order.
+
+	Pages with a usable text layer are read directly; the rest are rendered and
+	OCR'd as they are reached, so at most one bitmap (or one per OCR worker) is
+	alive at a time. Closing the iterator early stops rendering and closes the PDF.
+	Word boxes are in pixels at `dpi` even when preprocess picks another render DPI.
+	`known_pages` (zero-based index -> page dict, e.g. text-layer pages already read)
+	are yielded as they are, without being checked or OCR'd again.
+	"""
+	tracer = get_tracer()
+	known = dict(known_pages or {})
+	doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+	try:
+		count = len(doc) if max_pages is None else min(len(doc), max_pages)
+		if ocr_workers > 1:
+			# The text-layer check is cheap, so decide every page up front and stream the
+			# scanned ones through the worker pool; text-layer pages are merged back in order.
+			text_pages: Dict[int, Dict[str, Any]] = known
+			with tracer.span("text_layer") as span:
+				if use_text_layer:
+					for page_index in range(count):
+						if page_index in text_pages:
+							continue
+						page = _text_layer_page(doc, page_index, dpi)
+						if page is not None:
+							text_pages[page_index] = page
+				span.set(pages=len(text_pages))
+			to_ocr = [i for i in range(count) if i not in text_pages]
+			doc.close()
+			ocr_iter = iter_ocr_pdf_pages(pdf_bytes, dpi=dpi, workers=ocr_workers, page_indices=to_ocr, preprocess=preprocess)
+			try:
+				for page_index in range(count):
+					if page_index in text_pages:
+						yield text_pages.pop(page_index)
+						continue
+					with tracer.span("render_ocr_parallel", page=page_index + 1, workers=ocr_workers):
+						page = next(ocr_iter)
+					page["source"] = "ocr"
+					yield page
+			finally:
+				ocr_iter.close()
+			return
+
+		for page_index in range(count):
+			if page_index in known:
+				yield known.pop(page_index)
+				continue
+			if use_text_layer:
+				with tracer.span("text_layer", page=page_index + 1):
+					page = _text_layer_page(doc, page_index, dpi)
+				if page is not None:
+					yield page
+					continue
+			with tracer.span("render", page=page_index + 1) as span:
+				img, page_dpi = render_page_for_ocr(doc, page_index, dpi, preprocess)
+				span.set(dpi=page_dpi)
+			with tracer.span("ocr", page=page_index + 1):
+				page = ocr_image(img, page_index, preprocess=preprocess, bbox_scale=dpi / page_dpi)
+			del img
+			page["source"] = "ocr"
+			yield page
+	finally:
+		if not doc.is_closed:
+			doc.close()
+
+
+def iter_document_pages(file_bytes: bytes, filename: str, dpi: int = 200, ocr_workers: int = 1, use_text_layer: bool = True, max_pages: Optional[int] = None, preprocess: Optional[PreprocessOptions] = None) -> Iterator[Dict[str, Any]]:
+	"""Lazily ingest an uploaded PDF or image, one page dict at a time."""
+	if filename.lower().endswith(".pdf"):
+		yield from iter_pdf_pages(file_bytes, dpi=dpi, ocr_workers=ocr_workers, use_text_layer=use_text_layer, max_pages=max_pages, preprocess=preprocess)
+		return
+	# Assume image
+	tracer = get_tracer()
+	with tracer.span("render", bytes=len(file_bytes)):
+		img = Image.open(BytesIO(file_bytes)).convert("RGB")
+	with tracer.span("ocr", page=1):
+		page = ocr_image(img, 0, preprocess=preprocess)
+	del img
+	page["source"] = "ocr"
+	yield page
+
+
+def ocr_pdf(pdf_bytes: bytes, dpi: int = 200, ocr_workers: int = 1, use_text_layer: bool = True, max_pages: Optional[int] = None, preprocess: Optional[PreprocessOptions] = None) -> Dict[str, Any]:
+	"""OCR a PDF, reading the embedded text layer where it is usable.
+
+	Only pages without a usable text layer are rasterized and sent to Tesseract.
+	Returns the same structure as ocr_pages.
+	"""
+	pages = list(iter_pdf_pages(pdf_bytes, dpi=dpi, ocr_workers=ocr_workers, use_text_layer=use_text_layer, max_pages=max_pages, preprocess=preprocess))
+	return {"pages": pages, "full_text": "\n".join(p["text"] for p in pages)}
+
+
+def ingest_document(file_bytes: bytes, filename: str, dpi: int = 200, ocr_workers: int = 1, use_text_layer: bool = True, max_pages: Optional[int] = None, preprocess: Optional[PreprocessOptions] = None) -> Dict[str, Any]:
+	"""Turn an uploaded PDF or image into the ocr_pages structure.
+
+	Pages are consumed as they are produced; max_pages stops ingestion early
+	(e.g. when only the first pages are needed for classification and header fields).
+	"""
+	pages: List[Dict[str, Any]] = []
+	for page in iter_document_pages(file_bytes, filename, dpi=dpi, ocr_workers=ocr_workers, use_text_layer=use_text_layer, max_pages=max_pages, preprocess=preprocess):
+		pages.append(page)
+	return {"pages": pages, "full_text": "\n".join(p["text"] for p in pages)}
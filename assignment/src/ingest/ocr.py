@@ -1,41 +1,143 @@
-from typing import Dict, List, Any
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Any, Optional, Tuple
 import os
 
-import pytesseract
-from PIL import Image
+from .options import PreprocessOptions
 
+if TYPE_CHECKING:
+	from PIL import Image
 
-# Auto-set Tesseract path for Windows if not already set
-if not os.getenv("TESSERACT_PATH"):
-	if os.path.exists(r"C:\Program Files\Tesseract-OCR\tesseract.exe"):
-		pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-	elif os.path.exists(r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe"):
-		pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe"
-else:
-	pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_PATH")
+# pytesseract, PIL and NumPy (preprocess) are imported on the first OCR call, so
+# assemble_page stays cheap for backends that already have word boxes
 
 
-def ocr_pages(images: List[Image.Image]) -> Dict[str, Any]:
-	"""Perform OCR on a list of images.
+_tesseract_configured = False
 
+
+def configure_tesseract() -> None:
+	"""Point pytesseract at the Tesseract binary; runs once, on first OCR call."""
+	global _tesseract_configured
+	if _tesseract_configured:
+		return
+	import pytesseract
+
+	# Auto-set Tesseract path for Windows if not already set
+	if not os.getenv("TESSERACT_PATH"):
+		if os.path.exists(r"C:\Program Files\Tesseract-OCR\tesseract.exe"):
+			pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+		elif os.path.exists(r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe"):
+			pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe"
+	else:
+		pytesseract.pytesseract.tesseract_cmd = os.getenv("TESSERACT_PATH")
+	_tesseract_configured = True
+
+
+def _merge_bbox(a: List[int], b: List[int]) -> List[int]:
+	return [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+
+
+def assemble_page(index: int, entries: List[Tuple[str, List[int], float, Tuple[int, int, int]]], size: Optional[Tuple[int, int]] = None) -> Dict[str, Any]:
+	"""Build a page dict from positioned words in reading order.
+
+	Args:
+		index: Zero-based page index
+		entries: (text, bbox, conf, (block, par, line)) per word
+		size: (width, height) of the page in the same pixels as the bboxes, when known
 	Returns:
-		{"pages": [{"page": i+1, "text": str, "words": [{"text": str, "bbox": [x1,y1,x2,y2]}]}], "full_text": str}
+		{"page", "text", "words": [{"text", "bbox", "conf", "line"}], "lines": [{"text", "bbox", "words"}]},
+		plus "width" and "height" when size is given
+	"""
+	words: List[Dict[str, Any]] = []
+	lines: List[Dict[str, Any]] = []
+	line_keys: List[Tuple[int, int, int]] = []
+	line_index: Dict[Tuple[int, int, int], int] = {}
+	for text, bbox, conf, key in entries:
+		if key not in line_index:
+			line_index[key] = len(lines)
+			line_keys.append(key)
+			lines.append({"text": "", "bbox": list(bbox), "words": []})
+		line_no = line_index[key]
+		line = lines[line_no]
+		line["words"].append(len(words))
+		line["bbox"] = _merge_bbox(line["bbox"], bbox)
+		words.append({"text": text, "bbox": bbox, "conf": conf, "line": line_no})
+
+	# Same layout as image_to_string: lines joined by newlines, blank line between paragraphs/blocks
+	parts: List[str] = []
+	prev_par = None
+	for key, line in zip(line_keys, lines):
+		line["text"] = " ".join(words[i]["text"] for i in line["words"])
+		if prev_par is not None and key[:2] != prev_par:
+			parts.append("")
+		parts.append(line["text"])
+		prev_par = key[:2]
+	text = "\n".join(parts) + "\n" if parts else ""
+	page = {"page": index + 1, "text": text, "words": words, "lines": lines}
+	if size is not None:
+		page["width"], page["height"] = int(size[0]), int(size[1])
+	return page
+
+
+def ocr_image(img: "Image.Image", index: int = 0, single_pass: bool = True, preprocess: Optional[PreprocessOptions] = None, bbox_scale: float = 1.0) -> Dict[str, Any]:
+	"""OCR a single page image.
+
+	With single_pass the page text is rebuilt from the image_to_data layout
+	(block/par/line numbers) instead of running Tesseract a second time.
+	With preprocess the image is cleaned up first; word boxes are always reported
+	in the input image's coordinates, multiplied by bbox_scale.
+	"""
+	import pytesseract
+
+	configure_tesseract()
+	# Page size in the reported box coordinates (the input image, times bbox_scale)
+	size = (int(round(img.width * bbox_scale)), int(round(img.height * bbox_scale)))
+	info = None
+	if preprocess is not None:
+		from .preprocess import preprocess_image, map_bbox_back
+
+		img, info = preprocess_image(img, preprocess)
+	data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
+	entries = []
+	for i in range(len(data["text"])):
+		w = data["text"][i]
+		if not w or not w.strip():
+			continue
+		x, y, w_box, h_box = data["left"][i], data["top"][i], data["width"][i], data["height"][i]
+		bbox = [int(x), int(y), int(x + w_box), int(y + h_box)]
+		if info is not None:
+			bbox = map_bbox_back(bbox, info)
+		if bbox_scale != 1.0:
+			bbox = [int(round(c * bbox_scale)) for c in bbox]
+		entries.append((
+			w.strip(),
+			bbox,
+			float(data["conf"][i]),
+			(int(data["block_num"][i]), int(data["par_num"][i]), int(data["line_num"][i])),
+		))
+	page = assemble_page(index, entries, size)
+	if not single_pass:
+		page["text"] = pytesseract.image_to_string(img)
+	return page
+
+
+def iter_ocr_pages(images: Iterable["Image.Image"], single_pass: bool = True, preprocess: Optional[PreprocessOptions] = None) -> Iterator[Dict[str, Any]]:
+	"""OCR images as they arrive; each image can be released once its page is yielded."""
+	for idx, img in enumerate(images):
+		page = ocr_image(img, idx, single_pass=single_pass, preprocess=preprocess)
+		# Drop the bitmap before the next one is rendered
+		del img
+		yield page
+
+
+def ocr_pages(images: Iterable["Image.Image"], single_pass: bool = True, preprocess: Optional[PreprocessOptions] = None) -> Dict[str, Any]:
+	"""Perform OCR on a list (or lazy iterator) of images.
+
+	Returns:
+		{"pages": [{"page": i+1, "text": str, "words": [{"text": str, "bbox": [x1,y1,x2,y2], "conf": float, "line": int}],
+		"lines": [{"text": str, "bbox": [x1,y1,x2,y2], "words": [int]}]}], "full_text": str}
 	"""
 	pages: List[Dict[str, Any]] = []
 	full_text_parts: List[str] = []
-	for idx, img in enumerate(images):
-		data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
-		words = []
-		for i in range(len(data["text"])):
-			w = data["text"][i]
-			if not w or not w.strip():
-				continue
-			x, y, w_box, h_box = data["left"][i], data["top"][i], data["width"][i], data["height"][i]
-			words.append({
-				"text": data["text"][i],
-				"bbox": [int(x), int(y), int(x + w_box), int(y + h_box)],
-			})
-		text = pytesseract.image_to_string(img)
-		pages.append({"page": idx + 1, "text": text, "words": words})
-		full_text_parts.append(text)
-	return {"pages": pages, "full_text": "\n".join(full_text_parts)} 
\ No newline at end of file
+	for page in iter_ocr_pages(images, single_pass=single_pass, preprocess=preprocess):
+		pages.append(page)
+		full_text_parts.append(page["text"])
+	return {"pages": pages, "full_text": "\n".join(full_text_parts)}
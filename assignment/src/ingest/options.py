@@ -0,0 +1,24 @@
+from dataclasses import dataclass
+
+
+# Kept apart from preprocess.py so callers can build options without importing NumPy/PIL
+@dataclass
+class PreprocessOptions:
+	"""Image clean-up ahead of Tesseract; every step can be switched off."""
+	rescale: bool = True
+	deskew: bool = True
+	binarize: bool = True
+	crop: bool = True
+	adaptive_dpi: bool = True
+	# Text line height (px) Tesseract reads best; inputs are scaled towards it
+	target_line_height: int = 36
+	min_scale: float = 0.25
+	max_scale: float = 3.0
+	# Hard cap on the longest side after rescaling
+	max_side: int = 4000
+	max_skew_degrees: float = 5.0
+	skew_step_degrees: float = 0.25
+	crop_padding: int = 10
+	# Bounds for the per-page PDF render DPI picked by choose_dpi
+	min_dpi: int = 120
+	max_dpi: int = 400
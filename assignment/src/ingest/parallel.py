@@ -0,0 +1,90 @@
+from typing import Dict, List, Any, Iterator, Optional, Iterable
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+import os
+
+import fitz  # PyMuPDF
+
+from .pdf_utils import render_page_for_ocr, pdf_page_count
+from .columnar import ColumnarPage, compact_page
+from .ocr import ocr_image
+from .preprocess import PreprocessOptions
+
+
+# Per-worker state, set once by the pool initializer so each task only carries a page index
+_worker_doc: Optional["fitz.Document"] = None
+_worker_dpi: int = 200
+_worker_single_pass: bool = True
+_worker_preprocess: Optional[PreprocessOptions] = None
+
+
+def _init_worker(pdf_bytes: bytes, dpi: int, single_pass: bool, preprocess: Optional[PreprocessOptions] = None) -> None:
+	global _worker_doc, _worker_dpi, _worker_single_pass, _worker_preprocess
+	_worker_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+	_worker_dpi = dpi
+	_worker_single_pass = single_pass
+	_worker_preprocess = preprocess
+
+
+def _ocr_pdf_page(page_index: int) -> ColumnarPage:
+	# The bitmap only lives inside the worker for the duration of this call; the page
+	# goes back to the parent as one compact columnar buffer instead of a dict per word
+	img, page_dpi = render_page_for_ocr(_worker_doc, page_index, _worker_dpi, _worker_preprocess)
+	return compact_page(ocr_image(img, page_index, single_pass=_worker_single_pass, preprocess=_worker_preprocess, bbox_scale=_worker_dpi / page_dpi))
+
+
+def default_workers() -> int:
+	return max(1, int(os.getenv("OCR_WORKERS") or 0) or (os.cpu_count() or 1))
+
+
+def iter_ocr_pdf_pages(
+	pdf_bytes: bytes,
+	dpi: int = 200,
+	workers: Optional[int] = None,
+	max_in_flight: Optional[int] = None,
+	page_indices: Optional[Iterable[int]] = None,
+	single_pass: bool = True,
+	preprocess: Optional[PreprocessOptions] = None,
+) -> Iterator[ColumnarPage]:
+	"""Render and OCR PDF pages in worker processes, yielding page results in page order.
+
+	Pages are ColumnarPage views (see columnar.py); they read like page dicts.
+
+	Args:
+		pdf_bytes: Raw PDF bytes
+		dpi: Render DPI
+		workers: Number of worker processes (defaults to OCR_WORKERS or the CPU count)
+		max_in_flight: Maximum pages submitted but not yet consumed (defaults to workers).
+			At most `workers` bitmaps are alive at once; this bounds the buffered results.
+		page_indices: Zero-based pages to process (defaults to all pages)
+		single_pass: Passed through to ocr_image
+		preprocess: Image clean-up / adaptive DPI options; boxes stay in `dpi` coordinates
+	"""
+	indices = list(range(pdf_page_count(pdf_bytes))) if page_indices is None else list(page_indices)
+	if not indices:
+		return
+	workers = max(1, min(workers or default_workers(), len(indices)))
+	max_in_flight = max(1, max_in_flight or workers)
+
+	pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pdf_bytes, dpi, single_pass, preprocess))
+	pending: "deque[Future]" = deque()
+	remaining = iter(indices)
+	try:
+		for page_index in remaining:
+			pending.append(pool.submit(_ocr_pdf_page, page_index))
+			if len(pending) >= max_in_flight:
+				break
+		while pending:
+			page = pending.popleft().result()
+			next_index = next(remaining, None)
+			if next_index is not None:
+				pending.append(pool.submit(_ocr_pdf_page, next_index))
+			yield page
+	finally:
+		pool.shutdown(wait=True, cancel_futures=True)
+
+
+def ocr_pdf_parallel(pdf_bytes: bytes, dpi: int = 200, workers: Optional[int] = None, max_in_flight: Optional[int] = None, single_pass: bool = True, preprocess: Optional[PreprocessOptions] = None) -> Dict[str, Any]:
+	"""Parallel counterpart of pdf_to_images + ocr_pages with the same output schema."""
+	pages: List[Dict[str, Any]] = list(iter_ocr_pdf_pages(pdf_bytes, dpi=dpi, workers=workers, max_in_flight=max_in_flight, single_pass=single_pass, preprocess=preprocess))
+	return {"pages": pages, "full_text": "\n".join(p["text"] for p in pages)}
@@ -1,9 +1,11 @@
-from typing import List, Tuple
+from typing import Iterator, List, Optional, Tuple
 import io
 
 import fitz  # PyMuPDF
 from PIL import Image
 
+from .preprocess import PreprocessOptions, choose_dpi
+
 
 def pdf_to_images(pdf_bytes: bytes, dpi: int = 200) -> List[Image.Image]:
 	"""Render each PDF page to a PIL Image.
@@ -14,14 +16,46 @@ def pdf_to_images(pdf_bytes: bytes, dpi: int = 200) -> List[Image.Image]:
 	Returns:
 		List of PIL Images, one per page
 	"""
+	return list(iter_pdf_images(pdf_bytes, dpi))
+
+
+def iter_pdf_images(pdf_bytes: bytes, dpi: int = 200, max_pages: Optional[int] = None) -> Iterator[Image.Image]:
+	"""Lazily render PDF pages one at a time.
+
+	Only the page being consumed is held in memory, and the document is closed as
+	soon as the iterator is exhausted or closed early.
+	"""
+	doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+	try:
+		count = len(doc) if max_pages is None else min(len(doc), max_pages)
+		for page_index in range(count):
+			yield render_page(doc, page_index, dpi)
+	finally:
+		doc.close()
+
+
+def render_page(doc: "fitz.Document", page_index: int, dpi: int = 200) -> Image.Image:
+	"""Render a single page of an open PDF document to a PIL Image."""
+	page = doc.load_page(page_index)
+	zoom = dpi / 72.0
+	mat = fitz.Matrix(zoom, zoom)
+	pix = page.get_pixmap(matrix=mat, alpha=False)
+	return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+
+def render_page_for_ocr(doc: "fitz.Document", page_index: int, dpi: int = 200, preprocess: Optional[PreprocessOptions] = None, probe_dpi: int = 72) -> Tuple[Image.Image, int]:
+	"""Render a page at `dpi`, or at an adaptive DPI picked from a low-resolution probe.
+
+	Returns the image and the DPI it was rendered at.
+	"""
+	page_dpi = dpi
+	if preprocess is not None and preprocess.adaptive_dpi:
+		page_dpi = choose_dpi(render_page(doc, page_index, probe_dpi), probe_dpi, preprocess, dpi)
+	return render_page(doc, page_index, page_dpi), page_dpi
+
+
+def pdf_page_count(pdf_bytes: bytes) -> int:
 	doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-	images: List[Image.Image] = []
-	for page_index in range(len(doc)):
-		page = doc.load_page(page_index)
-		zoom = dpi / 72.0
-		mat = fitz.Matrix(zoom, zoom)
-		pix = page.get_pixmap(matrix=mat, alpha=False)
-		img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-		images.append(img)
+	count = len(doc)
 	doc.close()
-	return images 
\ No newline at end of file
+	return count 
\ No newline at end of file
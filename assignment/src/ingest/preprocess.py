@@ -0,0 +1,158 @@
+from typing import Any, Dict, List, Optional, Tuple
+import math
+
+import numpy as np
+from PIL import Image
+
+from .options import PreprocessOptions
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+	"""Otsu's threshold from the 256-bin histogram (fully vectorized)."""
+	hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+	total = hist.sum()
+	if total == 0:
+		return 128
+	levels = np.arange(256, dtype=np.float64)
+	weight_bg = np.cumsum(hist)
+	weight_fg = total - weight_bg
+	cum_mean = np.cumsum(hist * levels)
+	mean_bg = cum_mean / np.maximum(weight_bg, 1)
+	mean_fg = (cum_mean[-1] - cum_mean) / np.maximum(weight_fg, 1)
+	between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+	return int(np.argmax(between))
+
+
+def ink_mask(gray: np.ndarray) -> np.ndarray:
+	return gray <= otsu_threshold(gray)
+
+
+def estimate_line_height(ink: np.ndarray) -> Optional[float]:
+	"""Median height of text lines from runs of inked rows in the horizontal projection."""
+	if ink.size == 0:
+		return None
+	row_ink = ink.mean(axis=1)
+	active = (row_ink > max(0.002, 0.1 * row_ink.max())).astype(np.int8)
+	edges = np.diff(np.concatenate(([0], active, [0])))
+	starts = np.flatnonzero(edges == 1)
+	ends = np.flatnonzero(edges == -1)
+	heights = ends - starts
+	heights = heights[heights >= 3]
+	if heights.size < 2:
+		return None
+	return float(np.median(heights))
+
+
+def estimate_skew(ink: np.ndarray, max_degrees: float, step: float, max_points: int = 20000) -> float:
+	"""Skew angle (degrees) maximizing the sharpness of the row projection of ink pixels."""
+	ys, xs = np.nonzero(ink)
+	if ys.size < 50:
+		return 0.0
+	if ys.size > max_points:
+		pick = np.linspace(0, ys.size - 1, max_points).astype(np.int64)
+		ys, xs = ys[pick], xs[pick]
+	angles = np.arange(-max_degrees, max_degrees + step / 2, step)
+	theta = np.deg2rad(angles)[:, None]
+	# Projected row of every ink pixel for every candidate angle: (angles, points)
+	rows = np.round(ys[None, :] * np.cos(theta) - xs[None, :] * np.sin(theta)).astype(np.int64)
+	rows -= rows.min(axis=1, keepdims=True)
+	width = int(rows.max()) + 1
+	offsets = (np.arange(len(angles)) * width)[:, None]
+	hist = np.bincount((rows + offsets).ravel(), minlength=len(angles) * width).reshape(len(angles), width)
+	scores = (hist.astype(np.float64) ** 2).sum(axis=1)
+	return float(angles[int(np.argmax(scores))])
+
+
+def ink_bbox(ink: np.ndarray, padding: int) -> Optional[Tuple[int, int, int, int]]:
+	rows = np.flatnonzero(ink.any(axis=1))
+	cols = np.flatnonzero(ink.any(axis=0))
+	if rows.size == 0 or cols.size == 0:
+		return None
+	h, w = ink.shape
+	return (
+		max(0, int(cols[0]) - padding),
+		max(0, int(rows[0]) - padding),
+		min(w, int(cols[-1]) + 1 + padding),
+		min(h, int(rows[-1]) + 1 + padding),
+	)
+
+
+def preprocess_image(img: Image.Image, options: PreprocessOptions) -> Tuple[Image.Image, Dict[str, Any]]:
+	"""Rescale, deskew, binarize and crop a page image for OCR.
+
+	Returns the processed image and the transform needed by map_bbox_back to put
+	OCR boxes back into the original image's coordinates.
+	"""
+	gray_img = img.convert("L")
+	gray = np.asarray(gray_img)
+	info: Dict[str, Any] = {"scale": 1.0, "angle": 0.0, "rotated_size": None, "pre_rotate_size": None, "offset": (0, 0), "line_height": None}
+
+	if options.rescale:
+		line_height = estimate_line_height(ink_mask(gray))
+		info["line_height"] = line_height
+		scale = options.target_line_height / line_height if line_height else 1.0
+		scale = min(max(scale, options.min_scale), options.max_scale)
+		scale = min(scale, options.max_side / max(gray.shape))
+		if abs(scale - 1.0) > 0.1:
+			size = (max(1, int(round(gray.shape[1] * scale))), max(1, int(round(gray.shape[0] * scale))))
+			gray_img = gray_img.resize(size, Image.BILINEAR if scale > 1.0 else Image.BOX)
+			gray = np.asarray(gray_img)
+			info["scale"] = size[0] / img.width
+
+	if options.deskew:
+		angle = estimate_skew(ink_mask(gray), options.max_skew_degrees, options.skew_step_degrees)
+		if abs(angle) >= options.skew_step_degrees:
+			info["pre_rotate_size"] = gray_img.size
+			# A line sloping down to the right (positive angle) is levelled by a counter-clockwise turn
+			gray_img = gray_img.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+			gray = np.asarray(gray_img)
+			info["angle"] = angle
+			info["rotated_size"] = gray_img.size
+
+	ink = ink_mask(gray)
+	if options.crop:
+		box = ink_bbox(ink, options.crop_padding)
+		if box is not None:
+			gray = gray[box[1]:box[3], box[0]:box[2]]
+			ink = ink[box[1]:box[3], box[0]:box[2]]
+			info["offset"] = (box[0], box[1])
+
+	if options.binarize:
+		out = np.where(ink, 0, 255).astype(np.uint8)
+	else:
+		out = np.ascontiguousarray(gray)
+	return Image.fromarray(out, mode="L"), info
+
+
+def map_bbox_back(bbox: List[int], info: Dict[str, Any]) -> List[int]:
+	"""Map a bbox from preprocessed-image coordinates to original-image coordinates."""
+	ox, oy = info["offset"]
+	xs = [bbox[0] + ox, bbox[2] + ox, bbox[0] + ox, bbox[2] + ox]
+	ys = [bbox[1] + oy, bbox[1] + oy, bbox[3] + oy, bbox[3] + oy]
+	if info["angle"]:
+		# Undo the rotation about the image centre (PIL expands the canvas symmetrically)
+		rw, rh = info["rotated_size"]
+		pw, ph = info["pre_rotate_size"]
+		theta = math.radians(info["angle"])
+		cos_t, sin_t = math.cos(theta), math.sin(theta)
+		pts = []
+		for x, y in zip(xs, ys):
+			dx, dy = x - rw / 2.0, y - rh / 2.0
+			pts.append((dx * cos_t - dy * sin_t + pw / 2.0, dx * sin_t + dy * cos_t + ph / 2.0))
+		xs = [p[0] for p in pts]
+		ys = [p[1] for p in pts]
+	s = info["scale"] or 1.0
+	return [int(min(xs) / s), int(min(ys) / s), int(math.ceil(max(xs) / s)), int(math.ceil(max(ys) / s))]
+
+
+def choose_dpi(probe: Image.Image, probe_dpi: int, options: PreprocessOptions, default_dpi: int) -> int:
+	"""Pick a render DPI so text lines come out near the target height.
+
+	Args:
+		probe: The page rendered at a low `probe_dpi`
+	"""
+	line_height = estimate_line_height(ink_mask(np.asarray(probe.convert("L"))))
+	if not line_height:
+		return default_dpi
+	dpi = probe_dpi * options.target_line_height / line_height
+	return int(min(max(dpi, options.min_dpi), options.max_dpi))
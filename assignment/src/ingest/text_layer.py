@@ -0,0 +1,65 @@
+from typing import List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+
+# Coverage heuristic thresholds: below these a page is treated as scanned and sent to OCR
+MIN_CHARS = 20
+MIN_COVERAGE = 0.002
+MIN_VALID_RATIO = 0.8
+# A page mostly covered by one image is a scan unless its text layer also covers that image
+# (a searchable scan); a scanner-app footer over a full-page image is not enough
+SCAN_IMAGE_COVERAGE = 0.5
+MIN_IMAGE_TEXT_COVERAGE = 0.02
+
+
+def page_text_layer(page: "fitz.Page", dpi: int = 200) -> List[Tuple[str, List[int], float, Tuple[int, int, int]]]:
+	"""Read the embedded words of a PDF page as assemble_page entries.
+
+	Bboxes are scaled from PDF points to pixels at `dpi` so they line up with OCR output.
+	"""
+	zoom = dpi / 72.0
+	entries = []
+	for x0, y0, x1, y1, word, block_no, line_no, _ in page.get_text("words"):
+		if not word.strip():
+			continue
+		bbox = [int(x0 * zoom), int(y0 * zoom), int(x1 * zoom), int(y1 * zoom)]
+		entries.append((word.strip(), bbox, 100.0, (int(block_no), 0, int(line_no))))
+	return entries
+
+
+def text_layer_usable(page: "fitz.Page", entries: List[Tuple[str, List[int], float, Tuple[int, int, int]]], dpi: int = 200) -> bool:
+	"""Decide whether the text layer covers the page well enough to skip OCR."""
+	chars = sum(len(e[0]) for e in entries)
+	if chars < MIN_CHARS:
+		return False
+	# Broken font encodings show up as replacement / non-printable characters
+	valid = sum(1 for e in entries for ch in e[0] if ch.isprintable() and ch != "�")
+	if valid / chars < MIN_VALID_RATIO:
+		return False
+	zoom = dpi / 72.0
+	page_area = (page.rect.width * zoom) * (page.rect.height * zoom)
+	if page_area <= 0:
+		return False
+	word_area = sum((e[1][2] - e[1][0]) * (e[1][3] - e[1][1]) for e in entries)
+	if word_area / page_area < MIN_COVERAGE:
+		return False
+	image = _largest_image(page)
+	if image is None or image.get_area() * zoom * zoom < SCAN_IMAGE_COVERAGE * page_area:
+		return True
+	x0, y0, x1, y1 = (v * zoom for v in image)
+	covered = sum(
+		max(0.0, min(e[1][2], x1) - max(e[1][0], x0)) * max(0.0, min(e[1][3], y1) - max(e[1][1], y0))
+		for e in entries
+	)
+	return covered / (image.get_area() * zoom * zoom) >= MIN_IMAGE_TEXT_COVERAGE
+
+
+def _largest_image(page: "fitz.Page") -> Optional["fitz.Rect"]:
+	"""Largest embedded image on the page, clipped to the page, in PDF points."""
+	best = None
+	for info in page.get_image_info():
+		rect = fitz.Rect(info["bbox"]) & page.rect
+		if not rect.is_empty and (best is None or rect.get_area() > best.get_area()):
+			best = rect
+	return best
@@ -1,7 +1,10 @@
-from typing import Literal
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
 import re
 
-DocType = Literal["invoice", "medical_bill", "prescription", "unknown"]
+# "invoice", "medical_bill", "prescription", any registered type, or "unknown"
+DocType = str
 
 
 INVOICE_HINTS = [
@@ -14,19 +17,152 @@ PRESCRIPTION_HINTS = [
 	"rx", "prescription", "dosage", "take", "tablet", "mg", "refill", "sig",
 ]
 
+# Doc type -> {hint phrase: weight}, in tie-break order; extended with register_doc_type
+# or a JSON file of the same shape named by DOC_TYPE_HINTS_PATH
+DOC_TYPE_HINTS: Dict[str, Dict[str, float]] = {
+	"invoice": {hint: 1.0 for hint in INVOICE_HINTS},
+	"medical_bill": {hint: 1.0 for hint in MEDICAL_BILL_HINTS},
+	"prescription": {hint: 1.0 for hint in PRESCRIPTION_HINTS},
+}
+
+
+# A page only starts a new section when its type leads the runner-up by this much hint weight;
+# closer pages continue the section before them
+SECTION_MIN_LEAD = 2.0
+
+
+def _phrase_key(text: str) -> str:
+	return " ".join(text.lower().split())
+
+
+class DocClassifier:
+	"""Every hint of every doc type compiled into one case-insensitive matcher.
+
+	Hints only match as whole words ("mg" in "500mg" but not in "among"), each
+	distinct hint counts once with its weight, and the highest total wins (ties go
+	to the type registered first). The scan stops as soon as no other type can
+	catch up with the leader, or once the lead reaches `margin` when one is given.
+	"""
+
+	def __init__(self, hints: Dict[str, Dict[str, float]]):
+		self.types = list(hints)
+		self._hint_types: Dict[str, List[Tuple[int, float]]] = {}
+		self._totals = [0.0] * len(self.types)
+		for t, (doc_type, weights) in enumerate(hints.items()):
+			for hint, weight in weights.items():
+				self._hint_types.setdefault(_phrase_key(hint), []).append((t, weight))
+				self._totals[t] += weight
+		# Longest first, so "balance due" wins over a shorter hint at the same spot
+		phrases = sorted(self._hint_types, key=len, reverse=True)
+		alternatives = [r"\s+".join(re.escape(word) for word in phrase.split()) for phrase in phrases]
+		self.matcher = re.compile(r"(?<![a-z])(?:" + "|".join(alternatives) + r")(?![a-z])", re.IGNORECASE) if phrases else None
+
+	def scores(self, text: str, margin: Optional[float] = None, until_decided: bool = True) -> Dict[str, float]:
+		"""Weighted hint score per doc type (possibly partial when the scan stopped early).
+
+		With until_decided=False and no margin every hint is counted, so the scores
+		(and the lead) are exact.
+		"""
+		scores = [0.0] * len(self.types)
+		remaining = list(self._totals)
+		seen = set()
+		if self.matcher is not None:
+			for match in self.matcher.finditer(text):
+				key = _phrase_key(match.group(0))
+				if key in seen:
+					continue
+				seen.add(key)
+				for t, weight in self._hint_types[key]:
+					scores[t] += weight
+					remaining[t] -= weight
+				if self._decided(scores, remaining, margin, until_decided):
+					break
+		return dict(zip(self.types, scores))
+
+	def _decided(self, scores: List[float], remaining: List[float], margin: Optional[float], until_decided: bool = True) -> bool:
+		lead = max(range(len(scores)), key=lambda t: (scores[t], -t))
+		others = [t for t in range(len(scores)) if t != lead]
+		if margin is not None and all(scores[lead] - scores[t] >= margin for t in others):
+			return True
+		if not until_decided:
+			return False
+		# No other type could still overtake (or tie with an earlier type) the leader
+		return all(scores[t] + remaining[t] < scores[lead] or (scores[t] + remaining[t] == scores[lead] and t > lead) for t in others)
+
+	def classify(self, text: str, margin: Optional[float] = None) -> DocType:
+		scores = self.scores(text, margin)
+		best = max(scores.values(), default=0.0)
+		if best <= 0:
+			return "unknown"
+		return next(doc_type for doc_type in self.types if scores[doc_type] == best)
+
+	def classify_pages(self, pages: List[Dict[str, Any]], min_lead: float = SECTION_MIN_LEAD) -> List[Dict[str, Any]]:
+		"""Classify each page and group consecutive pages of the same type into sections.
+
+		Pages whose leading type is less than `min_lead` ahead of the runner-up
+		count as "unknown" and continue the section before them.
+		Returns [{"doc_type", "pages": [page numbers]}] in page order.
+		"""
+		sections: List[Dict[str, Any]] = []
+		for page in pages:
+			doc_type = self._page_type(page.get("text", ""), min_lead)
+			if sections and doc_type in ("unknown", sections[-1]["doc_type"]):
+				sections[-1]["pages"].append(page["page"])
+			elif sections and sections[-1]["doc_type"] == "unknown":
+				# Leading hint-less pages belong to the first classified section
+				sections[-1]["doc_type"] = doc_type
+				sections[-1]["pages"].append(page["page"])
+			else:
+				sections.append({"doc_type": doc_type, "pages": [page["page"]]})
+		return sections
+
+	def _page_type(self, text: str, min_lead: float) -> DocType:
+		scores = sorted(((score, -t) for t, score in enumerate(self.scores(text, until_decided=False).values())), reverse=True)
+		if not scores or scores[0][0] <= 0:
+			return "unknown"
+		runner_up = scores[1][0] if len(scores) > 1 else 0.0
+		return self.types[-scores[0][1]] if scores[0][0] - runner_up >= min_lead else "unknown"
+
+
+def register_doc_type(doc_type: str, hints: Dict[str, float]) -> None:
+	"""Add a doc type, or add/re-weight hints of an existing one."""
+	DOC_TYPE_HINTS.setdefault(doc_type, {}).update(hints)
+	global _classifier
+	_classifier = None
+
+
+def load_doc_type_hints(path: str) -> None:
+	"""Register every doc type in a JSON file of {doc_type: {hint: weight}}."""
+	with open(path, "r", encoding="utf-8") as fh:
+		for doc_type, hints in json.load(fh).items():
+			register_doc_type(doc_type, {hint: float(weight) for hint, weight in hints.items()})
+
+
+_classifier: Optional[DocClassifier] = None
+_env_loaded = False
+
+
+def get_classifier() -> DocClassifier:
+	"""Compiled classifier (built once, rebuilt after register_doc_type)."""
+	global _classifier, _env_loaded
+	if not _env_loaded:
+		_env_loaded = True
+		if os.getenv("DOC_TYPE_HINTS_PATH"):
+			load_doc_type_hints(os.environ["DOC_TYPE_HINTS_PATH"])
+	if _classifier is None:
+		_classifier = DocClassifier(DOC_TYPE_HINTS)
+	return _classifier
+
+
+def classify_margin() -> Optional[float]:
+	"""CLASSIFY_MARGIN: stop scanning once the leading type is this far ahead (unset: only once decided)."""
+	raw = os.getenv("CLASSIFY_MARGIN")
+	return float(raw) if raw else None
+
 
 def classify_text_heuristic(text: str) -> DocType:
-	low = text.lower()
-	def score(hints):
-		return sum(1 for h in hints if h in low)
-	s_inv = score(INVOICE_HINTS)
-	s_med = score(MEDICAL_BILL_HINTS)
-	s_rx = score(PRESCRIPTION_HINTS)
-	best = max(s_inv, s_med, s_rx)
-	if best == 0:
-		return "unknown"
-	if best == s_inv:
-		return "invoice"
-	if best == s_med:
-		return "medical_bill"
-	return "prescription" 
\ No newline at end of file
+	return get_classifier().classify(text, classify_margin())
+
+
+def classify_pages(pages: List[Dict[str, Any]], min_lead: float = SECTION_MIN_LEAD) -> List[Dict[str, Any]]:
+	return get_classifier().classify_pages(pages, min_lead)
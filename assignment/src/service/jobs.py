@@ -0,0 +1,237 @@
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+import asyncio
+import time
+import uuid
+
+from ..agent.runner import ProcessOptions, complete_document, prepare_document, warm_up
+from ..cache.store import ResultCache
+
+
+TERMINAL = ("done", "failed", "cancelled")
+
+_worker_cache: Optional[ResultCache] = None
+
+
+def _init_cpu_worker(warm: bool, cache_path: Optional[str] = None, cache_max_bytes: int = 0) -> None:
+	global _worker_cache
+	# Each worker opens its own connection to the service's cache file (None: no cache)
+	_worker_cache = ResultCache(cache_path, max_bytes=cache_max_bytes) if cache_path else None
+	if warm:
+		warm_up(("image", "pdf"))
+
+
+def _prepare_in_worker(file_bytes: bytes, filename: str, requested_fields: Optional[List[str]], options: ProcessOptions) -> Dict[str, Any]:
+	return prepare_document(file_bytes, filename, requested_fields, options, _worker_cache)
+
+
+class QueueFull(Exception):
+	"""The intake queue is at capacity; the client should retry later."""
+
+
+@dataclass
+class Job:
+	id: str
+	filename: str
+	requested_fields: Optional[List[str]]
+	options: ProcessOptions
+	file_bytes: Optional[bytes] = None
+	# queued -> preparing -> extracting -> done | failed | cancelled
+	status: str = "queued"
+	result: Optional[Dict[str, Any]] = None
+	error: Optional[str] = None
+	created: float = field(default_factory=time.time)
+	finished: Optional[float] = None
+	events: List[Dict[str, Any]] = field(default_factory=list)
+	_changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+	_future: Optional[asyncio.Future] = field(default=None, repr=False)
+
+	def set_status(self, status: str, **extra: Any) -> None:
+		self.status = status
+		if status in TERMINAL:
+			self.finished = time.time()
+		self.events.append({"status": status, "time": time.time(), **extra})
+		# Wake every watcher, then arm a fresh event for the next change
+		changed, self._changed = self._changed, asyncio.Event()
+		changed.set()
+
+	def to_dict(self, with_result: bool = True) -> Dict[str, Any]:
+		data: Dict[str, Any] = {"id": self.id, "filename": self.filename, "status": self.status, "created": self.created, "finished": self.finished}
+		if self.error is not None:
+			data["error"] = self.error
+		if with_result and self.result is not None:
+			data["result"] = self.result
+		return data
+
+	async def watch(self) -> AsyncIterator[Dict[str, Any]]:
+		"""Status events as they happen (history first); ends after a terminal status."""
+		seen = 0
+		while True:
+			changed = self._changed
+			while seen < len(self.events):
+				yield self.events[seen]
+				seen += 1
+			if self.status in TERMINAL:
+				return
+			await changed.wait()
+
+
+class JobService:
+	"""Two-stage asyncio pipeline around the runner with a bounded intake queue.
+
+	Submitted jobs wait in a queue of `queue_size` (submit raises QueueFull when it
+	is full). `cpu_workers` prepare documents (render, OCR, classify, context) in a
+	process pool, `llm_workers` threads extract, score and validate them. A small
+	hand-off queue between the stages keeps OCR from running far ahead of the LLM,
+	and one slow scan only occupies one CPU worker.
+	"""
+
+	def __init__(self, cpu_workers: int = 2, llm_workers: int = 4, queue_size: int = 64, use_processes: bool = True, cache: Optional[ResultCache] = None, keep_finished: int = 1000, warm: bool = False):
+		self.cpu_workers = max(1, cpu_workers)
+		self.llm_workers = max(1, llm_workers)
+		self.queue_size = queue_size
+		self.use_processes = use_processes
+		self.cache = cache
+		self.keep_finished = keep_finished
+		self.warm = warm
+		self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+		self._intake: Optional[asyncio.Queue] = None
+		# Jobs waiting in the intake queue; cancelled ones free their slot right away
+		self._waiting = 0
+		self._handoff: Optional[asyncio.Queue] = None
+		self._cpu_pool: Optional[Executor] = None
+		self._io_pool: Optional[Executor] = None
+		self._tasks: List[asyncio.Task] = []
+		self._stopping = False
+
+	async def start(self) -> None:
+		self._intake = asyncio.Queue()
+		self._handoff = asyncio.Queue(maxsize=self.llm_workers * 2)
+		if self.use_processes:
+			self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_workers, initializer=_init_cpu_worker, initargs=(self.warm, self.cache.path if self.cache else None, self.cache.max_bytes if self.cache else 0))
+		else:
+			self._cpu_pool = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="prepare")
+		self._io_pool = ThreadPoolExecutor(max_workers=self.llm_workers, thread_name_prefix="extract")
+		if self.warm:
+			await asyncio.get_running_loop().run_in_executor(self._io_pool, warm_up, ("llm",))
+		self._tasks = [asyncio.create_task(self._prepare_loop()) for _ in range(self.cpu_workers)]
+		self._tasks += [asyncio.create_task(self._extract_loop()) for _ in range(self.llm_workers)]
+
+	async def stop(self) -> None:
+		self._stopping = True
+		for task in self._tasks:
+			task.cancel()
+		await asyncio.gather(*self._tasks, return_exceptions=True)
+		for pool in (self._cpu_pool, self._io_pool):
+			if pool is not None:
+				pool.shutdown(wait=False, cancel_futures=True)
+
+	def submit(self, file_bytes: bytes, filename: str, requested_fields: Optional[List[str]], options: ProcessOptions) -> Job:
+		if self._waiting >= self.queue_size:
+			raise QueueFull(f"{self.queue_size} jobs already queued")
+		job = Job(uuid.uuid4().hex, filename, requested_fields, options, file_bytes=file_bytes)
+		self._intake.put_nowait(job)
+		self._waiting += 1
+		self.jobs[job.id] = job
+		job.set_status("queued")
+		self._prune()
+		return job
+
+	def get(self, job_id: str) -> Optional[Job]:
+		return self.jobs.get(job_id)
+
+	def cancel(self, job_id: str) -> bool:
+		"""Cancel a job that has not finished; a stage already running in a worker is abandoned."""
+		job = self.jobs.get(job_id)
+		if job is None or job.status in TERMINAL:
+			return False
+		if job.status == "queued":
+			self._waiting -= 1
+		job.file_bytes = None
+		job.set_status("cancelled")
+		if job._future is not None:
+			job._future.cancel()
+		return True
+
+	def stats(self) -> Dict[str, Any]:
+		counts: Dict[str, int] = {}
+		for job in self.jobs.values():
+			counts[job.status] = counts.get(job.status, 0) + 1
+		return {
+			"queued": self._waiting,
+			"queue_size": self.queue_size,
+			"waiting_for_llm": self._handoff.qsize() if self._handoff else 0,
+			"cpu_workers": self.cpu_workers,
+			"llm_workers": self.llm_workers,
+			"jobs": counts,
+		}
+
+	def _prune(self) -> None:
+		finished = [job_id for job_id, job in self.jobs.items() if job.status in TERMINAL]
+		for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+			del self.jobs[job_id]
+
+	async def _run_stage(self, job: Job, pool: Executor, fn: Callable[..., Any], *args: Any) -> Any:
+		job._future = asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+		try:
+			return await job._future
+		finally:
+			job._future = None
+
+	async def _prepare_loop(self) -> None:
+		while True:
+			job = await self._intake.get()
+			if job.status == "cancelled":
+				continue
+			self._waiting -= 1
+			job.set_status("preparing")
+			if self.use_processes:
+				prepare = _prepare_in_worker
+			else:
+				prepare = partial(prepare_document, cache=self.cache)
+			try:
+				state = await self._run_stage(job, self._cpu_pool, prepare, job.file_bytes, job.filename, job.requested_fields, job.options)
+			except asyncio.CancelledError:
+				if self._stopping or job.status != "cancelled":
+					raise
+				continue
+			except Exception as exc:
+				self._fail(job, exc)
+				continue
+			job.file_bytes = None
+			if job.status == "cancelled":
+				continue
+			# Blocks while the LLM stage is behind, which in turn fills the intake queue
+			await self._handoff.put((job, state))
+
+	async def _extract_loop(self) -> None:
+		while True:
+			job, state = await self._handoff.get()
+			if job.status == "cancelled":
+				continue
+			job.set_status("extracting", doc_type=state["doc_type"])
+			try:
+				result = await self._run_stage(job, self._io_pool, complete_document, state, job.requested_fields, job.options, self.cache)
+			except asyncio.CancelledError:
+				if self._stopping or job.status != "cancelled":
+					raise
+				continue
+			except Exception as exc:
+				self._fail(job, exc)
+				continue
+			if job.status == "cancelled":
+				continue
+			job.result = result
+			job.set_status("done")
+			self._prune()
+
+	def _fail(self, job: Job, exc: BaseException) -> None:
+		if job.status == "cancelled":
+			return
+		job.error = f"{type(exc).__name__}: {exc}"
+		job.file_bytes = None
+		job.set_status("failed", error=job.error)
+		self._prune()
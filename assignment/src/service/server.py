@@ -0,0 +1,183 @@
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, fields, replace
+from urllib.parse import parse_qs, urlsplit
+import asyncio
+import json
+
+from ..agent.runner import EXTRACTORS, ProcessOptions
+from ..ingest.backends import backend_names
+from .jobs import JobService, QueueFull
+
+
+_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 503: "Service Unavailable"}
+# ProcessOptions fields a client may set per job from the query string; the rest (model,
+# ocr_workers, context budget, ...) stay as the server was configured
+QUERY_OPTIONS: Dict[str, type] = {
+	"num_votes": int, "temperature": float, "early_exit": bool, "dpi": int, "use_text_layer": bool,
+	"ocr_backend": str, "prefill_rules": bool, "tiered": bool, "extractor": str,
+	"split_sections": bool,
+}
+
+
+@dataclass
+class QueryLimits:
+	"""Server-side bounds for the options clients set per job; numbers outside are clamped."""
+	max_votes: int = 5
+	min_dpi: int = 72
+	max_dpi: int = 400
+	max_temperature: float = 1.5
+
+
+def options_from_query(base: ProcessOptions, query: Dict[str, List[str]], limits: Optional[QueryLimits] = None) -> ProcessOptions:
+	"""Copy of base with the QUERY_OPTIONS fields taken from the query, clamped to limits.
+
+	Raises ValueError for other ProcessOptions fields, unparsable values and unknown
+	OCR backends or extractors (the server answers 400).
+	"""
+	limits = limits or QueryLimits()
+	locked = sorted(f.name for f in fields(ProcessOptions) if f.name in query and f.name not in QUERY_OPTIONS)
+	if locked:
+		raise ValueError(f"Options not settable per job: {', '.join(locked)}")
+	overrides: Dict[str, Any] = {}
+	for name, kind in QUERY_OPTIONS.items():
+		if name not in query:
+			continue
+		raw = query[name][-1]
+		try:
+			overrides[name] = raw.lower() in ("1", "true", "yes", "on") if kind is bool else kind(raw)
+		except ValueError:
+			raise ValueError(f"Invalid {name}: {raw!r}") from None
+	if "num_votes" in overrides:
+		overrides["num_votes"] = min(max(overrides["num_votes"], 1), limits.max_votes)
+	if "dpi" in overrides:
+		overrides["dpi"] = min(max(overrides["dpi"], limits.min_dpi), limits.max_dpi)
+	if "temperature" in overrides:
+		overrides["temperature"] = min(max(overrides["temperature"], 0.0), limits.max_temperature)
+	backend = overrides.get("ocr_backend")
+	if backend is not None and backend != "auto" and backend not in backend_names():
+		raise ValueError(f"Unknown OCR backend: {backend!r}")
+	if overrides.get("extractor", EXTRACTORS[0]) not in EXTRACTORS:
+		raise ValueError(f"Unknown extractor: {overrides['extractor']!r}")
+	return replace(base, **overrides)
+
+
+class ExtractionServer:
+	"""Minimal asyncio HTTP/1.1 front end for a JobService.
+
+	POST   /jobs?filename=x.pdf&fields=A,B   raw document body -> 202 {"id", "status"}
+	GET    /jobs/<id>                        status, plus the result once done
+	GET    /jobs/<id>/events                 NDJSON status events until the job ends
+	DELETE /jobs/<id>                        cancel
+	GET    /health                           queue and worker stats
+
+	A full queue answers 503 with Retry-After, so clients back off instead of piling up.
+	Per-job options are limited to QUERY_OPTIONS and clamped to `limits`.
+	"""
+
+	def __init__(self, service: JobService, options: Optional[ProcessOptions] = None, max_upload_bytes: int = 50 * 1024 * 1024, retry_after: int = 2, limits: Optional[QueryLimits] = None):
+		self.service = service
+		self.options = options or ProcessOptions()
+		self.limits = limits or QueryLimits()
+		self.max_upload_bytes = max_upload_bytes
+		self.retry_after = retry_after
+
+	async def serve(self, host: str = "127.0.0.1", port: int = 8080) -> asyncio.AbstractServer:
+		return await asyncio.start_server(self._handle, host, port)
+
+	async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+		try:
+			request = await self._read_request(reader)
+			if request is None:
+				return
+			if isinstance(request, int):
+				await self._send_json(writer, request, {"error": _REASONS[request]})
+				return
+			await self._route(writer, *request)
+		except (ConnectionError, asyncio.IncompleteReadError):
+			pass
+		finally:
+			writer.close()
+
+	async def _read_request(self, reader: asyncio.StreamReader) -> Any:
+		line = await reader.readline()
+		if not line:
+			return None
+		parts = line.decode("latin-1").split()
+		if len(parts) != 3:
+			return 400
+		method, target, _ = parts
+		headers: Dict[str, str] = {}
+		while True:
+			header = await reader.readline()
+			if header in (b"\r\n", b"\n", b""):
+				break
+			name, _, value = header.decode("latin-1").partition(":")
+			headers[name.strip().lower()] = value.strip()
+		try:
+			length = int(headers.get("content-length") or 0)
+		except ValueError:
+			return 400
+		if length > self.max_upload_bytes:
+			return 413
+		body = await reader.readexactly(length) if length else b""
+		url = urlsplit(target)
+		return method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query), headers, body
+
+	async def _route(self, writer: asyncio.StreamWriter, method: str, path: str, query: Dict[str, List[str]], headers: Dict[str, str], body: bytes) -> None:
+		parts = path.strip("/").split("/")
+		if parts == ["health"] and method == "GET":
+			await self._send_json(writer, 200, self.service.stats())
+		elif parts == ["jobs"] and method == "POST":
+			await self._submit(writer, query, headers, body)
+		elif len(parts) in (2, 3) and parts[0] == "jobs":
+			job = self.service.get(parts[1])
+			if job is None:
+				await self._send_json(writer, 404, {"error": f"No job {parts[1]}"})
+			elif len(parts) == 3 and parts[2] == "events" and method == "GET":
+				await self._stream_events(writer, job)
+			elif len(parts) == 2 and method == "GET":
+				await self._send_json(writer, 200, job.to_dict())
+			elif len(parts) == 2 and method == "DELETE":
+				if self.service.cancel(job.id):
+					await self._send_json(writer, 200, job.to_dict(with_result=False))
+				else:
+					await self._send_json(writer, 409, {"error": f"Job already {job.status}"})
+			else:
+				await self._send_json(writer, 405, {"error": _REASONS[405]})
+		else:
+			await self._send_json(writer, 404, {"error": _REASONS[404]})
+
+	async def _submit(self, writer: asyncio.StreamWriter, query: Dict[str, List[str]], headers: Dict[str, str], body: bytes) -> None:
+		filename = (query.get("filename") or [headers.get("x-filename", "")])[-1]
+		if not body or not filename:
+			await self._send_json(writer, 400, {"error": "A document body and a filename are required"})
+			return
+		requested_fields = [f.strip() for f in (query.get("fields") or [""])[-1].split(",") if f.strip()] or None
+		try:
+			options = options_from_query(self.options, query, self.limits)
+		except ValueError as exc:
+			await self._send_json(writer, 400, {"error": str(exc)})
+			return
+		try:
+			job = self.service.submit(body, filename, requested_fields, options)
+		except QueueFull as exc:
+			await self._send_json(writer, 503, {"error": str(exc)}, extra_headers=[("Retry-After", str(self.retry_after))])
+			return
+		await self._send_json(writer, 202, job.to_dict(with_result=False), extra_headers=[("Location", f"/jobs/{job.id}")])
+
+	async def _stream_events(self, writer: asyncio.StreamWriter, job: Any) -> None:
+		# Length-less body delimited by closing the connection, one JSON event per line
+		writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n")
+		await writer.drain()
+		async for event in job.watch():
+			if event["status"] == "done":
+				event = {**event, "result": job.result}
+			writer.write(json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n")
+			await writer.drain()
+
+	async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Any, extra_headers: Optional[List[Tuple[str, str]]] = None) -> None:
+		body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+		head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", "Content-Type: application/json", f"Content-Length: {len(body)}", "Connection: close"]
+		head += [f"{name}: {value}" for name, value in extra_headers or []]
+		writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+		await writer.drain()
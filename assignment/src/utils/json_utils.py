@@ -32,6 +32,23 @@ def vote_fraction(values: List[str], winner: str) -> float:
 	return agree / n
 
 
+def majority_settled(votes: List[Dict[str, str]], remaining: int) -> bool:
+	"""True when `remaining` further votes cannot change the winner of any field seen so far."""
+	names = {k for v in votes for k in v.keys()}
+	for name in names:
+		counts: Dict[str, int] = {}
+		for v in votes:
+			if name in v:
+				counts[v[name]] = counts.get(v[name], 0) + 1
+		ranked = sorted(counts.values(), reverse=True)
+		lead = ranked[0]
+		second = ranked[1] if len(ranked) > 1 else 0
+		# A tie is broken by value length, so the lead must be strictly out of reach
+		if lead - second <= remaining:
+			return False
+	return True
+
+
 def fuzzy_contains(haystack: str, needle: str, threshold: int = 80) -> bool:
 	if not needle or not haystack:
 		return False
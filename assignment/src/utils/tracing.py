@@ -0,0 +1,209 @@
+from typing import Any, Dict, List, Optional
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+import json
+import logging
+import os
+import threading
+import time
+
+
+class Span:
+	__slots__ = ("name", "parent", "start", "end", "attrs", "_tracer", "_token")
+
+	def __init__(self, tracer: "Tracer", name: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+		self._tracer = tracer
+		self.name = name
+		self.parent = parent
+		self.attrs = attrs
+		self.start = 0.0
+		self.end = 0.0
+		self._token = None
+
+	def set(self, **attrs: Any) -> None:
+		self.attrs.update(attrs)
+
+	@property
+	def duration_ms(self) -> float:
+		return (self.end - self.start) * 1000.0
+
+	def __enter__(self) -> "Span":
+		self.start = time.perf_counter()
+		self._token = _current_span.set(self)
+		return self
+
+	def __exit__(self, exc_type, exc, tb) -> None:
+		self.end = time.perf_counter()
+		_current_span.reset(self._token)
+		if exc_type is not None:
+			self.attrs["error"] = exc_type.__name__
+		self._tracer._record(self)
+
+
+class _NullSpan:
+	"""Shared no-op span so disabled tracing allocates nothing per stage."""
+
+	name = ""
+	attrs: Dict[str, Any] = {}
+
+	def set(self, **attrs: Any) -> None:
+		pass
+
+	def __enter__(self) -> "_NullSpan":
+		return self
+
+	def __exit__(self, exc_type, exc, tb) -> None:
+		pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+	"""Collects timed spans for one document and exports them to the configured sinks."""
+
+	enabled = True
+
+	def __init__(self, sinks: Optional[List["TraceSink"]] = None):
+		self.sinks = sinks or []
+		self.origin = time.perf_counter()
+		self.spans: List[Span] = []
+		self._lock = threading.Lock()
+
+	def span(self, name: str, **attrs: Any) -> Span:
+		parent = _current_span.get()
+		return Span(self, name, parent if isinstance(parent, Span) else None, attrs)
+
+	def _record(self, span: Span) -> None:
+		with self._lock:
+			self.spans.append(span)
+
+	def to_dict(self) -> Dict[str, Any]:
+		with self._lock:
+			spans = sorted(self.spans, key=lambda s: s.start)
+		index = {id(s): i for i, s in enumerate(spans)}
+		end = max((s.end for s in spans), default=self.origin)
+		return {
+			"total_ms": (end - self.origin) * 1000.0,
+			"spans": [
+				{
+					"name": s.name,
+					"parent": index.get(id(s.parent)) if s.parent is not None else None,
+					"start_ms": (s.start - self.origin) * 1000.0,
+					"duration_ms": s.duration_ms,
+					**s.attrs,
+				}
+				for s in spans
+			],
+		}
+
+	def export(self) -> None:
+		for sink in self.sinks:
+			sink.export(self)
+
+
+class NullTracer:
+	enabled = False
+	sinks: List["TraceSink"] = []
+
+	def span(self, name: str, **attrs: Any) -> _NullSpan:
+		return NULL_SPAN
+
+	def to_dict(self) -> Optional[Dict[str, Any]]:
+		return None
+
+	def export(self) -> None:
+		pass
+
+
+NULL_TRACER = NullTracer()
+
+_current_tracer: ContextVar[Any] = ContextVar("docuhelp_tracer", default=NULL_TRACER)
+_current_span: ContextVar[Any] = ContextVar("docuhelp_span", default=NULL_SPAN)
+
+
+def get_tracer() -> Any:
+	return _current_tracer.get()
+
+
+def current_span() -> Any:
+	"""Innermost open span in this context (a no-op span when tracing is off)."""
+	return _current_span.get()
+
+
+def use_tracer(tracer: Any):
+	"""Make `tracer` current; returns a token for reset_tracer."""
+	return _current_tracer.set(tracer)
+
+
+def reset_tracer(token) -> None:
+	_current_tracer.reset(token)
+
+
+class TraceSink(ABC):
+	@abstractmethod
+	def export(self, tracer: Tracer) -> None:
+		"""Send one document's spans somewhere (called once, after the document finishes)."""
+
+
+class LogSink(TraceSink):
+	def __init__(self, logger_name: str = "docuhelp.trace", level: int = logging.INFO):
+		self.logger = logging.getLogger(logger_name)
+		self.level = level
+
+	def export(self, tracer: Tracer) -> None:
+		data = tracer.to_dict()
+		for span in data["spans"]:
+			attrs = {k: v for k, v in span.items() if k not in ("name", "parent", "start_ms", "duration_ms")}
+			self.logger.log(self.level, "%s +%.1fms %.1fms %s", span["name"], span["start_ms"], span["duration_ms"], attrs)
+
+
+class JsonFileSink(TraceSink):
+	"""Appends one JSON document per traced document."""
+
+	def __init__(self, path: str):
+		self.path = path
+		self._lock = threading.Lock()
+
+	def export(self, tracer: Tracer) -> None:
+		line = json.dumps(tracer.to_dict(), default=str)
+		with self._lock, open(self.path, "a", encoding="utf-8") as fh:
+			fh.write(line + "\n")
+
+
+class OpenTelemetrySink(TraceSink):
+	"""Replays spans into the OpenTelemetry API (requires opentelemetry-api)."""
+
+	def __init__(self, service_name: str = "docuhelp"):
+		from opentelemetry import trace
+
+		self._trace = trace
+		self._otel_tracer = trace.get_tracer(service_name)
+
+	def export(self, tracer: Tracer) -> None:
+		# Map perf_counter offsets onto wall-clock nanoseconds
+		wall_origin_ns = time.time_ns() - int((time.perf_counter() - tracer.origin) * 1e9)
+		data = tracer.to_dict()
+		created = []
+		for span in data["spans"]:
+			parent = created[span["parent"]] if span["parent"] is not None else None
+			context = self._trace.set_span_in_context(parent) if parent is not None else None
+			start_ns = wall_origin_ns + int(span["start_ms"] * 1e6)
+			attrs = {k: v for k, v in span.items() if k not in ("name", "parent", "start_ms", "duration_ms") and isinstance(v, (str, int, float, bool))}
+			otel_span = self._otel_tracer.start_span(span["name"], context=context, start_time=start_ns, attributes=attrs)
+			otel_span.end(end_time=start_ns + int(span["duration_ms"] * 1e6))
+			created.append(otel_span)
+
+
+def sinks_from_env() -> List[TraceSink]:
+	"""Parse TRACE_SINKS, e.g. "log", "json:outputs/traces.jsonl", "otel" (comma-separated)."""
+	sinks: List[TraceSink] = []
+	for item in (os.getenv("TRACE_SINKS") or "").split(","):
+		kind, _, arg = item.strip().partition(":")
+		if kind == "log":
+			sinks.append(LogSink())
+		elif kind == "json":
+			sinks.append(JsonFileSink(arg or "traces.jsonl"))
+		elif kind == "otel":
+			sinks.append(OpenTelemetrySink())
+	return sinks
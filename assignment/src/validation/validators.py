@@ -1,80 +1,260 @@
-from typing import Dict, Any, List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+from functools import lru_cache
+import calendar
 import re
-from datetime import datetime
 
-AMOUNT_RE = re.compile(r"[\$₹]?\s?([0-9]{1,3}(?:,[0-9]{3})*|[0-9]+)(?:\.[0-9]{1,2})?")
-DATE_RES = [
-	re.compile(r"\b(\d{4})[-/](\d{1,2})[-/](\d{1,2})\b"),
-	re.compile(r"\b(\d{1,2})[-/](\d{1,2})[-/](\d{2,4})\b"),
+# Group 1 is the number: thousands- or lakh-grouped (2,00,000) or plain digits, optional 1-2 decimals
+AMOUNT_RE = re.compile(r"[\$₹]?\s?((?:\d{1,3}(?:,\d{3})+|\d{1,3}(?:,\d{2})+,\d{3}|\d+)(?:\.\d{1,2})?)")
+# Cheap first pass for whole texts; only digit runs with commas need AMOUNT_RE's grouping rules
+_NUMBER_SCAN_RE = re.compile(r"\d+(?:,\d+)*(?:\.\d{1,2})?")
+# The lookahead lets the scan skip positions that cannot start a marker
+CURRENCY_RE = re.compile(r"(?<![a-z])(?=[usrmieg\$₹€£])(us\$|s\$|rm|myr|usd|sgd|inr|eur|gbp|rs\.?|[\$₹€£])(?![a-z])", re.IGNORECASE)
+# Currency marker (lower-cased) -> ISO code
+CURRENCY_CODES = {
+	"rm": "MYR", "myr": "MYR", "us$": "USD", "usd": "USD", "$": "USD", "s$": "SGD", "sgd": "SGD",
+	"inr": "INR", "rs": "INR", "rs.": "INR", "₹": "INR", "eur": "EUR", "€": "EUR", "gbp": "GBP", "£": "GBP",
+}
+_MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+_MONTH = r"(" + "|".join(_MONTHS) + r")[a-z]*\.?"
+
+
+@dataclass(frozen=True)
+class DateFormat:
+	"""A date layout: one compiled pattern and the (year, month, day) group orders to try, in order."""
+	pattern: "re.Pattern[str]"
+	orders: Tuple[str, ...]
+
+
+# Tried in order; the first layout whose first match reads as a real calendar date wins
+DATE_FORMATS = [
+	DateFormat(re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b"), ("ymd",)),
+	DateFormat(re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4}|\d{2})\b"), ("dmy", "mdy")),
+	DateFormat(re.compile(r"\b(\d{1,2})\s+" + _MONTH + r",?\s+(\d{4}|\d{2})\b", re.IGNORECASE), ("dmy",)),
+	DateFormat(re.compile(r"\b" + _MONTH + r"\s+(\d{1,2}),?\s+(\d{4}|\d{2})\b", re.IGNORECASE), ("mdy",)),
 ]
 
 
-def parse_amount(text: str) -> float:
-	match = AMOUNT_RE.search(text or "")
-	if not match:
-		return 0.0
-	val = match.group(0)
-	val = val.replace("₹", "").replace("$", "").replace(",", "").strip()
-	try:
-		return float(val)
-	except Exception:
-		return 0.0
+def _calendar_date(year: str, month: str, day: str) -> Optional[str]:
+	"""ISO date when the parts name a real day, else None (two-digit years as strptime's %y)."""
+	y = int(year)
+	if len(year) == 2:
+		y += 2000 if y < 69 else 1900
+	m = _MONTHS.index(month[:3].lower()) + 1 if month[:1].isalpha() else int(month)
+	d = int(day)
+	if y < 1 or not 1 <= m <= 12 or not 1 <= d <= calendar.monthrange(y, m)[1]:
+		return None
+	return f"{y:04d}-{m:02d}-{d:02d}"
 
 
-def is_valid_date(text: str) -> bool:
+@lru_cache(maxsize=4096)
+def parse_date(text: str) -> Optional[str]:
+	"""First date in text as YYYY-MM-DD (day-first before month-first), or None."""
 	if not text:
-		return False
-	candidates = ["%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y", "%d/%m/%Y", "%m-%d-%Y", "%m/%d/%Y", "%d-%m-%y", "%m-%d-%y", "%d/%m/%y", "%m/%d/%y"]
-	for fmt in candidates:
-		try:
-			datetime.strptime(text.strip(), fmt)
-			return True
-		except Exception:
+		return None
+	for fmt in DATE_FORMATS:
+		match = fmt.pattern.search(text)
+		if match is None:
 			continue
-	# As a fallback, attempt regex extraction and re-parse
-	for rx in DATE_RES:
-		m = rx.search(text)
-		if m:
-			parts = m.groups()
-			joined = "-".join(parts)
-			for fmt in ["%Y-%m-%d", "%d-%m-%Y", "%m-%d-%Y", "%d-%m-%y", "%m-%d-%y"]:
-				try:
-					datetime.strptime(joined, fmt)
-					return True
-				except Exception:
-					continue
-	return False
+		for order in fmt.orders:
+			parts = dict(zip(order, match.groups()))
+			iso = _calendar_date(parts["y"], parts["m"], parts["d"])
+			if iso is not None:
+				return iso
+	return None
 
 
-def totals_match_rule(text: str, fields: Dict[str, Any]) -> Tuple[bool, str]:
-	# Try to find line item amounts from text if line items not provided
+def is_valid_date(text: str) -> bool:
+	return parse_date(text) is not None
+
+
+def parse_amount(text: str) -> float:
+	match = AMOUNT_RE.search(text or "")
+	return float(match.group(1).replace(",", "")) if match else 0.0
+
+
+def amount_candidates(text: str) -> List[float]:
+	"""Every amount in the text, in order (the numbers AMOUNT_RE.findall would give)."""
+	amounts: List[float] = []
+	for token in _NUMBER_SCAN_RE.findall(text or ""):
+		if "," in token:
+			amounts.extend(float(value.replace(",", "")) for value in AMOUNT_RE.findall(token))
+		else:
+			amounts.append(float(token))
+	return amounts
+
+
+def parse_currency(text: str) -> Optional[str]:
+	match = CURRENCY_RE.search(text or "")
+	return CURRENCY_CODES[match.group(1).lower()] if match else None
+
+
+@lru_cache(maxsize=1024)
+def field_kind(field_name: str) -> Optional[str]:
+	""""date", "amount" or None, from the field name."""
+	fname = field_name.lower()
+	if any(k in fname for k in ["date", "issued", "invoice date"]):
+		return "date"
+	if any(k in fname for k in ["amount", "total", "subtotal", "tax", "balance"]):
+		return "amount"
+	return None
+
+
+def normalize_field(field_name: str, value: str) -> Optional[Any]:
+	"""ISO date or float amount for date / amount fields (None when unreadable), value as is otherwise."""
+	kind = field_kind(field_name)
+	if kind == "date":
+		return parse_date(value)
+	if kind == "amount":
+		amount = parse_amount(value)
+		return amount if amount > 0.0 else None
+	return value
+
+
+def field_level_validations(field_name: str, value: str) -> bool:
+	return field_kind(field_name) is None or normalize_field(field_name, value) is not None
+
+
+class DocumentValues:
+	"""What the validation rules read for one document.
+
+	Amount fields are parsed once each and the amounts in the text are found in a
+	single scan, on first use, then shared by every rule.
+	"""
+
+	def __init__(self, doc_type: str, text: str, fields: Dict[str, Any]):
+		self.doc_type = doc_type
+		self.text = text or ""
+		self.fields = fields
+		self._amounts: Optional[List[float]] = None
+		self._parsed: Dict[str, float] = {}
+
+	@property
+	def amounts(self) -> List[float]:
+		if self._amounts is None:
+			self._amounts = amount_candidates(self.text)
+		return self._amounts
+
+	def amount(self, *names: str) -> float:
+		"""Parsed value of the first of `names` that is set (0.0 when none is)."""
+		name = next((n for n in names if self.fields.get(n)), names[0])
+		if name not in self._parsed:
+			self._parsed[name] = parse_amount(str(self.fields.get(name)))
+		return self._parsed[name]
+
+
+@dataclass
+class RuleResult:
+	passed: bool
+	message: str
+	# Normalized values the rule read or derived, e.g. {"TotalAmount": 12.5, "Currency": "MYR"}
+	values: Dict[str, Any] = field(default_factory=dict)
+
+
+# None when the rule does not apply to the document
+ValidationRule = Callable[[DocumentValues], Optional[RuleResult]]
+
+TOTAL_FIELDS = ("TotalAmount", "Total", "AmountDue")
+# Standard tax rates (percent) a computed rate snaps to
+TAX_RATES = (0.0, 5.0, 6.0, 7.0, 8.0, 9.0, 10.0, 12.0, 15.0, 18.0, 20.0, 28.0)
+MAX_TAX_RATE = 30.0
+LINE_ITEM_AMOUNT_KEYS = ("amount", "total", "line_total", "price")
+
+
+def _totals_match(doc: DocumentValues) -> RuleResult:
 	# Fallback: if Subtotal and Tax available, check Total ≈ Subtotal + Tax
-	total_text = fields.get("TotalAmount") or fields.get("Total") or fields.get("AmountDue")
-	subtotal_text = fields.get("Subtotal")
-	tax_text = fields.get("Tax")
-	total = parse_amount(str(total_text))
-	subtotal = parse_amount(str(subtotal_text))
-	tax = parse_amount(str(tax_text))
+	total = doc.amount(*TOTAL_FIELDS)
+	subtotal = doc.amount("Subtotal")
+	tax = doc.amount("Tax")
 	if total == 0.0:
-		return False, "Missing or zero total"
+		return RuleResult(False, "Missing or zero total")
+	values = {"TotalAmount": total}
 	if subtotal > 0.0 and tax >= 0.0:
+		values.update(Subtotal=subtotal, Tax=tax)
 		if abs((subtotal + tax) - total) <= max(0.01 * total, 0.5):
-			return True, "Totals match"
-		return False, "Subtotal + Tax != Total"
+			return RuleResult(True, "Totals match", values)
+		return RuleResult(False, "Subtotal + Tax != Total", values)
 	# As a weak heuristic, sum top 3 amounts below total in the text
-	amounts = [parse_amount(m) for m in re.findall(AMOUNT_RE, text or "")]
-	amounts = [a for a in amounts if a > 0.0 and a <= total]
-	amounts.sort(reverse=True)
+	amounts = sorted((a for a in doc.amounts if 0.0 < a <= total), reverse=True)
 	approx = sum(amounts[:3])
 	if abs(approx - total) <= max(0.05 * total, 1.0):
-		return True, "Top amounts sum approx total"
-	return False, "No strong totals evidence"
+		return RuleResult(True, "Top amounts sum approx total", values)
+	return RuleResult(False, "No strong totals evidence", values)
 
 
-def field_level_validations(field_name: str, value: str) -> bool:
-	fname = field_name.lower()
-	if any(k in fname for k in ["date", "issued", "invoice date"]):
-		return is_valid_date(value)
-	if any(k in fname for k in ["amount", "total", "subtotal", "tax", "balance"]):
-		return parse_amount(value) > 0.0
-	return True 
\ No newline at end of file
+def _line_item_amount(item: Any) -> float:
+	if isinstance(item, dict):
+		item = next((item[k] for k in LINE_ITEM_AMOUNT_KEYS if item.get(k) not in (None, "")), "")
+	return float(item) if isinstance(item, (int, float)) else parse_amount(str(item))
+
+
+def _line_items_sum(doc: DocumentValues) -> Optional[RuleResult]:
+	items = doc.fields.get("LineItems")
+	if not isinstance(items, list) or not items:
+		return None
+	line_sum = round(sum(_line_item_amount(item) for item in items), 2)
+	target_name = "Subtotal" if doc.amount("Subtotal") > 0.0 else "TotalAmount"
+	target = doc.amount("Subtotal") if target_name == "Subtotal" else doc.amount(*TOTAL_FIELDS)
+	if target == 0.0:
+		return None
+	values = {"LineItemsTotal": line_sum, target_name: target}
+	if abs(line_sum - target) <= max(0.01 * target, 0.05):
+		return RuleResult(True, f"Line items sum to {target_name}", values)
+	return RuleResult(False, f"Line items sum {line_sum:.2f} != {target_name} {target:.2f}", values)
+
+
+def _tax_rate(doc: DocumentValues) -> Optional[RuleResult]:
+	subtotal, tax = doc.amount("Subtotal"), doc.amount("Tax")
+	if subtotal <= 0.0 or tax <= 0.0:
+		return None
+	rate = 100.0 * tax / subtotal
+	nearest = min(TAX_RATES, key=lambda r: abs(r - rate))
+	values = {"TaxRate": nearest if abs(nearest - rate) <= 0.5 else round(rate, 2)}
+	if rate > MAX_TAX_RATE:
+		return RuleResult(False, f"Tax is {rate:.1f}% of subtotal", values)
+	return RuleResult(True, f"Tax rate {values['TaxRate']}%", values)
+
+
+def _currency(doc: DocumentValues) -> Optional[RuleResult]:
+	# Currency named by the amount fields (or a Currency field); else the text's first marker
+	named: Dict[str, str] = {}
+	for name in TOTAL_FIELDS + ("Subtotal", "Tax", "Currency"):
+		code = parse_currency(str(doc.fields.get(name) or ""))
+		if code is not None:
+			named[name] = code
+	codes = set(named.values())
+	if len(codes) > 1:
+		return RuleResult(False, "Mixed currencies: " + ", ".join(sorted(codes)), {"Currency": named.get("Currency") or sorted(codes)[0]})
+	code = next(iter(codes), None) or parse_currency(doc.text)
+	if code is None:
+		return None
+	return RuleResult(True, f"Currency {code}", {"Currency": code})
+
+
+# Doc type ("*" for every doc type) -> {rule name: rule}, run in order; extend with
+# register_validation_rule
+VALIDATION_RULES: Dict[str, Dict[str, ValidationRule]] = {
+	"invoice": {"totals_match": _totals_match, "line_items_sum": _line_items_sum, "tax_rate": _tax_rate},
+	"*": {"currency": _currency},
+}
+
+
+def register_validation_rule(doc_type: str, name: str, rule: ValidationRule) -> None:
+	"""Add (or replace) a named document rule for a doc type ("*" for every doc type)."""
+	VALIDATION_RULES.setdefault(doc_type, {})[name] = rule
+
+
+def validate_document(doc_type: str, text: str, fields: Dict[str, Any]) -> Dict[str, RuleResult]:
+	"""Run the doc type's rules, then the common ones; rules that do not apply are left out."""
+	doc = DocumentValues(doc_type, text, fields)
+	results: Dict[str, RuleResult] = {}
+	for name, rule in list(VALIDATION_RULES.get(doc_type, {}).items()) + list(VALIDATION_RULES.get("*", {}).items()):
+		result = rule(doc)
+		if result is not None:
+			results[name] = result
+	return results
+
+
+def totals_match_rule(text: str, fields: Dict[str, Any]) -> Tuple[bool, str]:
+	result = _totals_match(DocumentValues("invoice", text, fields))
+	return result.passed, result.message
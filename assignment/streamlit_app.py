@@ -1,15 +1,41 @@
-import io
 import json
 import os
-from typing import List, Optional
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
 
 import streamlit as st
 from dotenv import load_dotenv
 
-from src.agent.runner import process_document
+from src.agent.incremental import IncrementalRunner
+from src.agent.runner import ProcessOptions, ingest_key, warm_up
+from src.cache.store import cache_from_env, make_key
+from src.extraction.context import DEFAULT_CONTEXT_TOKENS
+from src.ingest.backends import backend_names
+from src.ingest.options import PreprocessOptions
+from src.utils.tracing import Tracer, sinks_from_env
 
 load_dotenv()
 
+
+@st.cache_resource
+def get_result_cache():
+	return cache_from_env()
+
+
+@st.cache_resource
+def get_runner() -> IncrementalRunner:
+	# Ingested documents and prepared states outlive reruns and are shared by all sessions
+	return IncrementalRunner(cache=get_result_cache(), max_documents=int(os.getenv("APP_MAX_DOCUMENTS") or 16))
+
+
+@st.cache_resource
+def warm_backends():
+	# Once per server process, so reruns and the first upload skip the heavy imports
+	return warm_up()
+
+
 st.set_page_config(page_title="Document Extraction Agent", page_icon="🧾", layout="wide")
 
 st.title("🧾 Agentic Document Extraction")
@@ -17,10 +43,118 @@ st.title("🧾 Agentic Document Extraction")
 with st.sidebar:
 	st.header("Settings")
 	num_votes = st.slider("Self-consistency votes", min_value=1, max_value=5, value=3)
+	early_exit = st.checkbox("Stop voting once the majority is settled", value=False)
+	tiered = st.checkbox("Tiered extraction (LLM only for low-confidence fields)", value=False)
+	extractor = st.selectbox("Extractor", ["llm", "layoutlm"], help="layoutlm runs the bundled SROIE LayoutLM model locally on receipts/invoices (needs torch + transformers)")
+	prefill_rules = st.checkbox("Fill fields with rules first (LLM only for the rest)", value=False)
+	split_sections = st.checkbox("Also extract each section of a mixed PDF", value=False)
 	temperature = st.slider("LLM temperature", min_value=0.0, max_value=1.2, value=0.2, step=0.1)
 	model = st.text_input("OpenAI model", value=os.getenv("OPENAI_MODEL", "gpt-4o-mini"))
+	ocr_backend = st.selectbox("OCR backend", ["auto"] + backend_names(), help="auto picks the cheapest backend that can read the document")
+	context_tokens = st.number_input("Prompt token budget for OCR text (0 = full text)", min_value=0, value=DEFAULT_CONTEXT_TOKENS, step=250)
+	use_text_layer = st.checkbox("Use PDF text layer when available", value=True)
+	preprocess_images = st.checkbox("Preprocess scans before OCR (rescale, deskew, binarize, crop)", value=False)
+	ocr_workers = st.slider("OCR worker processes (PDF)", min_value=1, max_value=max(1, os.cpu_count() or 1), value=min(int(os.getenv("OCR_WORKERS") or 1), max(1, os.cpu_count() or 1)))
+
+	show_timings = st.checkbox("Show timing waterfall", value=False)
+
+	warm_backends()
+	result_cache = get_result_cache()
+	if result_cache is not None:
+		stats = result_cache.stats()
+		st.caption(f"Cache: {sum(stats['hits'].values())} hits / {sum(stats['misses'].values())} misses, {stats['entries']} entries")
+	runner = get_runner()
+	held = runner.stats()
+	st.caption(f"In memory: {held['documents']} ingested documents, {held['states']} prepared states")
+
+# Files processed at the same time; each also fans out its own LLM votes
+MAX_PARALLEL_FILES = 4
+
+
+def render_result(result: Dict[str, Any], show_timings: bool, key: str) -> None:
+	st.subheader("Detected Document Type")
+	st.info(result.get("doc_type", "unknown"))
+
+	st.subheader("Confidence Scores")
+	overall = result.get("overall_confidence", 0.0)
+	st.metric("Overall confidence", f"{overall:.2f}")
 
-uploaded = st.file_uploader("Upload a PDF or image", type=["pdf", "png", "jpg", "jpeg"])
+	fields = result.get("fields", [])
+	for fld in fields:
+		name = fld.get("name")
+		val = fld.get("value")
+		conf = float(fld.get("confidence", 0.0))
+		col1, col2 = st.columns([2, 5])
+		with col1:
+			st.caption(f"{name} ({fld['tier']})" if fld.get("tier") else name)
+			st.write(val)
+		with col2:
+			st.progress(min(max(conf, 0.0), 1.0), text=f"{conf:.2f}")
+
+	st.subheader("QA / Validation")
+	qa = result.get("qa", {})
+	passed = qa.get("passed_rules", [])
+	failed = qa.get("failed_rules", [])
+	notes = qa.get("notes", "")
+	st.success(f"Passed: {', '.join(passed) or 'None'}")
+	if failed:
+		st.error(f"Failed: {', '.join(failed)}")
+	if notes:
+		st.info(notes)
+	if qa.get("normalized"):
+		st.caption("Normalized: " + ", ".join(f"{k}={v}" for k, v in qa["normalized"].items()))
+
+	sections = result.get("sections") or []
+	if sections:
+		st.subheader("Sections")
+		for section in sections:
+			pages = section["pages"]
+			label = f"{section['doc_type']} (pages {pages[0]}-{pages[-1]})" if len(pages) > 1 else f"{section['doc_type']} (page {pages[0]})"
+			with st.expander(label):
+				st.metric("Overall confidence", f"{section.get('overall_confidence', 0.0):.2f}")
+				st.json({fld["name"]: fld["value"] for fld in section.get("fields", [])})
+
+	timings = result.get("timings")
+	if show_timings and timings:
+		import altair as alt
+		import pandas as pd
+
+		st.subheader("Timing Waterfall")
+		rows = [
+			{
+				"span": f"{i:02d} {sp['name']}" + (f" #{sp['vote']}" if "vote" in sp else ""),
+				"start_ms": sp["start_ms"],
+				"end_ms": sp["start_ms"] + sp["duration_ms"],
+				"duration_ms": round(sp["duration_ms"], 1),
+			}
+			for i, sp in enumerate(timings["spans"])
+		]
+		chart = alt.Chart(pd.DataFrame(rows)).mark_bar().encode(
+			x=alt.X("start_ms:Q", title="ms"),
+			x2="end_ms:Q",
+			y=alt.Y("span:N", sort=None, title=None),
+			tooltip=["span", "duration_ms"],
+		)
+		st.altair_chart(chart, use_container_width=True)
+		st.caption(f"Total: {timings['total_ms']:.0f} ms")
+
+	st.subheader("Raw JSON Output")
+	json_str = json.dumps(result, ensure_ascii=False, indent=2)
+	st.code(json_str, language="json")
+	st.download_button("Download JSON", data=json_str, file_name="extraction.json", mime="application/json", key=f"download-{key}")
+
+
+def render_partial(box: Any, partial: Dict[str, Any], votes_done: int, num_votes: int) -> None:
+	"""Fields as they stand after the votes received so far."""
+	lines = [f"**Votes received: {votes_done}/{num_votes}**"]
+	for name, value in partial.get("final", {}).items():
+		values = partial.get("votes", {}).get(name, [])
+		agree = sum(1 for v in values if v == value)
+		lines.append(f"- {name}: {value or '—'} ({agree}/{len(values)} agree)")
+	box.markdown("\n".join(lines))
+
+
+uploaded_files = st.file_uploader("Upload PDFs or images", type=["pdf", "png", "jpg", "jpeg"], accept_multiple_files=True)
 
 fields_text = st.text_area(
 	"Optional: Fields to extract (comma-separated)",
@@ -28,57 +162,91 @@ fields_text = st.text_area(
 	height=80,
 )
 
-if uploaded is not None:
-	st.write("File:", uploaded.name)
+if uploaded_files:
 	requested_fields: Optional[List[str]] = None
 	if fields_text.strip():
 		requested_fields = [f.strip() for f in fields_text.split(",") if f.strip()]
+	options = ProcessOptions(
+		num_votes=num_votes,
+		temperature=temperature,
+		model=model,
+		ocr_workers=ocr_workers,
+		use_text_layer=use_text_layer,
+		early_exit=early_exit,
+		preprocess=PreprocessOptions() if preprocess_images else None,
+		ocr_backend=ocr_backend,
+		context_tokens=int(context_tokens) or None,
+		prefill_rules=prefill_rules,
+		tiered=tiered,
+		extractor=extractor,
+		split_sections=split_sections,
+	)
+	# Last result per uploaded file (by ingest key) and the settings it was made with
+	results: Dict[str, Dict[str, Any]] = st.session_state.setdefault("results", {})
+	files = [(f.name, f.getvalue()) for f in uploaded_files]
+	doc_keys = [ingest_key(content, name, options) for name, content in files]
+	for key in [key for key in results if key not in doc_keys]:
+		del results[key]
+	settings = make_key(requested_fields, {k: v for k, v in asdict(options).items() if k != "ocr_workers"}, show_timings)
+
+	run_clicked = st.button("Run Extraction", type="primary")
+	views = st.tabs([name for name, _ in files]) if len(files) > 1 else [st.container()]
 
-	if st.button("Run Extraction", type="primary"):
-		with st.spinner("Processing..."):
+	if run_clicked:
+		# Files whose last result used these settings are shown as they are; the rest
+		# run concurrently, each reusing whatever stages earlier runs already did
+		todo = [i for i, key in enumerate(doc_keys) if results.get(key, {}).get("settings") != settings]
+		overall = st.progress(0.0, text=f"0/{len(todo)} documents")
+		events: "queue.Queue" = queue.Queue()
+		panes = {}
+		for i in todo:
+			with views[i]:
+				panes[i] = {"status": st.empty(), "progress": st.progress(0.0), "fields": st.empty(), "votes": 0}
+				panes[i]["status"].caption("Queued")
+
+		def run_one(i: int) -> None:
+			name, content = files[i]
+			trace_sinks = sinks_from_env()
+			tracer = Tracer(trace_sinks) if show_timings or trace_sinks else None
+			# Widgets are only touched from the script thread, so stages are reported through the queue
 			try:
-				content = uploaded.read()
-				result = process_document(
-					file_bytes=content,
-					filename=uploaded.name,
-					requested_fields=requested_fields,
-					num_votes=num_votes,
-					temperature=temperature,
-					model=model,
-				)
-				st.subheader("Detected Document Type")
-				st.info(result.get("doc_type", "unknown"))
-
-				st.subheader("Confidence Scores")
-				overall = result.get("overall_confidence", 0.0)
-				st.metric("Overall confidence", f"{overall:.2f}")
-
-				fields = result.get("fields", [])
-				for fld in fields:
-					name = fld.get("name")
-					val = fld.get("value")
-					conf = float(fld.get("confidence", 0.0))
-					col1, col2 = st.columns([2, 5])
-					with col1:
-						st.caption(name)
-						st.write(val)
-					with col2:
-						st.progress(min(max(conf, 0.0), 1.0), text=f"{conf:.2f}")
-
-				st.subheader("QA / Validation")
-				qa = result.get("qa", {})
-				passed = qa.get("passed_rules", [])
-				failed = qa.get("failed_rules", [])
-				notes = qa.get("notes", "")
-				st.success(f"Passed: {', '.join(passed) or 'None'}")
-				if failed:
-					st.error(f"Failed: {', '.join(failed)}")
-				if notes:
-					st.info(notes)
-
-				st.subheader("Raw JSON Output")
-				json_str = json.dumps(result, ensure_ascii=False, indent=2)
-				st.code(json_str, language="json")
-				st.download_button("Download JSON", data=json_str, file_name="extraction.json", mime="application/json")
+				runner.run(content, name, requested_fields, options, on_event=lambda stage, data: events.put((i, stage, data)), tracer=tracer)
 			except Exception as exc:
-				st.exception(exc) 
\ No newline at end of file
+				events.put((i, "error", {"error": f"{type(exc).__name__}: {exc}"}))
+
+		finished = 0
+		with ThreadPoolExecutor(max_workers=max(1, min(len(todo), MAX_PARALLEL_FILES)), thread_name_prefix="upload") as pool:
+			for i in todo:
+				pool.submit(run_one, i)
+			while finished < len(todo):
+				i, stage, data = events.get()
+				pane = panes[i]
+				if stage == "ingest":
+					pane["status"].caption("Reusing the ingested document" if data["cached"] else "Ingesting (render + OCR)...")
+					pane["progress"].progress(0.05 if not data["cached"] else 0.3)
+				elif stage == "prepare":
+					pane["status"].caption(f"{data['doc_type']}: extracting with {options.num_votes} vote(s)...")
+					pane["progress"].progress(0.3)
+				elif stage == "vote":
+					pane["votes"] += 1
+					pane["progress"].progress(0.3 + 0.7 * min(pane["votes"], options.num_votes) / max(1, options.num_votes))
+					render_partial(pane["fields"], data, pane["votes"], options.num_votes)
+				elif stage in ("done", "error"):
+					results[doc_keys[i]] = {"settings": settings, "result": data} if stage == "done" else {"settings": None, "error": data["error"]}
+					for widget in ("status", "progress", "fields"):
+						pane[widget].empty()
+					finished += 1
+					overall.progress(finished / len(todo), text=f"{finished}/{len(todo)} documents")
+		overall.empty()
+
+	for i, (name, _) in enumerate(files):
+		entry = results.get(doc_keys[i])
+		if entry is None:
+			continue
+		with views[i]:
+			if entry.get("error") is not None:
+				st.error(f"Failed: {entry['error']}")
+				continue
+			if entry["settings"] != settings:
+				st.caption("Settings changed since this result; click Run Extraction to update (only the affected stages rerun).")
+			render_result(entry["result"], show_timings, f"{i}-{doc_keys[i]}")